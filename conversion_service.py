@@ -0,0 +1,179 @@
+import contextlib
+import multiprocessing
+import queue
+import threading
+import traceback
+
+
+class _QueueWriter(object):
+    """ File-like object forwarding every complete line written to it as an event. """
+    def __init__(self, events, job_id):
+        self.events = events
+        self.job_id = job_id
+        self.buffer = ""
+
+    def write(self, text):
+        self.buffer += text
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.events.put({"job": self.job_id, "type": "line", "line": line + "\n"})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.events.put({"job": self.job_id, "type": "line", "line": self.buffer})
+            self.buffer = ""
+
+
+def _progress_sender(events, job_id):
+    def send(progress):
+        events.put({"job": job_id, "type": "progress", "progress": progress})
+    return send
+
+
+def _serve(jobs, events):
+    """ Worker process loop: runs conversion jobs until it receives None.
+
+    The conversion modules are imported once, when the worker starts, so every job runs with
+    pandas, numpy and duckdb already loaded.
+    """
+    import duckdb_to_motec_unified
+
+    events.put({"job": None, "type": "ready"})
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        job_id, kwargs = job
+        writer = _QueueWriter(events, job_id)
+        try:
+            with contextlib.redirect_stdout(writer), contextlib.redirect_stderr(writer):
+                duckdb_to_motec_unified.convert(progress=_progress_sender(events, job_id), **kwargs)
+            writer.flush()
+            events.put({"job": job_id, "type": "end", "returncode": 0})
+        except BaseException as e:
+            writer.flush()
+            events.put({"job": job_id, "type": "error", "error": str(e),
+                        "traceback": traceback.format_exc()})
+
+
+class ConversionService(object):
+    """ Runs conversions in a long lived worker process with its imports warm.
+
+    Jobs are sent over a queue as keyword arguments for duckdb_to_motec_unified.convert, and the
+    worker answers with events: 'line' for every line of output, 'progress' for the progress
+    events of the converter (see progress.Progress), then 'end' or 'error'. Jobs run one at a time,
+    in submission order.
+    """
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._jobs = None
+        self._events = None
+        self._listeners = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Starts the worker process in the background, if it isn't running already. """
+        with self._lock:
+            if self.is_alive():
+                return
+            self._jobs = self._context.Queue()
+            self._events = self._context.Queue()
+            self._process = self._context.Process(target=_serve, args=(self._jobs, self._events),
+                                                  daemon=True)
+            self._process.start()
+            threading.Thread(target=self._dispatch, args=(self._events, self._process),
+                             daemon=True).start()
+
+    def is_alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def stop(self):
+        """ Asks the worker to exit once the queued jobs are done. """
+        with self._lock:
+            if self.is_alive():
+                self._jobs.put(None)
+            self._process = None
+
+    def terminate(self):
+        """ Kills the worker, failing its queued jobs, e.g. to cancel the running one. """
+        with self._lock:
+            process, self._process = self._process, None
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join()
+
+    def submit(self, callback, **kwargs):
+        """ Queues a conversion, callback(event) is called from a background thread for each event.
+
+        Returns the job id.
+        """
+        self.start()
+        with self._lock:
+            job_id = self._next_id
+            self._next_id += 1
+            self._listeners[job_id] = callback
+            self._jobs.put((job_id, kwargs))
+        return job_id
+
+    def _dispatch(self, events, process):
+        while True:
+            try:
+                event = events.get(timeout=0.5)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                # The worker died: fail all the jobs still waiting for it
+                with self._lock:
+                    listeners, self._listeners = self._listeners, {}
+                for job_id, callback in listeners.items():
+                    callback({"job": job_id, "type": "error",
+                              "error": "conversion worker exited (code %s)" % process.exitcode})
+                return
+
+            callback = self._listeners.get(event["job"])
+            if event["type"] in ("end", "error"):
+                with self._lock:
+                    self._listeners.pop(event["job"], None)
+            if callback:
+                callback(event)
+
+
+class ConversionPool(object):
+    """ Warm ConversionServices to run several conversions at the same time, one per job.
+
+    Services are reused once their job ends, and killed to cancel a running job.
+    """
+    def __init__(self):
+        self._idle = []
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def run(self, callback, **kwargs):
+        """ Starts a conversion, see ConversionService.submit. Returns a function cancelling it. """
+        with self._lock:
+            service = self._idle.pop() if self._idle else ConversionService()
+            self._busy.add(service)
+
+        def on_event(event):
+            if event["type"] in ("end", "error"):
+                with self._lock:
+                    self._busy.discard(service)
+                    if service.is_alive():
+                        self._idle.append(service)
+            callback(event)
+
+        service.submit(on_event, **kwargs)
+        return service.terminate
+
+    def stop(self):
+        with self._lock:
+            idle, busy = self._idle, list(self._busy)
+            self._idle, self._busy = [], set()
+        for service in idle:
+            service.stop()
+        for service in busy:
+            service.terminate()
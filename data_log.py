@@ -1,5 +1,13 @@
-import cantools
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from decimate import MODES, fir, window_mean, window_minmax
+
+# Default size of the byte ranges a candump file is split into for parallel parsing
+CAN_SHARD_SIZE = 32 * 1024 * 1024
 
 class DataLog(object):
     """ Container for storing log data which contains a set of channels with time series data."""
@@ -37,21 +45,28 @@ class DataLog(object):
         """ Returns the duration of the log [s]. """
         return self.end() - self.start()
 
-    def resample(self, frequency):
+    def resample(self, frequency, progress=None, skip_channels=None, mode="latest"):
         """ Resamples all channels such that all messages occur at a fixed frequency.
 
-        See the resample method of the Channel class for more details.
+        See the resample method of the Channel class for more details, including mode. progress
+        is an optional callable, called with the number of resampled messages (rows) after each
+        channel. Channels named in skip_channels are left as they are.
         """
         start = self.start()
         end = self.end()
+        skip_channels = skip_channels or ()
         for channel_name in self.channels:
-            self.channels[channel_name].resample(start, end, frequency)
+            if channel_name not in skip_channels:
+                self.channels[channel_name].resample(start, end, frequency, mode)
+            if progress:
+                progress(rows=len(self.channels[channel_name].messages))
 
     def from_can_log(self, log_lines, can_db):
         """ Creates channels populated with messages from a candump file and can database.
 
         This will create a channel for each entry in the database that has messages present in the
-        log.
+        log. Frames are first binned by arbitration id and each signal is then decoded for all the
+        frames of that id at once, see decode_can_frames for details.
 
         log_lines: List, containing candump log lines (recorded with 'candump' with '-l')
         can_db: cantools.database
@@ -63,23 +78,62 @@ class DataLog(object):
         for msg in can_db.messages:
             known_ids.add(msg.frame_id)
 
-        for line in log_lines:
-            stamp, bus, id, data = self.__parse_can_log_line(line)
+        frames = bin_can_frames(log_lines, known_ids)
+        self.add_decoded_signals(decode_can_frames(frames, can_db))
 
-            if id not in known_ids:
-                continue
+    def from_can_file(self, filename, dbc_filename, max_workers=None, shard_size=CAN_SHARD_SIZE,
+                      progress=None):
+        """ Creates channels populated with messages from a candump file on disc and a DBC file.
 
-            db_msg = can_db.get_message_by_frame_id(id)
-            msg_decoded = can_db.decode_message(id, data)
+        The file is split into byte ranges aligned to line boundaries which are parsed and decoded
+        in a process pool, each worker loading the DBC once. The decoded signals of all shards are
+        then merged in timestamp order, so only one shard of raw text per worker is in memory at a
+        time.
 
-            for msg, signal in zip(msg_decoded.items(), db_msg.signals):
-                name = msg[0]
-                value = msg[1]
+        filename: String, path to a candump log (recorded with 'candump' with '-l')
+        dbc_filename: String, path to the DBC file
+        max_workers: Int, optional number of worker processes, 1 parses in this process
+        shard_size: Int, approximate size in bytes of each shard
+        progress: Callable, optional, called with the size in bytes of each decoded shard
+        """
+        self.clear()
 
-                if name in self.channels:
-                    self.channels[name].messages.append(Message(stamp, value))
-                else:
-                    self.add_channel(name, signal.unit, float, 3, Message(stamp, value))
+        shards = can_log_shards(filename, shard_size)
+        if max_workers == 1 or len(shards) <= 1:
+            _init_can_worker(dbc_filename)
+            decoded = (_decode_can_shard(filename, start, end) for start, end in shards)
+            parts = self._collect_shards(decoded, shards, progress)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_can_worker,
+                                     initargs=(dbc_filename,)) as executor:
+                starts, ends = zip(*shards)
+                decoded = executor.map(_decode_can_shard, [filename] * len(shards), starts, ends)
+                parts = self._collect_shards(decoded, shards, progress)
+
+        self.add_decoded_signals(merge_decoded_signals(parts))
+
+    @staticmethod
+    def _collect_shards(decoded, shards, progress):
+        parts = []
+        for part, (start, end) in zip(decoded, shards):
+            parts.append(part)
+            if progress:
+                progress(nbytes=end - start)
+        return parts
+
+    def add_decoded_signals(self, signals):
+        """ Creates a channel for each decoded signal.
+
+        signals: Dict, mapping signal names to (units, timestamps, values) as produced by
+        decode_can_frames
+        """
+        for name, (units, stamps, values) in signals.items():
+            messages = list(map(Message, stamps.tolist(), values.tolist()))
+            if name in self.channels:
+                self.channels[name].messages.extend(messages)
+            else:
+                # the decimals of a signal aren't known, it is kept floating point
+                self.channels[name] = Channel(name, units, float, None, messages)
 
     def from_csv_log(self, log_lines):
         """ Creates channels populated with messages from a CSV log file.
@@ -96,7 +150,7 @@ class DataLog(object):
             return
 
         # Get the channel names, ignore the first column as it is assumed to be time
-        header = log_lines[0]
+        header = log_lines[0].rstrip("\r\n")
         channel_names = header.split(",")[1:]
 
         # We'll keep a map of names and column numbers for easy channel lookups when parsing rows
@@ -167,19 +221,6 @@ class DataLog(object):
             channel.name = name
             channel.units = units
 
-    @staticmethod
-    def __parse_can_log_line(line):
-        """ Extracts the timestamp, bus, arbitration id, and data from a single line in a can log file
-        recorded with candump -l.
-        """
-        stamp, bus, msg = line.split()
-        stamp = float(stamp[1:-1])
-        id, data = msg.split("#")
-        id = int(id, 16)
-        data = bytearray.fromhex(data)
-
-        return stamp, bus, id, data
-
     def __str__(self):
         output = "Log: %s, Duration: %f s" % (self.name, (self.end() - self.start()))
         for channel_name, channel_data in self.channels.items():
@@ -219,13 +260,19 @@ class Channel(object):
         else:
             return 0
 
-    def resample(self, start_time, end_time, frequency):
+    def resample(self, start_time, end_time, frequency, mode="latest"):
         """ Resamples the data such that all messages occur at a fixed frequency.
 
         If multiple messages fall within the time interval between messages for the new frequency,
         the latest message will be used. When no existing messages fall within the time interval
         the most recent value will be retained. If no existing message is present within the first
         new time interval, then the first message will be initialized at 0.
+
+        With mode "mean", "minmax" or "fir" (see decimate.MODES) float channels logged faster than
+        the new frequency are low-pass filtered instead of picking the latest message, so content
+        above the new Nyquist rate does not alias: the mean of the messages of each interval, the
+        minimum and maximum of each two intervals, or a short FIR filter centred on the latest
+        message. Other channels (states, counters) always use the latest message.
         """
         if not self.messages:
             return
@@ -234,6 +281,10 @@ class Channel(object):
         num_msgs = math.floor(frequency * (end_time - start_time))
         dt_step = 1.0 / frequency
 
+        if mode != "latest" and self.data_type is float:
+            self.messages = self._resample_filtered(start_time, dt_step, num_msgs, mode)
+            return
+
         # Create a new message at each time new time point based on the frequency. As we step
         # through the new sample points we'll find the latest pre existing message to insert there,
         # and will hold that value until we find another message.
@@ -260,8 +311,34 @@ class Channel(object):
 
         self.messages = new_msgs
 
+    def _resample_filtered(self, start_time, dt_step, num_msgs, mode):
+        """ Messages at the new frequency with the values reduced over each interval by mode. """
+        if mode not in MODES:
+            raise ValueError("Unknown resample mode %r, one of latest, %s" % (mode, ", ".join(MODES)))
+        if num_msgs <= 0:
+            return []
+        stamps = np.array([msg.timestamp for msg in self.messages], dtype=np.float64)
+        values = np.array([msg.value for msg in self.messages], dtype=np.float64)
+        times = start_time + np.arange(num_msgs) * dt_step
+
+        # messages of each interval: the ones before its end that are not in the previous interval
+        ends = np.searchsorted(stamps, times + 0.5 * dt_step)
+        if mode == "mean":
+            out = window_mean(values, ends)
+        elif mode == "minmax":
+            out = window_minmax(values, ends)[1]
+        else:
+            rate = (len(stamps) - 1) / (stamps[-1] - stamps[0]) if stamps[-1] > stamps[0] else 0.0
+            out = fir(values, max(1, int(round(rate * dt_step))), np.maximum(ends - 1, 0))
+            out[np.diff(ends, prepend=0) == 0] = np.nan
+
+        # empty intervals hold the previous value, 0 before the first message
+        held = np.maximum.accumulate(np.where(np.isfinite(out), np.arange(num_msgs), -1))
+        out = np.where(held >= 0, out[np.maximum(held, 0)], 0.0)
+        return list(map(Message, times.tolist(), out.tolist()))
+
     def __str__(self):
-        return "Channel: %s, Units: %s, Decimals: %d, Messages: %d, Frequency: %.2f Hz" % \
+        return "Channel: %s, Units: %s, Decimals: %s, Messages: %d, Frequency: %.2f Hz" % \
         (self.name, self.units, self.decimals, len(self.messages), self.avg_frequency())
 
 class Message(object):
@@ -272,3 +349,240 @@ class Message(object):
 
     def __str__(self):
         return "t=%f, value=%f" % (self.timestamp, self.value)
+
+
+def bin_can_frames(log_lines, known_ids=None):
+    """ Groups the frames of a candump log by arbitration id.
+
+    Returns a dict mapping each arbitration id to a tuple (timestamps, data), where timestamps is a
+    float64 array [s] and data is a uint8 matrix holding one frame per row. Frames shorter than the
+    longest frame of their id are zero padded. Remote frames and ids not in known_ids (when given)
+    are skipped.
+
+    log_lines: Iterable, containing candump log lines (recorded with 'candump' with '-l')
+    known_ids: Set, optional arbitration ids to keep
+    """
+    stamps = {}
+    payloads = {}
+    for line in log_lines:
+        parts = line.split()
+        if len(parts) != 3:
+            continue
+
+        stamp, _bus, msg = parts
+        id, _, data = msg.partition("#")
+        if data.startswith("#"):
+            # CAN FD frame, the first nibble holds the flags
+            data = data[2:]
+        elif data.startswith("R"):
+            continue
+
+        id = int(id, 16)
+        if known_ids is not None and id not in known_ids:
+            continue
+
+        if id in stamps:
+            stamps[id].append(stamp[1:-1])
+            payloads[id].append(data)
+        else:
+            stamps[id] = [stamp[1:-1]]
+            payloads[id] = [data]
+
+    frames = {}
+    for id, hex_payloads in payloads.items():
+        width = max(len(h) for h in hex_payloads)
+        if any(len(h) != width for h in hex_payloads):
+            hex_payloads = [h.ljust(width, "0") for h in hex_payloads]
+
+        data = np.frombuffer(bytes.fromhex("".join(hex_payloads)), dtype=np.uint8)
+        data = data.reshape(len(hex_payloads), width // 2)
+        frames[id] = (np.array(stamps[id], dtype=np.float64), data)
+
+    return frames
+
+
+def decode_can_frames(frames, can_db):
+    """ Decodes binned CAN frames into signal time series.
+
+    Each plain integer signal (up to 64 bits, in a classic CAN frame) is extracted for all the
+    frames of its id at once through vectorised bit slicing, scaling and offset. Multiplexed
+    messages, float signals and CAN FD payloads fall back to decoding every frame with cantools.
+
+    Returns a dict mapping each signal name to a tuple (units, timestamps, values).
+
+    frames: Dict, as returned by bin_can_frames
+    can_db: cantools.database
+    """
+    signals = {}
+    for id, (stamps, data) in frames.items():
+        try:
+            db_msg = can_db.get_message_by_frame_id(id)
+        except KeyError:
+            continue
+
+        if db_msg.is_multiplexed() or db_msg.is_container or data.shape[1] > 8:
+            _decode_frames_fallback(db_msg, stamps, data, signals)
+            continue
+
+        # Pad the frames to 8 bytes so they can be viewed as a single 64 bit word
+        words = np.zeros((len(data), 8), dtype=np.uint8)
+        words[:, :data.shape[1]] = data
+
+        # Signals which can't be sliced from the word are decoded together, one pass over the frames
+        fallback = [signal.name for signal in db_msg.signals
+                    if signal.is_float or not _signal_fits_word(signal)]
+        decoded = _decode_signals_fallback(db_msg, fallback, data) if fallback else {}
+
+        for signal in db_msg.signals:
+            if signal.name in decoded:
+                values = decoded[signal.name]
+            else:
+                values = _extract_signal(words, signal)
+
+            signals[signal.name] = (signal.unit or "", stamps, values)
+
+    return signals
+
+
+def _signal_fits_word(signal):
+    """ Whether a signal lies entirely within the first 64 bits of the frame. """
+    if signal.byte_order == "little_endian":
+        return signal.start + signal.length <= 64
+    msb = 8 * (signal.start // 8) + 7 - signal.start % 8
+    return msb + signal.length <= 64
+
+
+def _extract_signal(words, signal):
+    """ Extracts a signal from all rows of an (n, 8) uint8 frame matrix. """
+    if signal.byte_order == "little_endian":
+        raw = words.view("<u8").ravel() >> np.uint64(signal.start)
+    else:
+        # Motorola start bits refer to the most significant bit of the signal
+        msb = 8 * (signal.start // 8) + 7 - signal.start % 8
+        raw = words.view(">u8").ravel().astype(np.uint64) >> np.uint64(64 - msb - signal.length)
+
+    if signal.length < 64:
+        raw &= np.uint64((1 << signal.length) - 1)
+
+    if signal.is_signed:
+        values = raw.astype(np.int64)
+        if signal.length < 64:
+            sign_bit = 1 << (signal.length - 1)
+            values = (values ^ sign_bit) - sign_bit
+        values = values.astype(np.float64)
+    else:
+        values = raw.astype(np.float64)
+
+    if signal.scale != 1:
+        values *= signal.scale
+    if signal.offset != 0:
+        values += signal.offset
+
+    return values
+
+
+def _decode_signals_fallback(db_msg, names, data):
+    """ Decodes some signals of a message from every frame with cantools, each frame once.
+
+    Returns a dict mapping each signal name to its values.
+    """
+    values = np.empty((len(data), len(names)), dtype=np.float64)
+    for i, row in enumerate(data):
+        decoded = db_msg.decode(bytes(row[:db_msg.length]), decode_choices=False)
+        values[i] = [decoded[name] for name in names]
+    return {name: values[:, j].copy() for j, name in enumerate(names)}
+
+
+def _decode_frames_fallback(db_msg, stamps, data, signals):
+    """ Decodes every frame with cantools, for messages which can't be vectorised.
+
+    Signals of multiplexed messages are only present in some frames, so every signal keeps its own
+    timestamps.
+    """
+    decoded = {}
+    for stamp, row in zip(stamps.tolist(), data):
+        values = db_msg.decode(bytes(row[:db_msg.length]), decode_choices=False)
+        for name, value in values.items():
+            decoded.setdefault(name, ([], []))
+            decoded[name][0].append(stamp)
+            decoded[name][1].append(float(value))
+
+    for signal in db_msg.signals:
+        if signal.name in decoded:
+            stamps, values = decoded[signal.name]
+            signals[signal.name] = (signal.unit or "",
+                                    np.array(stamps, dtype=np.float64),
+                                    np.array(values, dtype=np.float64))
+
+
+def can_log_shards(filename, shard_size=CAN_SHARD_SIZE):
+    """ Splits a file into (start, end) byte ranges of roughly shard_size bytes.
+
+    Every range starts at the beginning of a line and ends just after a line break (or at the end
+    of the file), so each one can be parsed independently.
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as f:
+        pos = shard_size
+        while pos < size:
+            f.seek(pos)
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            bounds.append(pos)
+            pos += shard_size
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def merge_decoded_signals(parts):
+    """ Merges decoded signals of consecutive shards, as returned by decode_can_frames.
+
+    Signal arrays of a single shard are used as is, otherwise they are concatenated once and only
+    sorted if the timestamps are not already in order.
+    """
+    pieces = {}
+    for part in parts:
+        for name, (units, stamps, values) in part.items():
+            pieces.setdefault(name, (units, [], []))
+            pieces[name][1].append(stamps)
+            pieces[name][2].append(values)
+
+    signals = {}
+    for name, (units, stamps, values) in pieces.items():
+        if len(stamps) == 1:
+            stamps, values = stamps[0], values[0]
+        else:
+            stamps, values = np.concatenate(stamps), np.concatenate(values)
+
+        if len(stamps) > 1 and np.any(np.diff(stamps) < 0):
+            order = np.argsort(stamps, kind="stable")
+            stamps, values = stamps[order], values[order]
+
+        signals[name] = (units, stamps, values)
+
+    return signals
+
+
+# Database used by _decode_can_shard, loaded once per worker process by _init_can_worker
+_worker_can_db = None
+
+
+def _init_can_worker(dbc_filename):
+    global _worker_can_db
+    import cantools
+
+    _worker_can_db = cantools.database.load_file(dbc_filename)
+
+
+def _decode_can_shard(filename, start, end):
+    """ Parses and decodes the lines within a byte range of a candump file. """
+    with open(filename, "rb") as f:
+        f.seek(start)
+        lines = f.read(end - start).decode("ascii", errors="replace").splitlines()
+
+    known_ids = set(msg.frame_id for msg in _worker_can_db.messages)
+    return decode_can_frames(bin_can_frames(lines, known_ids), _worker_can_db)
@@ -0,0 +1,197 @@
+import numpy as np
+
+
+def minmax(values, n_buckets):
+    """ Reduces a series to the minimum and maximum of each of n_buckets buckets.
+
+    The series is split in buckets of equal size, and for each bucket the samples holding its
+    minimum and its maximum are kept, in their original order, so drawing the result as a line
+    shows the same envelope as drawing every sample. Everything is done with a reshape and
+    argmin/argmax over the buckets, without any Python loop over the samples.
+
+    Returns (indices, values) of the kept samples, at most 2 * n_buckets: buckets are rounded up in
+    size, so with the shorter last one there are never more than n_buckets. Series short enough to
+    be drawn as they are are returned whole.
+    """
+    values = np.asarray(values)
+    n = len(values)
+    if n_buckets <= 0 or n <= 2 * n_buckets:
+        return np.arange(n), values
+
+    size = -(-n // n_buckets)
+    full = n // size * size
+    blocks = values[:full].reshape(-1, size)
+    imin = blocks.argmin(axis=1)
+    imax = blocks.argmax(axis=1)
+
+    base = np.arange(len(blocks)) * size
+    indices = np.empty(2 * len(blocks), dtype=np.int64)
+    indices[0::2] = base + np.minimum(imin, imax)
+    indices[1::2] = base + np.maximum(imin, imax)
+
+    if full < n:
+        tail = values[full:]
+        a, b = sorted((int(tail.argmin()), int(tail.argmax())))
+        indices = np.concatenate([indices, [full + a, full + b]])
+
+    return indices, values[indices]
+
+
+# Modes of decimate: block mean, min/max preserving and short FIR low-pass
+MODES = ("mean", "minmax", "fir")
+
+# FIR length in output samples: 4 x factor + 1 taps
+FIR_SPAN = 4
+
+
+def _reduce_windows(ufunc, values, ends):
+    """ ufunc reduction of the windows [ends[i-1], ends[i]) of values (the first from 0), NaN for
+    empty windows. One reduceat over the non empty windows, which follow each other.
+    """
+    ends = np.asarray(ends, dtype=np.int64)
+    starts = np.concatenate([[0], ends[:-1]])
+    full = ends > starts
+    out = np.full(len(ends), np.nan)
+    if full.any():
+        out[full] = ufunc.reduceat(values[:ends[-1]], starts[full])
+    return out
+
+
+def window_mean(values, ends):
+    """ Mean of each window [ends[i-1], ends[i]) of values, ignoring NaN; NaN for empty windows. """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (_reduce_windows(np.add, np.where(finite, values, 0.0), ends) /
+                _reduce_windows(np.add, finite.astype(np.float64), ends))
+
+
+def window_minmax(values, ends):
+    """ Min/max preserving reduction of the windows [ends[i-1], ends[i]) of values.
+
+    Windows are taken in pairs: the two outputs of a pair are the minimum and the maximum of both
+    windows, in the order they occur, so peaks survive the decimation at the same output rate.
+    Returns (positions, values): the sample index of each output (NaN for empty pairs) and its value.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.int64)
+    pair_ends = ends[1::2] if len(ends) % 2 == 0 else np.append(ends[1::2], ends[-1])
+    lo = _reduce_windows(np.fmin, values, pair_ends)
+    hi = _reduce_windows(np.fmax, values, pair_ends)
+
+    # first index of the minimum and of the maximum of each pair
+    n = int(pair_ends[-1]) if len(pair_ends) else 0
+    index = np.arange(n)
+    pair = np.searchsorted(pair_ends, index, side="right")
+    v = values[:n]
+    pos_lo = _reduce_windows(np.fmin, np.where(v == lo[pair], index, np.nan), pair_ends)
+    pos_hi = _reduce_windows(np.fmin, np.where(v == hi[pair], index, np.nan), pair_ends)
+
+    lo_first = ~(pos_hi < pos_lo)
+    positions = np.empty(2 * len(pair_ends))
+    out = np.empty(2 * len(pair_ends))
+    positions[0::2] = np.where(lo_first, pos_lo, pos_hi)
+    positions[1::2] = np.where(lo_first, pos_hi, pos_lo)
+    out[0::2] = np.where(lo_first, lo, hi)
+    out[1::2] = np.where(lo_first, hi, lo)
+    return positions[:len(ends)], out[:len(ends)]
+
+
+def fir_taps(factor):
+    """ Windowed sinc (Hamming) low-pass with its cut-off at the Nyquist rate after decimating by
+    factor, FIR_SPAN x factor + 1 taps with unit gain. """
+    n = FIR_SPAN * factor + 1
+    k = np.arange(n) - n // 2
+    taps = np.sinc(k / float(factor)) * np.hamming(n)
+    return taps / taps.sum()
+
+
+def fir(values, factor, positions=None):
+    """ Low-pass filtered values at the sample indices positions (every factor-th by default).
+
+    Only the outputs are computed: one strided multiply-add per tap over the kept positions, so a
+    decimation costs FIR_SPAN operations per input sample and no full rate copy. NaN samples are
+    interpolated from their neighbours first and the ends are padded with the edge values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if positions is None:
+        positions = np.arange(0, n, factor)
+    positions = np.asarray(positions, dtype=np.int64)
+    finite = np.isfinite(values)
+    if not finite.all() and finite.any():
+        values = np.interp(np.arange(n), np.flatnonzero(finite), values[finite])
+
+    taps = fir_taps(factor)
+    half = len(taps) // 2
+    padded = np.pad(values, half, mode="edge")
+    out = np.zeros(len(positions))
+    regular = len(positions) > 1 and (np.diff(positions) == factor).all() and positions[0] >= 0
+    for j, tap in enumerate(taps):
+        if regular:
+            start = positions[0] + j
+            out += tap * padded[start:start + factor * (len(positions) - 1) + 1:factor]
+        else:
+            out += tap * padded[positions + j]
+    return out
+
+
+def decimate(values, factor, mode="mean"):
+    """ Anti-aliased decimation of a regularly sampled series by an integer factor.
+
+    mode: "mean" (mean of each block of factor samples), "minmax" (minimum and maximum of each
+    two blocks, in order, see window_minmax) or "fir" (short low-pass filter, then every factor-th
+    sample). Returns (positions, values) with the fractional sample index each output stands for
+    (block centres, extreme samples or filter centres), ceil(len / factor) outputs.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if mode not in MODES:
+        raise ValueError("Unknown decimation mode %r, one of %s" % (mode, ", ".join(MODES)))
+    if factor <= 1 or not n:
+        return np.arange(n, dtype=np.float64), values
+
+    if mode == "fir":
+        positions = np.arange(0, n, factor)
+        return positions.astype(np.float64), fir(values, factor, positions)
+
+    # whole blocks (pairs of blocks for minmax) as rows of a reshaped view, the rest by windows
+    size = factor if mode == "mean" else 2 * factor
+    full = n // size * size
+    blocks = values[:full].reshape(-1, size)
+    tail_ends = np.minimum(np.arange(full + factor, n + factor, factor), n) - full
+    if mode == "mean":
+        starts = np.arange(0, n, factor)
+        ends = np.minimum(starts + factor, n)
+        if np.isfinite(blocks).all():
+            means = blocks.mean(axis=1)
+        else:
+            means = window_mean(values[:full], np.arange(factor, full + 1, factor))
+        out = np.concatenate([means, window_mean(values[full:], tail_ends)])
+        return (starts + ends - 1) / 2.0, out
+
+    nan = np.isnan(blocks)
+    imin = np.where(nan, np.inf, blocks).argmin(axis=1)
+    imax = np.where(nan, -np.inf, blocks).argmax(axis=1)
+    base = np.arange(len(blocks)) * size
+    first, second = np.minimum(imin, imax), np.maximum(imin, imax)
+    positions = np.empty(2 * len(blocks))
+    positions[0::2], positions[1::2] = base + first, base + second
+    rows = np.arange(len(blocks))
+    out = np.empty(2 * len(blocks))
+    out[0::2], out[1::2] = blocks[rows, first], blocks[rows, second]
+    tail_positions, tail = window_minmax(values[full:], tail_ends)
+    return np.concatenate([positions, full + tail_positions]), np.concatenate([out, tail])
+
+
+def channel_window(chan, n_buckets, t0=None, t1=None):
+    """ Decimated samples of an ld channel between the times [t0, t1) in seconds.
+
+    Only the samples of the window are read (or viewed, for mapped files), so zooming in on a long
+    session costs the size of the window, not of the session. Returns (times, values).
+    """
+    start, stop = chan.sample_range(t0, t1)
+    indices, values = minmax(chan.read(start, stop), n_buckets)
+    if not chan.freq:
+        return indices.astype(np.float64), values
+    return (start + indices) / float(chan.freq), values
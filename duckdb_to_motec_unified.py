@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
-import sys, re
+import os, sys, re, json
 import numpy as np
 import pandas as pd
 import duckdb
 
+from progress import Progress, json_lines
+
 EXCLUDE = {"channelsList", "eventsList", "metadata"}
 
 # Gruppi logici (usati dalla GUI)
@@ -200,6 +202,12 @@ def guess_units_decimals(ch: str):
     if "speed" in n:
         return ("km/h", 1)
 
+    # Distanza e delta sul giro di riferimento
+    if "distance" in n or "lap dist" in n:
+        return ("m", 1)
+    if "delta time" in n:
+        return ("s", 3)
+
     # RPM
     if "rpm" in n:
         return ("rpm", 0)
@@ -212,8 +220,154 @@ def guess_units_decimals(ch: str):
     if "g_force" in n or "accel" in n or "acceleration" in n:
         return ("g", 3)
 
-    # Default
-    return ("", 2)
+    # Default: decimali ignoti, il canale resta in virgola mobile
+    return ("", None)
+
+def ld_spec(columns, hz: int, units: dict = None):
+    """Spec per ldData.from_frame: frequenza, unità e decimali di ogni canale.
+
+    units: (unità, decimali) espliciti per canale, es. dei canali matematici. I canali con
+    decimali noti sono quantizzati in int16/int32, quelli senza (None) restano float32."""
+    spec = {}
+    units = units or {}
+    for c in columns:
+        if c in units:
+            u, d = units[c]
+            spec[c] = {"freq": hz, "units": u, "decimals": d}
+        elif c == "Beacon":
+            spec[c] = {"freq": hz, "units": "", "dtype": np.int16}
+        elif c == "LapTime":
+            spec[c] = {"freq": hz, "units": "s", "decimals": 3}
+        elif c == "Lap":
+            spec[c] = {"freq": hz, "units": "", "decimals": 0}
+        else:
+            u, d = guess_units_decimals(c)
+            spec[c] = {"freq": hz, "units": u, "decimals": d}
+        if spec[c].get("decimals", 0) is None:
+            del spec[c]["decimals"]
+    return spec
+
+def ordered_columns(out: pd.DataFrame):
+    return ["Time", "Beacon", "LapTime"] + [c for c in out.columns if c not in ("Time", "Beacon", "LapTime")]
+
+def write_csv(out: pd.DataFrame, out_csv: str, units: dict = None):
+    """Scrive il CSV e accanto il .meta.csv con unità e decimali; restituisce il percorso del meta."""
+    units = units or {}
+    out.to_csv(out_csv, index=False, float_format="%.6f")
+
+    # META: units + decimals
+    meta_rows = []
+    for c in out.columns:
+        if c in ("Time", "Beacon", "LapTime"):
+            continue
+        u, d = units.get(c) or guess_units_decimals(c)
+        # decimali vuoti: ignoti
+        meta_rows.append((c, u, "" if d is None else d))
+
+    meta_path = out_csv.replace(".csv", ".meta.csv")
+    pd.DataFrame(meta_rows, columns=["channel", "units", "decimals"]).to_csv(meta_path, index=False)
+    return meta_path
+
+def write_ld(out: pd.DataFrame, path: str, hz: int, units: dict = None, **meta):
+    """Scrive il log MoTeC direttamente dal DataFrame (Time escluso, è implicito nella frequenza)."""
+    from ldparser.ldparser import ldData
+
+    channels = out[[c for c in out.columns if c != "Time"]]
+    ldData.from_frame(channels, ld_spec(channels.columns, hz, units), freq=hz, **meta).write(path)
+
+def write_pyramid(out: pd.DataFrame, ld_path: str, hz: int):
+    """Scrive il sidecar .pyr (vedi ldparser.pyramid) con gli stessi canali del .ld."""
+    from ldparser import pyramid
+
+    path = pyramid.sidecar_path(ld_path)
+    pyramid.write(path, ((c, hz, out[c].to_numpy()) for c in out.columns if c != "Time"))
+    return path
+
+def speed_column(out: pd.DataFrame):
+    """Nome del canale di velocità della vettura (non delle ruote), o None."""
+    speed = [c for c in out.columns if "speed" in c.lower() and "wheel" not in c.lower()]
+    return speed[0] if speed else None
+
+def write_stints(out: pd.DataFrame, ld_path: str, hz: int, units: dict = None, threads: int = None,
+                 **meta):
+    """Scrive un .ld per stint (<output>_stint1.ld, ...), in parallelo dagli stessi array.
+
+    Gli stint sono separati dai pit/limiter, dalle soste lunghe e dai cambi pilota (vedi stints);
+    ogni file riparte da Time 0 con i suoi Beacon e ha sessione e data/ora del proprio stint."""
+    import datetime
+    from concurrent.futures import ThreadPoolExecutor
+    from ldparser.ldparser import ldData
+    from stints import stint_bounds
+
+    time = out["Time"].to_numpy()
+    speed = speed_column(out)
+    bounds = stint_bounds(time, out, out[speed].to_numpy() if speed else None)
+    columns = {c: out[c].to_numpy() for c in out.columns if c != "Time"}
+    spec = ld_spec(columns, hz, units)
+    started = meta.pop("date_time", None) or datetime.datetime.now()
+    base = os.path.splitext(ld_path)[0]
+
+    def write(i, start, stop):
+        path = f"{base}_stint{i}.ld"
+        # viste degli array della sessione, nessuna copia
+        channels = {c: v[start:stop] for c, v in columns.items()}
+        laps = channels["Lap"]
+        ldData.from_frame(channels, spec, freq=hz, session=f"Stint {i}",
+                          short_comment=f"Stint {i}/{len(bounds)}, laps {int(laps[0])}-{int(laps[-1])}",
+                          date_time=started + datetime.timedelta(seconds=float(time[start])),
+                          **meta).write(path)
+        return path
+
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        return list(pool.map(lambda b: write(b[0], *b[1]), enumerate(bounds, start=1)))
+
+def add_alignment(out: pd.DataFrame, out_csv: str):
+    """Aggiunge Lap Distance (se manca la distanza del sim) e Delta Time a out, e scrive
+    <output>_aligned.npz: griglia in metri, numeri dei giri e una matrice giri x griglia per canale."""
+    import lap_align
+
+    lap_dist = [c for c in out.columns if "lap dist" in c.lower()]
+    speed = speed_column(out)
+    if not lap_dist and not speed:
+        print("ALIGN: nessun canale Speed o Lap Dist, allineamento saltato")
+        return None
+
+    time, lap = out["Time"].to_numpy(), out["Lap"].to_numpy()
+    distance = lap_align.lap_distance(time, lap, speed=out[speed].to_numpy() if speed else None,
+                                      distance=out[lap_dist[0]].to_numpy() if lap_dist else None)
+    if not lap_dist:
+        out["Lap Distance"] = distance
+    out["Delta Time"] = lap_align.delta_time(distance, lap, out["LapTime"].to_numpy())
+
+    channels = {c: out[c].to_numpy() for c in out.columns if c not in ("Time", "Beacon", "Lap")}
+    grid, laps, matrices = lap_align.align(distance, lap, channels)
+    path = os.path.splitext(out_csv)[0] + "_aligned.npz"
+    np.savez(path, grid=grid, laps=laps, channels=np.array(list(matrices)),
+             **{f"ch{i}": m.astype(np.float32) for i, m in enumerate(matrices.values())})
+    return path
+
+def add_math_channels(out: pd.DataFrame, math_file: str):
+    """Aggiunge a out i canali matematici del file di espressioni (vedi math_channels), calcolati
+    una volta in conversione invece che da MoTeC a ogni apertura; restituisce {canale: (unità, decimali)}."""
+    from math_channels import MathProgram
+
+    program = MathProgram.from_file(math_file)
+    values, skipped = program.evaluate(out)
+    for name, missing in skipped.items():
+        print(f"MATH: {name} saltato, mancano {', '.join(missing)}")
+    for name, v in values.items():
+        out[name] = v
+    return {name: (program.channels[name].unit, program.channels[name].decimals) for name in values}
+
+def write_lap_stats(out: pd.DataFrame, out_csv: str, fmt: str = "csv"):
+    """Scrive <output>_laps.csv/.parquet con min/max/media/primo/ultimo/integrale per giro e canale."""
+    import lap_stats
+
+    channels = {c: out[c].to_numpy() for c in out.columns if c not in ("Time", "Beacon", "LapTime", "Lap")}
+    channels.update(lap_stats.derived_channels(out))
+    stats = lap_stats.lap_channel_stats(out["Time"].to_numpy(), out["Lap"].to_numpy(), channels)
+    path = os.path.splitext(out_csv)[0] + "_laps." + ("parquet" if fmt == "parquet" else "csv")
+    return lap_stats.write_lap_stats(stats, path, fmt)
 
 def detect_laps(df: pd.DataFrame):
     lap_col = None
@@ -247,26 +401,60 @@ def detect_laps(df: pd.DataFrame):
 
     return None
 
-def main():
-    if len(sys.argv) < 4:
-        print("Uso: python duckdb_to_motec_unified.py file.duckdb output.csv Driver=100 Tyres=20 ...")
-        sys.exit(1)
-
-    db = sys.argv[1]
-    out_csv = sys.argv[2]
-
-    # Argomenti: Group=Hz
-    group_hz = {}
-    for g in sys.argv[3:]:
-        k, v = g.split("=")
-        group_hz[k] = int(v)
-
-    # Master Hz = max
-    master_hz = max(group_hz.values())
-    dt = 1.0 / master_hz
-
-    con = duckdb.connect(db, read_only=True)
+# Colonne con la posizione nel giro (normalizzata 0..1 o distanza): il giro cambia quando ricominciano
+LAP_POSITION_KEYS = ("normalizedlap", "normalized lap", "lap dist")
+
+def lap_position_laps(pos: pd.Series):
+    """Numero del giro da una posizione nel giro: un nuovo giro quando cala di oltre metà del massimo."""
+    pos = pd.to_numeric(pos, errors="coerce").ffill().fillna(0.0)
+    top = pos.max()
+    if not top > 0:
+        return None
+    resets = pos.diff().fillna(0) < -0.5 * top
+    return (resets.cumsum() + 1).astype(int)
+
+def compute_lap_channels(df: pd.DataFrame):
+    """Beacon, LapTime e Lap dal segnale di giro disponibile.
+
+    Usa, in ordine, il numero del giro (colonna Lap / Lap Number), la posizione nel giro
+    (NormalizedLap, Lap Dist...), poi le euristiche di detect_laps. Restituisce (beacon, lap_time, lap, sorgente); senza nessun
+    segnale il beacon è tutto 0, LapTime = Time e un solo giro (sorgente None).
+    """
+    time = df["Time"]
+    lap_series, source = None, None
+    for c in df.columns:
+        if c.lower() in ("lap", "lap number"):
+            numbers = pd.to_numeric(df[c], errors="coerce")
+            if numbers.notna().any():
+                lap_series, source = numbers.ffill().fillna(1).astype(int), c
+                break
+    for c in df.columns if lap_series is None else ():
+        if any(k in c.lower() for k in LAP_POSITION_KEYS):
+            lap_series = lap_position_laps(df[c])
+            if lap_series is not None:
+                source = c
+                break
+    if lap_series is None:
+        lap_series = detect_laps(df)
+        source = "detect_laps" if lap_series is not None else None
 
+    if lap_series is None:
+        lap = pd.Series(1, index=df.index, name="Lap")
+        beacon = pd.Series(0, index=df.index, name="Beacon")
+        return beacon, time.rename("LapTime"), lap, None
+
+    lap = lap_series.rename("Lap")
+    beacon = (lap.diff().fillna(1) != 0).astype(int).rename("Beacon")
+    beacon.iloc[0] = 1
+    lap_time = (time - time.groupby(lap).transform("min")).rename("LapTime")
+    return beacon, lap_time, lap, source
+
+# Fasi della conversione con il loro peso (circa) sul tempo totale
+STAGES = [("scan", 2), ("extract", 75), ("laps", 3), ("align", 3), ("math", 3), ("stats", 3),
+          ("csv", 15), ("ld", 5), ("stints", 5), ("pyramid", 3)]
+
+def scan_session(con):
+    """Tabelle della sessione, durata da GPS Time (0 se manca) e righe di ogni tabella."""
     tables = [
         r[0] for r in con.execute("""
             SELECT table_name
@@ -277,101 +465,495 @@ def main():
     ]
 
     # Durata sessione (preferisci GPS Time)
-    session_end = 0.0
+    gps_end = 0.0
     if "GPS Time" in tables:
         g = con.execute('SELECT value FROM "GPS Time"').fetchdf()
         if len(g):
-            session_end = float(g["value"].iloc[-1] - g["value"].iloc[0])
+            gps_end = float(g["value"].iloc[-1] - g["value"].iloc[0])
 
-    if session_end <= 0:
-        # fallback: usa max( (n-1)/master_hz ) — grezzo ma evita 0
+    counts = {}
+    if gps_end <= 0:
         for t in tables:
-            n = int(con.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0])
-            if n > 1:
-                session_end = max(session_end, (n - 1) / master_hz)
-
-    master_time = np.arange(0.0, session_end + dt, dt, dtype=float)
-    data = {"Time": master_time}
-
-    # Per evitare duplicati se due gruppi matchano lo stesso canale/tabella
-    added_cols = set()
+            counts[t] = int(con.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0])
+    return tables, gps_end, counts
+
+def session_end(gps_end: float, counts: dict, master_hz: int) -> float:
+    if gps_end > 0:
+        return gps_end
+    # fallback: usa max( (n-1)/master_hz ) — grezzo ma evita 0
+    end = 0.0
+    for n in counts.values():
+        if n > 1:
+            end = max(end, (n - 1) / master_hz)
+    return end
+
+def matching_tables(tables, group_hz: dict):
+    """(gruppo, Hz, tabella) da estrarre per i gruppi scelti."""
+    return [(group, hz, t) for group, hz in group_hz.items() for t in tables
+            if any(p in t.lower() for p in GROUPS.get(group, []))]
+
+# Sotto questo rapporto tra frequenza nativa e Hz del gruppo non si decima (basta l'interpolazione)
+DECIMATE_RATIO = 1.5
+
+# Scarto relativo entro cui la frequenza nativa stimata è arrotondata agli Hz interi
+NATIVE_HZ_TOLERANCE = 0.01
+
+def native_rate(samples: int, duration: float, hz: int) -> float:
+    """Frequenza a cui è stata registrata una tabella di samples righe che copre la sessione
+    (duration s); hz se non stimabile. Le stime vicine a un intero (100.09 per una sessione
+    misurata con un campione GPS in meno) sono arrotondate, per non far scorrere la timeline."""
+    if samples < 2 or duration <= 0:
+        return float(hz)
+    rate = (samples - 1) / duration
+    rounded = round(rate)
+    if rounded >= 1 and abs(rate - rounded) <= NATIVE_HZ_TOLERANCE * rounded:
+        return float(rounded)
+    return rate
+
+def resample_table(df: pd.DataFrame, t: str, hz: int, master_time, data: dict, added_cols: set,
+                   decimation: str = None):
+    """Porta le colonne della tabella t sulla timeline master (a hz per il suo gruppo), in data.
+
+    La tabella copre la sessione alla sua frequenza nativa, stimata dalle righe; con decimation
+    (una tra decimate.MODES), se è campionata più fitta degli Hz del gruppo le colonne vengono
+    prima decimate con un filtro anti-aliasing (media, min/max o FIR), altrimenti sono
+    interpolate senza filtro.
+    """
+    if df.empty:
+        return
+
+    # timeline della tabella alla frequenza nativa
+    native_hz = native_rate(len(df), master_time[-1] if len(master_time) else 0.0, hz)
+    t_ch = np.arange(len(df)) / native_hz
+
+    factor = 1
+    if decimation and native_hz >= DECIMATE_RATIO * hz:
+        from decimate import decimate
+        factor = int(round(native_hz / hz))
+
+    for c in df.columns:
+        y = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)
+        if np.isfinite(y).sum() < 5:
+            continue
 
-    for group, hz in group_hz.items():
-        patterns = GROUPS.get(group, [])
+        # value1..4 -> FL/FR/RL/RR
+        suffix = WHEEL_MAP.get(str(c).lower(), str(c))
+        raw_name = (t if len(df.columns) == 1 else f"{t}_{suffix}")
+        name = motec_standard_name(normalize_name(raw_name))
 
-        for t in tables:
-            tl = t.lower()
-            if not any(p in tl for p in patterns):
-                continue
+        if name in added_cols:
+            continue
 
-            df = con.execute(f'SELECT * FROM "{t}"').fetchdf()
-            if df.empty:
+        t_y = t_ch
+        if factor > 1:
+            # gli stati non si mediano: si prende un campione per blocco
+            if is_step(name):
+                positions = np.arange(0, len(y), factor)
+                y = y[positions]
+            else:
+                positions, y = decimate(y, factor, decimation)
+            t_y = positions / native_hz
+
+        if is_step(name):
+            idx = np.searchsorted(t_y, master_time, side="right") - 1
+            idx[idx < 0] = 0
+            idx[idx >= len(y)] = len(y) - 1
+            data[name] = y[idx]
+            added_cols.add(name)
+        else:
+            m = np.isfinite(y)
+            if m.sum() < 2:
                 continue
-
-            # timeline "gruppo"
-            t_ch = np.arange(0.0, len(df) / hz, 1.0 / hz, dtype=float)
-            if len(t_ch) > len(df):
-                t_ch = t_ch[:len(df)]
-
-            for c in df.columns:
-                y = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=float)
-                if np.isfinite(y).sum() < 5:
-                    continue
-
-                # value1..4 -> FL/FR/RL/RR
-                suffix = WHEEL_MAP.get(str(c).lower(), str(c))
-                raw_name = (t if len(df.columns) == 1 else f"{t}_{suffix}")
-                name = motec_standard_name(normalize_name(raw_name))
-
-                if name in added_cols:
-                    continue
-
-                if is_step(name):
-                    idx = np.searchsorted(t_ch, master_time, side="right") - 1
-                    idx[idx < 0] = 0
-                    idx[idx >= len(y)] = len(y) - 1
-                    data[name] = y[idx]
-                    added_cols.add(name)
-                else:
-                    m = np.isfinite(y)
-                    if m.sum() < 2:
-                        continue
-                    data[name] = np.interp(master_time, t_ch[m], y[m], left=np.nan, right=np.nan)
-                    added_cols.add(name)
-
+            data[name] = np.interp(master_time, t_y[m], y[m], left=np.nan, right=np.nan)
+            added_cols.add(name)
+
+# Fasi dell'export multi-target
+EXPORT_STAGES = [("scan", 2), ("extract", 70), ("targets", 28)]
+
+EXPORT_FORMATS = ("ld", "csv", "ld+csv")
+
+def load_profile(profile):
+    """Target di un profilo di export, da dict o file JSON:
+    {"targets": [{"name": ..., "groups": {"Driver": 100, ...}, "format": "ld"|"csv"|"ld+csv",
+                  "start": s, "end": s, "decimation": "mean"|"minmax"|"fir"|null}, ...]}
+    (format, start, end e decimation opzionali)."""
+    from decimate import MODES
+
+    if isinstance(profile, str):
+        with open(profile, encoding="utf-8") as f:
+            profile = json.load(f)
+    targets = profile.get("targets") or []
+    if not targets:
+        raise ValueError("Il profilo di export non ha target")
+    names = set()
+    for t in targets:
+        if not t.get("name") or not t.get("groups"):
+            raise ValueError(f"Ogni target deve avere name e groups: {t}")
+        if t["name"] in names:
+            raise ValueError(f"Target duplicato: {t['name']}")
+        names.add(t["name"])
+        if t.get("format", "ld") not in EXPORT_FORMATS:
+            raise ValueError(f"Formato non valido per {t['name']}: {t['format']} (uno tra {', '.join(EXPORT_FORMATS)})")
+        if t.get("decimation") not in MODES + (None,):
+            raise ValueError(f"Decimazione non valida per {t['name']}: {t['decimation']} (una tra {', '.join(MODES)})")
+    return targets
+
+def export(db: str, profile, out_dir: str, progress=None, threads: int = None):
+    """Più prodotti da una sola lettura del .duckdb, secondo un profilo di export (vedi load_profile).
+
+    Ogni tabella usata da almeno un target viene letta una volta; ogni target è poi ricampionato
+    ai suoi Hz dagli stessi DataFrame, tagliato tra start ed end (s) e scritto come
+    <out_dir>/<sessione>_<target>.ld/.csv, con i target in parallelo. Restituisce {target: [file]}.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    targets = load_profile(profile)
+    steps = Progress(EXPORT_STAGES, progress)
+    steps.stage("scan")
+    config = {"threads": threads} if threads else {}
+    con = duckdb.connect(db, read_only=True, config=config)
+    tables, gps_end, counts = scan_session(con)
+
+    work = {t["name"]: matching_tables(tables, t["groups"]) for t in targets}
+    needed = [t for t in tables if any(t == table for w in work.values() for _, _, table in w)]
+    steps.stage("extract", len(needed))
+    frames = {}
+    for t in needed:
+        frames[t] = con.execute(f'SELECT * FROM "{t}"').fetchdf()
+        steps.advance(rows=len(frames[t]), nbytes=int(frames[t].memory_usage(index=False).sum()))
     con.close()
 
-    out = pd.DataFrame(data).ffill().fillna(0)
+    event = os.path.splitext(os.path.basename(db))[0]
+    os.makedirs(out_dir, exist_ok=True)
+
+    def build(target):
+        hz = max(target["groups"].values())
+        dt = 1.0 / hz
+        master_time = np.arange(0.0, session_end(gps_end, counts, hz) + dt, dt, dtype=float)
+        data, added_cols = {"Time": master_time}, set()
+        for group, group_hz, t in work[target["name"]]:
+            resample_table(frames[t], t, group_hz, master_time, data, added_cols,
+                           target.get("decimation"))
+        out = pd.DataFrame(data).ffill().fillna(0)
+        # giri sulla sessione intera, così numeri e tempi restano quelli della sessione
+        out["Beacon"], out["LapTime"], out["Lap"], _ = compute_lap_channels(out)
+        start, end = target.get("start"), target.get("end")
+        if start is not None or end is not None:
+            first = np.searchsorted(master_time, start or 0.0)
+            last = np.searchsorted(master_time, end) if end is not None else len(master_time)
+            out = out.iloc[first:last]
+
+        out = out[ordered_columns(out)]
+        base = os.path.join(out_dir, f"{event}_{target['name']}")
+        fmt = target.get("format", "ld")
+        paths = []
+        if "csv" in fmt:
+            write_csv(out, base + ".csv")
+            paths.append(base + ".csv")
+        if "ld" in fmt:
+            write_ld(out, base + ".ld", hz, event=event, session=target["name"])
+            paths.append(base + ".ld")
+        return target["name"], paths
+
+    steps.stage("targets", len(targets))
+    written = {}
+    workers = min(len(targets), threads or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(build, t) for t in targets]):
+            name, paths = future.result()
+            written[name] = paths
+            steps.advance()
+            for path in paths:
+                print(f"{name} ->", path)
+
+    steps.finish()
+    return written
+
+# Elementi in coda tra le fasi della pipeline: tabelle lette in attesa di ricampionamento
+# (i canali ricampionati in attesa di scrittura sono PIPELINE_QUEUE * 8)
+PIPELINE_QUEUE = 2
+
+def column_counts(con, tables):
+    """Colonne di ogni tabella da information_schema, senza leggere i dati."""
+    rows = con.execute("""
+        SELECT table_name, COUNT(*)
+        FROM information_schema.columns
+        WHERE table_schema='main'
+        GROUP BY table_name
+    """).fetchall()
+    return {t: n for t, n in rows if t in tables}
+
+def extract_pipelined(con, work, master_time, steps, on_channel, decimation: str = None):
+    """Estrazione a pipeline: un thread legge le tabelle da DuckDB, uno le ricampiona e il
+    chiamante riceve ogni canale appena pronto con on_channel(nome, valori) (es. per scriverlo
+    subito nel .ld). Le code tra le fasi sono limitate, così lettura, calcolo e scrittura si
+    sovrappongono senza accumulare tabelle in memoria. Restituisce i canali ricampionati."""
+    import queue
+    import threading
+
+    done = object()
+    tables = queue.Queue(maxsize=PIPELINE_QUEUE)
+    channels = queue.Queue(maxsize=PIPELINE_QUEUE * 8)
+    errors = []
+
+    def read():
+        try:
+            for group, hz, t in work:
+                if errors:
+                    break
+                tables.put((hz, t, con.execute(f'SELECT * FROM "{t}"').fetchdf()))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            tables.put(done)
+
+    def resample():
+        added_cols = set()
+        try:
+            for hz, t, df in iter(tables.get, done):
+                table = {}
+                resample_table(df, t, hz, master_time, table, added_cols, decimation)
+                for name, values in table.items():
+                    # come DataFrame(data).ffill().fillna(0), colonna per colonna
+                    channels.put((name, pd.Series(values).ffill().fillna(0).to_numpy()))
+                channels.put((None, (len(df), int(df.memory_usage(index=False).sum()))))
+        except BaseException as e:
+            errors.append(e)
+            # sblocca la lettura, che si ferma alla prossima tabella
+            for _ in iter(tables.get, done):
+                pass
+        finally:
+            channels.put(done)
+
+    threads = [threading.Thread(target=read, daemon=True), threading.Thread(target=resample, daemon=True)]
+    for t in threads:
+        t.start()
+
+    data = {}
+    for name, values in iter(channels.get, done):
+        if errors:
+            continue
+        try:
+            if name is None:
+                rows, nbytes = values
+                steps.advance(rows=rows, nbytes=nbytes)
+            else:
+                data[name] = values
+                on_channel(name, values)
+        except BaseException as e:
+            errors.append(e)
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return data
+
+def parse_args(argv):
+    """Argomenti: file.duckdb output.csv Group=Hz ... [--ld file.ld] [--progress] [--threads N]
+    [--pyramid] [--lap-stats csv|parquet] [--align] [--math file.txt] [--stints] [--pipeline]
+    [--decimate mean|minmax|fir|none], oppure
+    file.duckdb cartella --profile profilo.json; restituisce gli argomenti di convert()
+    (con "profile" per export())."""
+    opts = {"db": argv[0], "out_csv": argv[1], "group_hz": {}}
+    args = iter(argv[2:])
+    for g in args:
+        if g == "--ld":
+            opts["out_ld"] = next(args)
+        elif g == "--progress":
+            # eventi di avanzamento come righe JSON su stdout
+            opts["progress"] = json_lines()
+        elif g == "--threads":
+            opts["threads"] = int(next(args))
+        elif g == "--pyramid":
+            opts["pyramid"] = True
+        elif g == "--lap-stats":
+            opts["lap_stats"] = next(args)
+        elif g == "--align":
+            opts["align"] = True
+        elif g == "--math":
+            opts["math_file"] = next(args)
+        elif g == "--stints":
+            opts["stints"] = True
+        elif g == "--pipeline":
+            opts["pipeline"] = True
+        elif g == "--decimate":
+            mode = next(args)
+            opts["decimation"] = None if mode == "none" else mode
+        elif g == "--profile":
+            # output.csv diventa la cartella dei target
+            opts["profile"] = next(args)
+        else:
+            k, v = g.split("=")
+            opts["group_hz"][k] = int(v)
+    return opts
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 3:
+        print("Uso: python duckdb_to_motec_unified.py file.duckdb output.csv Driver=100 Tyres=20 ... [--ld output.ld] [--progress] [--threads N] [--pyramid] [--lap-stats csv|parquet] [--align] [--math file.txt] [--stints] [--pipeline] [--decimate mean|minmax|fir|none]")
+        print("     python duckdb_to_motec_unified.py file.duckdb cartella_output --profile profilo.json [--progress] [--threads N]")
+        sys.exit(1)
 
-    # Beacon + LapTime + Lap
-    lap_series = detect_laps(out)
-    if lap_series is None:
-        out["Lap"] = 1
-        out["Beacon"] = 0
-        out["LapTime"] = out["Time"]
+    opts = parse_args(argv)
+    if "profile" in opts:
+        export(opts["db"], opts["profile"], opts["out_csv"], opts.get("progress"), opts.get("threads"))
     else:
-        out["Lap"] = lap_series
-        beacon = (lap_series.diff().fillna(1) != 0).astype(int)
-        beacon.iloc[0] = 1
-        out["Beacon"] = beacon
-        out["LapTime"] = out["Time"] - out.groupby(lap_series)["Time"].transform("min")
-
-    # Ordine colonne
-    cols = ["Time", "Beacon", "LapTime"] + [c for c in out.columns if c not in ("Time", "Beacon", "LapTime")]
-    out[cols].to_csv(out_csv, index=False, float_format="%.6f")
-    print("OK ->", out_csv)
-
-    # META: units + decimals
-    meta_rows = []
-    for c in cols:
-        if c in ("Time", "Beacon", "LapTime"):
-            continue
-        u, d = guess_units_decimals(c)
-        meta_rows.append((c, u, d))
+        convert(**opts)
+
+def convert(db: str, out_csv: str, group_hz: dict, out_ld: str = None, progress=None,
+            threads: int = None, pyramid: bool = False, lap_stats: str = None,
+            align: bool = False, math_file: str = None, stints: bool = False,
+            pipeline: bool = False, decimation: str = None):
+    """Converte una sessione .duckdb in CSV (+ meta) e opzionalmente .ld; usabile come libreria.
+
+    progress: callback opzionale che riceve gli eventi di avanzamento (vedi progress.Progress)
+    threads: thread di DuckDB (default: tutti i core), per più conversioni in parallelo
+    pyramid: scrive accanto al .ld il sidecar .pyr con min/max/media a più risoluzioni
+    lap_stats: "csv" o "parquet", scrive <output>_laps con le statistiche per giro e canale
+    align: aggiunge i canali Lap Distance e Delta Time e scrive <output>_aligned.npz con i giri
+        allineati sulla distanza
+    math_file: file di espressioni dei canali matematici da scrivere come canali veri
+    stints: scrive anche un .ld per stint accanto al .ld della sessione
+    pipeline: lettura, ricampionamento e scrittura del .ld sovrapposti (vedi extract_pipelined),
+        ogni canale è scritto nel .ld appena pronto
+    decimation: filtro anti-aliasing per le tabelle campionate più fitte degli Hz del loro gruppo,
+        "mean", "minmax" (picchi conservati) o "fir"; None (default, come prima dei filtri) per
+        interpolare senza filtro
+    """
+    pyramid = pyramid and bool(out_ld)
+    stints = stints and bool(out_ld)
+    skip = ({"ld"} if not out_ld else set()) | ({"pyramid"} if not pyramid else set()) | \
+        ({"stats"} if not lap_stats else set()) | ({"align"} if not align else set()) | \
+        ({"math"} if not math_file else set()) | ({"stints"} if not stints else set())
+    stages = [(name, weight) for name, weight in STAGES if name not in skip]
+    steps = Progress(stages, progress)
+    steps.stage("scan")
+    # Master Hz = max
+    master_hz = max(group_hz.values())
+    dt = 1.0 / master_hz
 
-    meta_path = out_csv.replace(".csv", ".meta.csv")
-    pd.DataFrame(meta_rows, columns=["channel", "units", "decimals"]).to_csv(meta_path, index=False)
-    print("META ->", meta_path)
+    config = {"threads": threads} if threads else {}
+    con = duckdb.connect(db, read_only=True, config=config)
+    stream = None
+    try:
+        try:
+            tables, gps_end, counts = scan_session(con)
+            master_time = np.arange(0.0, session_end(gps_end, counts, master_hz) + dt, dt, dtype=float)
+
+            # Tabelle da estrarre, per avere il totale dall'inizio
+            work = matching_tables(tables, group_hz)
+            steps.stage("extract", len(work))
+            data = {"Time": master_time}
+
+            # Per evitare duplicati se due gruppi matchano lo stesso canale/tabella
+            added_cols = set()
+
+            if pipeline:
+                if out_ld:
+                    from ldparser.ldparser import ldChan, ldHead, ldStream
+
+                    # spazio per i metadati di tutti i canali possibili: colonne + Beacon/LapTime/Lap
+                    # (+ Lap Distance/Delta Time), così i dati possono seguire subito
+                    n_columns = column_counts(con, {t for _, _, t in work})
+                    reserve = sum(n_columns.values()) + 3 + (2 if align else 0)
+                    stream = ldStream(out_ld, ldHead.create(event=os.path.splitext(os.path.basename(db))[0]), reserve)
+
+                    def on_channel(name, values):
+                        # Beacon/LapTime/Lap sono ricalcolati dopo l'estrazione
+                        if name not in ("Beacon", "LapTime", "Lap"):
+                            stream.add(ldChan.from_array(name, values, ld_spec([name], master_hz)[name], master_hz))
+                else:
+                    def on_channel(name, values):
+                        pass
+                data.update(extract_pipelined(con, work, master_time, steps, on_channel, decimation))
+            else:
+                for group, hz, t in work:
+                    df = con.execute(f'SELECT * FROM "{t}"').fetchdf()
+                    steps.advance(rows=len(df), nbytes=int(df.memory_usage(index=False).sum()))
+                    resample_table(df, t, hz, master_time, data, added_cols, decimation)
+        finally:
+            con.close()
+
+        steps.stage("laps")
+        out = pd.DataFrame(data).ffill().fillna(0)
+
+        # Beacon + LapTime + Lap
+        out["Beacon"], out["LapTime"], out["Lap"], _ = compute_lap_channels(out)
+
+        # Distanza sul giro, delta sul giro di riferimento e matrice dei giri allineati
+        if align:
+            steps.stage("align")
+            aligned_path = add_alignment(out, out_csv)
+            if aligned_path:
+                print("ALIGNED ->", aligned_path)
+
+        # Canali matematici, dopo giri e distanza così le espressioni possono usarli
+        units = {}
+        if math_file:
+            steps.stage("math")
+            units = add_math_channels(out, math_file)
+            print("MATH ->", len(units), "canali")
+
+        # Statistiche per giro x canale, dagli stessi array e dai giri appena calcolati
+        if lap_stats:
+            steps.stage("stats")
+            stats_path = write_lap_stats(out, out_csv, lap_stats)
+            print("LAP STATS ->", stats_path)
+
+        # Ordine colonne
+        cols = ordered_columns(out)
+        steps.stage("csv")
+        csv_job = None
+        if pipeline:
+            # il CSV, la scrittura più lenta, va in parallelo a .ld, stint e piramide
+            from concurrent.futures import ThreadPoolExecutor
+            csv_pool = ThreadPoolExecutor(max_workers=1)
+            csv_job = csv_pool.submit(write_csv, out[cols], out_csv, units)
+            csv_pool.shutdown(wait=False)
+        else:
+            meta_path = write_csv(out[cols], out_csv, units)
+            print("OK ->", out_csv)
+            print("META ->", meta_path)
+
+        # MoTeC .ld diretto, senza passare dal CSV
+        if out_ld:
+            steps.stage("ld")
+            if stream is not None:
+                # i canali estratti sono già nel file, restano quelli calcolati (o sovrascritti) dopo
+                written = {c.name for c in stream.channs} - set(units) - {"Lap Distance", "Delta Time"}
+                spec = ld_spec(cols, master_hz, units)
+                for c in cols[1:]:
+                    if c not in written:
+                        stream.add(ldChan.from_array(c, out[c].to_numpy(), spec[c], master_hz))
+                stream.close(order=cols[1:])
+            else:
+                write_ld(out[cols], out_ld, master_hz, units, event=os.path.splitext(os.path.basename(db))[0])
+            print("LD ->", out_ld)
+    except BaseException:
+        # il .ld in streaming è scritto in <file>.part: niente .ld troncati se la conversione fallisce
+        if stream is not None:
+            stream.abort()
+        raise
+
+    # Un .ld per stint, scritti in parallelo dagli stessi array
+    if stints:
+        steps.stage("stints")
+        for path in write_stints(out[cols], out_ld, master_hz, units, threads,
+                                 event=os.path.splitext(os.path.basename(db))[0]):
+            print("STINT ->", path)
+
+    # Piramide min/max/media dagli stessi array ricampionati
+    if pyramid:
+        steps.stage("pyramid")
+        pyr_path = write_pyramid(out[cols], out_ld, master_hz)
+        print("PYRAMID ->", pyr_path)
+
+    if csv_job is not None:
+        meta_path = csv_job.result()
+        print("OK ->", out_csv)
+        print("META ->", meta_path)
+
+    steps.finish()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,36 @@
+"""Test data shared by the test modules."""
+import datetime
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from ldparser.ldparser import ldChan, ldData, ldHead
+
+
+def make_ld_data(channels):
+    """ channels: list of (name, dtype, freq, dec, data) """
+    head = ldHead(0x3448, 0, 0, None, "driver", "vehicle", "venue",
+                  datetime.datetime(2024, 6, 15, 16, 0, 0), "comment", "event", "race")
+    channs = []
+    for name, dtype, freq, dec, data in channels:
+        chan = ldChan(None, 0, 0, 0, 0, len(data) if hasattr(data, "__len__") else 0,
+                      dtype, freq, 0, 1, 1, dec, name, name[:8], "")
+        chan._data = data
+        channs.append(chan)
+    return ldData(head, channs)
+
+
+def make_session(path, duration=60.0):
+    con = duckdb.connect(path)
+    tables = {
+        "GPS Time": (10, 1000 + np.arange(0, duration, 0.1)),
+        "Throttle Pos": (100, np.linspace(0, 100, int(duration * 100))),
+        "Ground Speed": (100, np.full(int(duration * 100), 150.0)),
+        "Track Temperature": (10, np.full(int(duration * 10), 30.0)),
+    }
+    for name, (_, values) in tables.items():
+        con.register("df", pd.DataFrame({"value": values}))
+        con.execute(f'CREATE TABLE "{name}" AS SELECT * FROM df')
+        con.unregister("df")
+    con.close()
@@ -0,0 +1,189 @@
+import itertools
+import threading
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# States a job can be retried from
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job(object):
+    """ A conversion of one session with its own group/Hz profile, written to output (a path
+    without extension, chosen by the caller). """
+    _ids = itertools.count(1)
+
+    def __init__(self, db, group_hz, output=None, **options):
+        self.id = next(self._ids)
+        self.db = db
+        self.group_hz = dict(group_hz)
+        self.output = output
+        self.options = options
+        self.status = QUEUED
+        self.threads = 0
+        self.percent = 0.0
+        self.message = ""
+        self.cancel = None
+        # incremented on every start, so events of a cancelled run are ignored after a retry
+        self.runs = 0
+
+    def __repr__(self):
+        return "Job(%d, %s, %s)" % (self.id, self.db, self.status)
+
+
+class JobQueue(object):
+    """ Runs queued conversion jobs concurrently within a budget of cores.
+
+    run_job(job, threads, callback) starts a job in the background and returns a function which
+    cancels it; callback(event) must then be called with 'progress' events and finally an 'end' or
+    'error' event (from any thread). When jobs are started the free cores are shared evenly between
+    the jobs waiting to run, each job getting its share as `threads`, so the running jobs never use
+    more than `cores` in total. on_change(job) is called whenever a job changes.
+    """
+    def __init__(self, run_job, cores=1, on_change=None):
+        self.run_job = run_job
+        self.cores = max(1, cores)
+        self.on_change = on_change
+        self.jobs = []
+        self.running = False
+        self.lock = threading.RLock()
+
+    def add(self, db, group_hz, output=None, **options):
+        job = Job(db, group_hz, output, **options)
+        with self.lock:
+            self.jobs.append(job)
+        self._changed(job)
+        self.schedule()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job.id == job_id:
+                    return job
+        raise KeyError(job_id)
+
+    def start(self, cores=None):
+        """ Starts running the queued jobs, optionally with a new budget of cores. """
+        with self.lock:
+            if cores is not None:
+                self.cores = max(1, cores)
+            self.running = True
+        self.schedule()
+
+    def pause(self):
+        """ Stops starting new jobs, the running ones carry on. """
+        with self.lock:
+            self.running = False
+
+    def cancel(self, job_id):
+        """ Cancels a queued or running job. """
+        with self.lock:
+            job = self.get(job_id)
+            if job.status not in (QUEUED, RUNNING):
+                return
+            cancel, job.cancel = job.cancel, None
+            job.status, job.threads = CANCELLED, 0
+            job.message = "Cancelled"
+        if cancel:
+            cancel()
+        self._changed(job)
+        self.schedule()
+
+    def retry(self, job_id):
+        """ Queues a finished job again, at the end of the queue. """
+        with self.lock:
+            job = self.get(job_id)
+            if job.status not in FINISHED:
+                return
+            self.jobs.remove(job)
+            self.jobs.append(job)
+            job.status, job.percent, job.message = QUEUED, 0.0, ""
+        self._changed(job)
+        self.schedule()
+
+    def remove(self, job_id):
+        """ Removes a job from the list, cancelling it first if needed. """
+        self.cancel(job_id)
+        with self.lock:
+            job = self.get(job_id)
+            self.jobs.remove(job)
+        self._changed(job)
+
+    def move(self, job_id, offset):
+        """ Moves a job up (negative offset) or down the list, changing the order jobs start in. """
+        with self.lock:
+            job = self.get(job_id)
+            index = self.jobs.index(job)
+            new_index = min(max(index + offset, 0), len(self.jobs) - 1)
+            self.jobs.insert(new_index, self.jobs.pop(index))
+        self._changed(job)
+
+    def busy_cores(self):
+        return sum(job.threads for job in self.jobs if job.status == RUNNING)
+
+    def percent(self):
+        """ Overall completion of the jobs which weren't cancelled. """
+        with self.lock:
+            jobs = [job for job in self.jobs if job.status != CANCELLED]
+            if not jobs:
+                return 0.0
+            return sum(100.0 if job.status == DONE else job.percent for job in jobs) / len(jobs)
+
+    def schedule(self):
+        """ Starts as many queued jobs as the free cores allow, in list order. """
+        started = []
+        with self.lock:
+            if not self.running:
+                return
+            free = self.cores - self.busy_cores()
+            queued = [job for job in self.jobs if job.status == QUEUED]
+            while queued and free > 0:
+                threads = free // min(len(queued), free)
+                job = queued.pop(0)
+                job.status, job.threads, job.message = RUNNING, threads, ""
+                job.runs += 1
+                free -= threads
+                started.append(job)
+
+        for job in started:
+            self._changed(job)
+            cancel = self.run_job(job, job.threads, self._callback(job))
+            with self.lock:
+                cancelled = job.status == CANCELLED
+                if job.status == RUNNING:
+                    job.cancel = cancel
+            if cancelled and cancel:
+                # cancelled while it was starting
+                cancel()
+
+    def _callback(self, job):
+        run = job.runs
+
+        def callback(event):
+            with self.lock:
+                if job.status != RUNNING or job.runs != run:
+                    return
+                etype = event["type"]
+                if etype == "progress":
+                    job.percent = event["progress"]["percent"]
+                    job.message = event["progress"]["stage"]
+                elif etype == "end":
+                    job.status, job.percent, job.message = DONE, 100.0, ""
+                elif etype == "error":
+                    job.status, job.message = FAILED, event.get("error", "")
+                else:
+                    return
+                if job.status != RUNNING:
+                    job.threads, job.cancel = 0, None
+            self._changed(job)
+            if job.status != RUNNING:
+                self.schedule()
+        return callback
+
+    def _changed(self, job):
+        if self.on_change:
+            self.on_change(job)
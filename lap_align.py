@@ -0,0 +1,100 @@
+import numpy as np
+
+from lap_stats import lap_starts
+
+# Spacing of the common distance grid laps are aligned on (m)
+GRID_STEP = 5.0
+
+# Laps shorter than this fraction of the median lap distance are out/in laps or partial
+COMPLETE_LAP = 0.95
+
+
+def lap_index(lap):
+    """0 based index of the lap of each sample (laps being runs of equal lap numbers)."""
+    index = np.zeros(len(lap), dtype=np.int64)
+    index[lap_starts(lap)[1:]] = 1
+    return np.cumsum(index)
+
+
+def lap_distance(time, lap, speed=None, speed_scale=1 / 3.6, distance=None):
+    """Distance from the start of the lap of every sample (m).
+
+    Uses distance (e.g. the sim's lap distance) when given, made non decreasing
+    within each lap, otherwise integrates speed (converted to m/s by
+    speed_scale, km/h by default) with the trapezoidal rule, restarting at 0
+    on every lap. Both are a couple of whole-array operations.
+    """
+    index = lap_index(lap)
+    starts = lap_starts(lap)
+
+    if distance is not None:
+        d = np.nan_to_num(np.asarray(distance, dtype=np.float64))
+        d = d - d[starts][index]
+    else:
+        time = np.asarray(time, dtype=np.float64)
+        v = np.nan_to_num(np.asarray(speed, dtype=np.float64)) * speed_scale
+        steps = np.zeros(len(time))
+        steps[1:] = 0.5 * (v[1:] + v[:-1]) * np.diff(time)
+        total = np.cumsum(steps)
+        d = total - total[starts][index]
+
+    # offsetting each lap by more than any lap distance makes a single running maximum per lap
+    span = (np.abs(d).max() if len(d) else 0.0) * 2 + 1.0
+    return np.maximum.accumulate(d + index * span) - index * span
+
+
+def align(distance, lap, channels, step=GRID_STEP):
+    """Resamples every lap of every channel onto a common distance grid.
+
+    All the laps are laid end to end on a single axis (lap index x span +
+    distance), so each channel takes one np.interp call for all its laps.
+    Grid points a lap doesn't reach are NaN.
+
+    Returns (grid, laps, matrices) with matrices a dict of name -> array of
+    shape (laps, grid points).
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    lap = np.asarray(lap)
+    index = lap_index(lap)
+    starts = lap_starts(lap)
+    n_laps = len(starts)
+
+    top = np.maximum.reduceat(distance, starts) if n_laps else np.zeros(0)
+    grid = np.arange(0.0, (top.max() if n_laps else 0.0) + step, step)
+    span = grid[-1] + 2 * step
+
+    x = distance + index * span
+    query = (grid[None, :] + (np.arange(n_laps) * span)[:, None]).ravel()
+    outside = (grid[None, :] > top[:, None]).ravel()
+
+    matrices = {}
+    for name, values in channels.items():
+        aligned = np.interp(query, x, np.asarray(values, dtype=np.float64))
+        aligned[outside] = np.nan
+        matrices[name] = aligned.reshape(n_laps, len(grid))
+    return grid, lap[starts], matrices
+
+
+def reference_lap(distance, lap, lap_time):
+    """Index of the fastest complete lap, by its last lap time sample."""
+    starts = lap_starts(lap)
+    ends = np.append(starts[1:], len(lap)) - 1
+    top = np.maximum.reduceat(np.asarray(distance, dtype=np.float64), starts)
+    duration = np.asarray(lap_time, dtype=np.float64)[ends]
+    complete = top >= COMPLETE_LAP * np.median(top)
+    return int(np.argmin(np.where(complete, duration, np.inf)))
+
+
+def delta_time(distance, lap, lap_time, reference=None, step=GRID_STEP):
+    """Time delta of every sample to the reference lap at the same distance (s).
+
+    The lap time of the reference lap (the fastest complete one by default)
+    is put on the distance grid once, then looked up for all samples with one
+    interpolation. Positive values are slower than the reference.
+    """
+    if reference is None:
+        reference = reference_lap(distance, lap, lap_time)
+    grid, _, matrices = align(distance, lap, {"t": lap_time}, step)
+    ref = matrices["t"][reference]
+    valid = np.isfinite(ref)
+    return np.asarray(lap_time, dtype=np.float64) - np.interp(distance, grid[valid], ref[valid])
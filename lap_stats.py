@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# Throttle above this (%) counts as full throttle
+FULL_THROTTLE = 98.0
+
+STATS = ("min", "max", "mean", "first", "last", "integral")
+
+
+def lap_starts(lap):
+    """Indices where each lap starts, laps being consecutive runs of equal numbers."""
+    lap = np.asarray(lap)
+    if not len(lap):
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate([[0], np.flatnonzero(lap[1:] != lap[:-1]) + 1])
+
+
+def lap_channel_stats(time, lap, channels):
+    """Per lap x per channel aggregates, in one reduceat pass per channel.
+
+    time: sample times (s), lap: lap number of each sample, channels: dict of
+    name -> array of samples. Returns a long DataFrame with one row per lap and
+    channel: lap, start, duration, samples, channel, min, max, mean, first, last and
+    integral (sum of value x sample period, e.g. distance from speed, or
+    seconds for a 0/1 channel). NaN samples are ignored.
+    """
+    columns = ["lap", "start", "duration", "samples", "channel"] + list(STATS)
+    time = np.asarray(time, dtype=np.float64)
+    starts = lap_starts(lap)
+    if not len(starts) or not channels:
+        return pd.DataFrame(columns=columns)
+    ends = np.append(starts[1:], len(time))
+    counts = ends - starts
+
+    if len(time) > 1:
+        dt = np.diff(time, append=time[-1] + (time[-1] - time[-2]))
+    else:
+        dt = np.ones(len(time))
+    lap_start = time[starts]
+    duration = np.add.reduceat(dt, starts)
+
+    frames = []
+    for name, values in channels.items():
+        y = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(y)
+        clean = np.where(finite, y, 0.0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.add.reduceat(clean, starts) / np.add.reduceat(finite, starts)
+        frames.append(pd.DataFrame({
+            "lap": np.asarray(lap)[starts],
+            "start": lap_start,
+            "duration": duration,
+            "samples": counts,
+            "channel": name,
+            # fmin/fmax skip NaN samples
+            "min": np.fmin.reduceat(y, starts),
+            "max": np.fmax.reduceat(y, starts),
+            "mean": mean,
+            "first": y[starts],
+            "last": y[ends - 1],
+            "integral": np.add.reduceat(clean * dt, starts),
+        }))
+
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def derived_channels(out):
+    """Extra 0/1 channels whose integral answers common questions (time at full throttle)."""
+    extra = {}
+    throttle = [c for c in out.columns if c.lower().startswith("throttle")]
+    if throttle:
+        extra["Full Throttle"] = (out[throttle[0]].to_numpy() >= FULL_THROTTLE).astype(np.float64)
+    return extra
+
+
+def write_lap_stats(stats, filename, fmt="csv"):
+    """Writes the table as CSV or Parquet, returns the file name."""
+    if fmt == "parquet":
+        stats.to_parquet(filename, index=False)
+    else:
+        stats.to_csv(filename, index=False, float_format="%.6f")
+    return filename
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from ldparser.ldparser import ldData
+
+DESCRIPTION = """Builds and queries a catalog of the headers of MoTeC .ld files"""
+
+EPILOG = """'index' scans a directory tree for .ld files and stores their header (driver, vehicle,
+venue, event, session, date) and channel list in a SQLite catalog. Only the headers are read, and
+files whose size and modification time didn't change since the last run are skipped.
+
+'query' lists the cataloged files matching all the given filters. Text filters match any part of
+the field, ignoring case, and '--channel' may be repeated to require several channels.
+"""
+
+DEFAULT_CATALOG = "ld_catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    driver TEXT,
+    vehicle TEXT,
+    venue TEXT,
+    event TEXT,
+    session TEXT,
+    short_comment TEXT,
+    datetime TEXT,
+    n_channels INTEGER,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS channels (
+    path TEXT REFERENCES files(path) ON DELETE CASCADE,
+    name TEXT,
+    units TEXT,
+    freq INTEGER,
+    n_samples INTEGER
+);
+CREATE INDEX IF NOT EXISTS channels_name ON channels(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS channels_path ON channels(path);
+CREATE INDEX IF NOT EXISTS files_datetime ON files(datetime);
+"""
+
+
+def read_header(path):
+    """ Reads the catalog entry of a single ld file, touching only its header blocks.
+
+    This is defined at module scope so it can be executed in a ProcessPoolExecutor.
+    Returns (file row, channel rows), or None if the file can't be parsed.
+    """
+    stat = os.stat(path)
+    try:
+        with ldData.fromfile(path) as ld_data:
+            head, chans = ld_data.head, ld_data.channs
+    except Exception as e:
+        print("WARNING: could not read %s: %s" % (path, e))
+        return None
+
+    event = head.aux
+    venue = event.venue if event else None
+    vehicle = venue.vehicle if venue else None
+    duration = max([c.data_len / c.freq for c in chans if c.freq] or [0.0])
+
+    file_row = (path, stat.st_size, stat.st_mtime, head.driver,
+                vehicle.id if vehicle and vehicle.id else head.vehicleid,
+                venue.name if venue and venue.name else head.venue,
+                event.name if event and event.name else head.event,
+                event.session if event and event.session else head.session,
+                head.short_comment, head.datetime.isoformat(sep=" "), len(chans), duration)
+    channel_rows = [(path, c.name, c.unit, c.freq, c.data_len) for c in chans]
+    return file_row, channel_rows
+
+
+class LdCatalog(object):
+    """ SQLite catalog of the headers and channel lists of ld files. """
+    def __init__(self, filename=DEFAULT_CATALOG):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, directory, max_workers=None):
+        """ Brings the catalog of a directory tree up to date.
+
+        New and modified files are read in a process pool, entries of files no longer present are
+        removed. Returns the number of (re)indexed and removed files.
+        """
+        directory = os.path.abspath(directory)
+        found = {}
+        for root, _dirs, files in os.walk(directory):
+            for name in files:
+                if name.lower().endswith(".ld"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    found[path] = (stat.st_size, stat.st_mtime)
+
+        known = {row[0]: (row[1], row[2]) for row in self.connection.execute(
+            "SELECT path, size, mtime FROM files WHERE path LIKE ? ESCAPE '\\'",
+            (_like_prefix(directory + os.sep),))}
+
+        changed = [path for path, stamp in found.items() if known.get(path) != stamp]
+        removed = [path for path in known if path not in found]
+
+        if max_workers == 1 or len(changed) < 2:
+            entries = map(read_header, changed)
+            self._store(changed, removed, entries)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                entries = executor.map(read_header, changed, chunksize=64)
+                self._store(changed, removed, entries)
+
+        return len(changed), len(removed)
+
+    def _store(self, changed, removed, entries):
+        with self.connection:
+            self.connection.executemany("DELETE FROM files WHERE path = ?",
+                                        [(p,) for p in changed + removed])
+            for entry in entries:
+                if entry is None:
+                    continue
+                file_row, channel_rows = entry
+                self.connection.execute(
+                    "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", file_row)
+                self.connection.executemany("INSERT INTO channels VALUES (?, ?, ?, ?, ?)",
+                                            channel_rows)
+
+    def query(self, driver=None, vehicle=None, venue=None, event=None, session=None,
+              since=None, until=None, channels=()):
+        """ Returns the rows of the files matching all the given filters.
+
+        Text filters match any part of the field, ignoring case. since and until are dates (or
+        datetimes) in ISO format, until includes the whole day when given as a date. channels are
+        names of channels which must all be present.
+        """
+        where, params = [], []
+        for column, value in (("driver", driver), ("vehicle", vehicle), ("venue", venue),
+                              ("event", event), ("session", session)):
+            if value:
+                where.append("%s LIKE ? ESCAPE '\\'" % column)
+                params.append("%" + _like_escape(value) + "%")
+        if since:
+            where.append("datetime >= ?")
+            params.append(since)
+        if until:
+            where.append("datetime <= ?")
+            params.append(until + " 23:59:59" if len(until) == 10 else until)
+        for channel in channels:
+            where.append("EXISTS (SELECT 1 FROM channels c WHERE c.path = files.path "
+                         "AND c.name = ? COLLATE NOCASE)")
+            params.append(channel)
+
+        sql = "SELECT path, datetime, driver, vehicle, venue, event, session, n_channels, duration " \
+              "FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY datetime"
+        return self.connection.execute(sql, params).fetchall()
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _like_prefix(text):
+    return _like_escape(text) + "%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION, epilog=EPILOG)
+    parser.add_argument("--catalog", type=str, default=DEFAULT_CATALOG, help="Catalog file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="Index the .ld files of a directory tree")
+    index.add_argument("directory", type=str, help="Directory to scan")
+    index.add_argument("--workers", type=int, default=None, \
+        help="Number of worker processes (defaults to CPU count)")
+
+    query = commands.add_parser("query", help="List the cataloged files matching the filters")
+    for field in ("driver", "vehicle", "venue", "event", "session"):
+        query.add_argument("--" + field, type=str, default=None)
+    query.add_argument("--since", type=str, default=None, help="Earliest date, YYYY-MM-DD")
+    query.add_argument("--until", type=str, default=None, help="Latest date, YYYY-MM-DD")
+    query.add_argument("--channel", type=str, action="append", default=[], \
+        help="Channel which must be present, may be repeated")
+    args = parser.parse_args(argv)
+
+    catalog = LdCatalog(os.path.expanduser(args.catalog))
+    try:
+        if args.command == "index":
+            changed, removed = catalog.update(os.path.expanduser(args.directory), args.workers)
+            print("Indexed %d files, removed %d" % (changed, removed))
+        else:
+            rows = catalog.query(args.driver, args.vehicle, args.venue, args.event, args.session,
+                                 args.since, args.until, args.channel)
+            for path, when, driver, vehicle, venue, event, session, n_channels, duration in rows:
+                print("%s  %-16s %-16s %-16s %-16s %-10s %4d ch %8.1fs  %s" % (
+                    when, driver, vehicle, venue, event, session, n_channels, duration, path))
+            print("%d files" % len(rows))
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
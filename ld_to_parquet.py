@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ldparser.ldparser import ldData
+
+DESCRIPTION = """Converts a directory of MoTeC .ld files to Parquet for offline analytics"""
+
+EPILOG = """With the 'wide' layout every file produces one table per sample rate, written to
+'<output>/freq_hz=<rate>/<file>.parquet', with a time column and one column per channel. With the
+'long' layout every file produces a single table '<output>/long/<file>.parquet' with channel, time
+and value columns. Both layouts carry the header metadata (driver, vehicle, venue, event, session,
+date) as columns, so the output directory can be read as one partitioned dataset and readers only
+load the columns they ask for.
+
+Files already converted, with the same size and modification time, are skipped unless '--force' is
+given.
+"""
+
+# Header metadata stored as columns next to the channel data
+META_COLUMNS = ("source", "driver", "vehicle", "venue", "event", "session", "datetime")
+
+# Directory holding a marker per converted file, used to skip it on the next run
+MARKER_DIR = ".converted"
+
+
+def header_metadata(ld_data, filename):
+    """ Returns the header metadata of an ld file as a dict, keyed by META_COLUMNS. """
+    head = ld_data.head
+    return {
+        "source": os.path.basename(filename),
+        "driver": head.driver,
+        "vehicle": head.vehicleid,
+        "venue": head.venue,
+        "event": head.event,
+        "session": head.session,
+        "datetime": head.datetime.isoformat(),
+    }
+
+
+def constant_column(value, length):
+    """ A dictionary encoded column repeating a single value, without materialising it. """
+    indices = pa.array(np.zeros(length, dtype=np.int32))
+    return pa.DictionaryArray.from_arrays(indices, pa.array([value]))
+
+
+def with_metadata(columns, names, metadata, length):
+    """ Appends the metadata columns to lists of columns and column names. """
+    for key in META_COLUMNS:
+        columns.append(constant_column(metadata[key], length))
+        names.append(key)
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def wide_tables(ld_data, metadata):
+    """ Yields (freq, table) for each group of channels sharing a sample rate.
+
+    Channels of a group shorter than the longest one are padded with NaN, channels keep their native
+    dtype otherwise.
+    """
+    channels = sorted(ld_data.channs, key=lambda c: c.freq)
+    for freq, group in groupby(channels, lambda c: c.freq):
+        group = list(group)
+        length = max(c.data_len for c in group)
+
+        columns = [pa.array(np.arange(length) / freq if freq else np.zeros(length))]
+        names = ["time"]
+        for chan in group:
+            data = chan.data
+            if len(data) < length:
+                data = np.concatenate([data.astype(np.float64), np.full(length - len(data), np.nan)])
+            columns.append(pa.array(data))
+            names.append(chan.name)
+
+        yield freq, with_metadata(columns, names, metadata, length)
+
+
+def long_table(ld_data, metadata):
+    """ Returns a single table with one row per sample of every channel. """
+    lengths = [c.data_len for c in ld_data.channs]
+    length = sum(lengths)
+
+    channel = pa.DictionaryArray.from_arrays(
+        pa.array(np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)),
+        pa.array([c.name for c in ld_data.channs]))
+    time = np.concatenate([np.arange(c.data_len) / c.freq if c.freq else np.zeros(c.data_len)
+                           for c in ld_data.channs] or [np.zeros(0)])
+    value = np.concatenate([np.asarray(c.data, dtype=np.float64) for c in ld_data.channs]
+                           or [np.zeros(0)])
+
+    return with_metadata([channel, pa.array(time), pa.array(value)], ["channel", "time", "value"],
+                         metadata, length)
+
+
+def write_table(table, filename):
+    """ Writes a parquet file atomically, so interrupted runs never leave partial files. """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = filename + ".tmp"
+    pq.write_table(table, tmp_filename, compression="zstd")
+    os.replace(tmp_filename, filename)
+
+
+def marker_path(filename, output_dir):
+    return os.path.join(output_dir, MARKER_DIR, os.path.basename(filename) + ".json")
+
+
+def source_stamp(filename):
+    stat = os.stat(filename)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def is_converted(filename, output_dir, layout):
+    """ Whether a file was already converted with the same layout and is unchanged since. """
+    try:
+        with open(marker_path(filename, output_dir), "r") as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return marker.get("layout") == layout and marker.get("source") == source_stamp(filename)
+
+
+def convert_file(filename, output_dir, layout):
+    """ Converts a single ld file, returns the number of tables written.
+
+    This is defined at module scope so it can be executed in a ProcessPoolExecutor.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    with ldData.fromfile(filename) as ld_data:
+        metadata = header_metadata(ld_data, filename)
+        if layout == "long":
+            tables = [(os.path.join(output_dir, "long"), long_table(ld_data, metadata))]
+        else:
+            tables = [(os.path.join(output_dir, "freq_hz=%d" % freq), table)
+                      for freq, table in wide_tables(ld_data, metadata)]
+
+        for table_dir, table in tables:
+            write_table(table, os.path.join(table_dir, stem + ".parquet"))
+
+    marker = marker_path(filename, output_dir)
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, "w") as f:
+        json.dump({"layout": layout, "source": source_stamp(filename)}, f)
+
+    return len(tables)
+
+
+def convert_directory(input_dir, output_dir, layout="wide", max_workers=None, force=False):
+    """ Converts all ld files of a directory in a process pool.
+
+    Returns a dict mapping each converted file to its number of tables, or to the error message if
+    it failed. Files already converted are skipped, unless force is set.
+    """
+    filenames = sorted(glob.glob(os.path.join(input_dir, "*.ld")))
+    if not force:
+        filenames = [f for f in filenames if not is_converted(f, output_dir, layout)]
+
+    results = {}
+    if not filenames:
+        return results
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(convert_file, f, output_dir, layout): f for f in filenames}
+        for future, filename in futures.items():
+            try:
+                results[filename] = future.result()
+            except Exception as e:
+                results[filename] = "ERROR: %s" % e
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION, epilog=EPILOG)
+    parser.add_argument("input_dir", type=str, help="Directory containing .ld files")
+    parser.add_argument("output_dir", type=str, help="Directory to write the parquet dataset to")
+    parser.add_argument("--layout", type=str, default="wide", choices=["wide", "long"], \
+        help="One table per sample rate, or a single long table per file")
+    parser.add_argument("--workers", type=int, default=None, \
+        help="Number of worker processes (defaults to CPU count)")
+    parser.add_argument("--force", action="store_true", help="Convert files already converted")
+    args = parser.parse_args(argv)
+
+    input_dir = os.path.expanduser(args.input_dir)
+    output_dir = os.path.expanduser(args.output_dir)
+    if not os.path.isdir(input_dir):
+        print("ERROR: directory %s does not exist" % input_dir)
+        exit(1)
+
+    results = convert_directory(input_dir, output_dir, args.layout, args.workers, args.force)
+    for filename, result in results.items():
+        print("%s: %s" % (os.path.basename(filename), result))
+    print("Converted %d files" % len(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,23 @@ Code created through reverse engineering the data format.
 """
 
 import datetime
+import mmap
+import os
 import struct
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
+# number of samples converted and written at once when writing channel data
+CHUNK_SIZE = 1 << 20
+
+# pointers to the vehicle, venue and event blocks and to the first channel meta
+# data, as found in files written by MoTeC
+VEHICLE_PTR, VENUE_PTR, EVENT_PTR, META_PTR = 1762, 5078, 8180, 11336
+
+# data types that can be stored in an ld file
+DTYPES = [np.dtype(t) for t in (np.float16, np.float32, np.int16, np.int32)]
+
 
 class ldData(object):
     """Container for parsed data of an ld file.
@@ -18,10 +31,14 @@ class ldData(object):
     def __init__(self, head, channs):
         self.head = head
         self.channs = channs
+        # lap boundaries per beacon channel
+        self._index, self._laps = None, {}
 
     def __getitem__(self, item):
         if not isinstance(item, int):
-            col = [n for n, x in enumerate(self.channs) if x.name == item]
+            if self._index is None or self._index[0] != len(self.channs):
+                self._index = (len(self.channs), index_channels(self.channs))
+            col = self._index[1].get(item, [])
             if len(col) != 1:
                 raise Exception("Could get column", item, col)
             item = col[0]
@@ -30,6 +47,59 @@ class ldData(object):
     def __iter__(self):
         return iter([x.name for x in self.channs])
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """Release the memory map of the file the data was read from
+
+        The channels drop their views of the map and read their data from the
+         file again if accessed afterwards. The map is closed right away unless
+         arrays taken from the channels still view it, then it is released
+         together with the last of them.
+        """
+        maps = {}
+        for chan in self.channs:
+            if chan._buf is not None:
+                maps[id(chan._buf)] = chan._buf
+                chan._buf, chan._data = None, None
+        for buf in maps.values():
+            close_map(buf)
+
+    @classmethod
+    def from_frame(cls, source, spec=None, freq=10, head=None, **meta):
+        # type: (object, dict, int, ldHead, ...) -> ldData
+        """Create an ldData object from a table of channels
+
+        source is a pandas DataFrame, a pyarrow Table or a dict of numpy arrays,
+         one channel per (numeric) column. Columns may differ in length.
+        spec maps column names to a dict of per channel settings, all optional:
+         name, short_name, units, freq, dtype and decimals. Without an explicit
+         dtype, channels with decimals are quantised to the smallest fitting
+         int type, others keep their dtype if it can be stored, else float32.
+        The header is either given as head or built from meta, see ldHead.create.
+
+        The channels reference the source columns without copying them, any
+         conversion to the stored dtype happens chunk-wise when writing.
+        """
+        spec = spec or {}
+        if head is None:
+            head = ldHead.create(**meta)
+
+        channs = []
+        for col, data in iter_columns(source):
+            chan = ldChan.from_array(col, data, spec.get(col, {}), freq)
+            if chan is not None:
+                channs.append(chan)
+
+        l = cls(head, channs)
+        l.layout()
+        return l
+
     @classmethod
     def frompd(cls, df):
         # type: (pd.DataFrame) -> ldData
@@ -56,49 +126,17 @@ class ldData(object):
 
         """
 
-        # for now, fix datatype and frequency
-        freq, dtype = 10, np.float32
-
-        # pointer to meta data of first channel
-        meta_ptr = struct.calcsize(ldHead.fmt)
-
-        # list of columns to read - only accept numeric data
+        # for now, fix datatype, frequency and units
         cols = [c for c in df.columns if np.issubdtype(df[c].dtype, np.number)]
-
-        # pointer to data of first channel
-        chanheadsize = struct.calcsize(ldChan.fmt)
-        data_ptr = meta_ptr + len(cols) * chanheadsize
+        spec = {c: dict(dtype=np.float32, short_name=c, units="m") for c in cols}
 
         # create a mocked header
-        head = ldHead(meta_ptr, data_ptr, 0,  None,
+        head = ldHead(struct.calcsize(ldHead.fmt), 0, 0,  None,
                        "testdriver",  "testvehicleid", "testvenue",
                        datetime.datetime.now(),
                        "just a test", "testevent", "practice")
 
-        # create the channels, meta data and associated data
-        channs, prev, next = [], 0, meta_ptr + chanheadsize
-        for n, col in enumerate(cols):
-            # create mocked channel header
-            chan = ldChan(None,
-                          meta_ptr, prev, next if n < len(cols)-1 else 0,
-                          data_ptr, len(df[col]),
-                          dtype, freq, 0, 1, 1, 0,
-                          col, col, "m")
-
-            # link data to the channel
-            chan._data = df[col].to_numpy(dtype)
-
-            # calculate pointers to the previous/next channel meta data
-            prev = meta_ptr
-            meta_ptr = next
-            next += chanheadsize
-
-            # increment data pointer for next channel
-            data_ptr += chan._data.nbytes
-
-            channs.append(chan)
-
-        return cls(head, channs)
+        return cls.from_frame(df[cols], spec, freq=10, head=head)
 
     @classmethod
     def fromfile(cls, f):
@@ -107,19 +145,180 @@ class ldData(object):
         """
         return cls(*read_ldfile(f))
 
+    def laps(self, beacon="Beacon"):
+        # type: (str) -> np.array
+        """Start times of the laps, taken from the pulses of the beacon channel
+
+        Returns the boundaries of all laps in seconds: lap n (counting from 1)
+         spans [laps[n-1], laps[n]). The first lap starts at 0 and the last one
+         ends with the beacon channel.
+        """
+        if beacon not in self._laps:
+            chan = self[beacon]
+            pulses = np.flatnonzero(chan.data) / chan.freq
+            end = chan.data_len / chan.freq
+            self._laps[beacon] = np.unique(np.concatenate(([0.], pulses[pulses < end], [end])))
+        return self._laps[beacon]
+
+    def lap_window(self, lap, beacon="Beacon"):
+        # type: (int, str) -> (float, float)
+        """Start and end time [s] of a lap, counting from 1
+        """
+        laps = self.laps(beacon)
+        if not 1 <= lap < len(laps):
+            raise IndexError("Lap %i not in file, %i laps" % (lap, len(laps) - 1))
+        return laps[lap - 1], laps[lap]
+
+    def read_lap(self, item, lap, beacon="Beacon"):
+        # type: (str, int, str) -> np.array
+        """Read the samples of a channel during a single lap only
+        """
+        return self[item].read_time(*self.lap_window(lap, beacon))
+
+    def layout(self):
+        # type: () -> int
+        """Compute the file layout of the channels, starting at the header's meta pointer
+
+        Updates the header's data pointer and returns the total size of the file.
+        """
+        self.head.data_ptr, end = layout_channels(self.channs, self.head.meta_ptr)
+        return end
+
     def write(self, f):
         # type: (str) -> ()
         """Write an ld file containing the current header information and channel data
+
+        The layout of all channels is planned first, then the headers are written
+         and the data of each channel is streamed from its source into its
+         precomputed offset, see ldChan.write_data.
         """
+        self.layout()
 
-        # convert the data using scale/shift etc before writing the data
-        conv_data = lambda c: ((c.data / c.mul) - c.shift) * c.scale / pow(10., -c.dec)
+        with open(f, 'wb') as f_:
+            self.write_headers(f_)
+            list(map(lambda c: c.write_data(f_), self.channs))
+
+    def write_headers(self, f_):
+        # type: (file) -> ()
+        """Write the header and the channel meta data, the layout must be planned already
+        """
+        self.head.write(f_, len(self.channs))
+        f_.seek(self.channs[0].meta_ptr)
+        list(map(lambda c: c[1].write(f_, c[0]), enumerate(self.channs)))
+
+    def allocate(self, f):
+        # type: (str) -> int
+        """Plan the layout and create the ld file at its full size
+
+        Only the headers are written, the channel data regions are left zeroed
+         to be filled in place, e.g. through a memory map. Returns the file size.
+        """
+        size = self.layout()
 
         with open(f, 'wb') as f_:
-            self.head.write(f_, len(self.channs))
-            f_.seek(self.channs[0].meta_ptr)
-            list(map(lambda c: c[1].write(f_, c[0]), enumerate(self.channs)))
-            list(map(lambda c: f_.write(conv_data(c)), self.channs))
+            self.write_headers(f_)
+            f_.truncate(size)
+        return size
+
+    def write_mapped(self, f, max_workers=None):
+        # type: (str, int) -> ()
+        """Write an ld file, filling the channel data through a memory map
+
+        The file is preallocated at its planned size and a pool of threads
+         converts the channels into their own, disjoint byte ranges of the map.
+        """
+        self.allocate(f)
+        self.fill(f, self.channs, max_workers)
+
+    def fill(self, f, channs, max_workers=None):
+        # type: (str, list, int) -> ()
+        """Fill the data regions of some channels of a file created with allocate
+
+        Each channel is converted by a pool of threads straight into its own
+         byte range of a memory map of the file.
+        """
+        channs = [c for c in channs if c.data_len > 0]
+        if not channs:
+            return
+
+        buf = np.memmap(f, dtype=np.uint8, mode='r+')
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(lambda c: c.fill(buf), channs))
+            buf.flush()
+        finally:
+            del buf
+
+
+class ldStream(object):
+    """Writes an ld file channel by channel, as the channels become available
+
+    Room for the meta data of reserve channels is left after the header and
+     the data of every added channel is written right away after the data of
+     the previous one, so a producer can hand over (and then drop) each
+     channel as soon as it is computed, without knowing the final channel
+     list. The header and the linked meta data are written by close; if more
+     channels than reserved were added, the meta data goes after the data.
+
+    The file is written as f + '.part' and only renamed to f by close, so a
+     producer failing half way leaves any previous f untouched; abort removes
+     the partial file.
+    """
+
+    def __init__(self, f, head, reserve):
+        # type: (str, ldHead, int) -> ()
+        self.f = f
+        self.part = f + '.part'
+        self.head = head
+        self.reserve = reserve
+        self.channs = []
+        self.data_end = head.meta_ptr + reserve * struct.calcsize(ldChan.fmt)
+        self.head.data_ptr = self.data_end
+        # the file is opened for each write only, nothing stays open between them
+        open(self.part, 'wb').close()
+
+    def add(self, chan):
+        # type: (ldChan) -> ()
+        """Write the data of a channel, e.g. made with ldChan.from_array
+
+        A channel added again with the same name replaces the previous one
+         (its data stays in the file, unreferenced).
+        """
+        chan.data_ptr = self.data_end
+        with open(self.part, 'r+b') as f_:
+            chan.write_data(f_)
+        self.data_end += chan.data_len * np.dtype(chan.dtype).itemsize
+        # the data is in the file, only the meta data is kept
+        chan._data = None
+        self.channs = [c for c in self.channs if c.name != chan.name] + [chan]
+
+    def close(self, order=None):
+        # type: (list) -> ()
+        """Write the header and the meta data of the channels, in the order
+         of the channel names given (the others follow in the order added)
+        """
+        channs = self.channs
+        if order is not None:
+            rank = {name: n for n, name in enumerate(order)}
+            channs = sorted(channs, key=lambda c: rank.get(c.name, len(rank)))
+
+        if len(channs) > self.reserve:
+            self.head.meta_ptr = self.data_end
+        link_channels(channs, self.head.meta_ptr)
+
+        with open(self.part, 'r+b') as f_:
+            self.head.write(f_, len(channs))
+            f_.seek(self.head.meta_ptr)
+            list(map(lambda c: c[1].write(f_, c[0]), enumerate(channs)))
+        os.replace(self.part, self.f)
+        self.channs = channs
+
+    def abort(self):
+        # type: () -> ()
+        """Remove the partial file of a stream which won't be closed
+        """
+        if os.path.exists(self.part):
+            os.remove(self.part)
 
 
 class ldEvent(object):
@@ -249,6 +448,22 @@ class ldHead(object):
         self.venue, self.datetime, self.short_comment, self.event, self.session = meta_ptr, data_ptr, aux_ptr, aux, \
                                                 driver, vehicleid, venue, datetime, short_comment, event, session
 
+    @classmethod
+    def create(cls, driver="", vehicleid="", venue="", date_time=None, short_comment="",
+               event="", session="", long_comment="", vehicle_weight=0, vehicle_type="",
+               vehicle_comment=""):
+        # type: (...) -> ldHead
+        """Create a header, with its event, venue and vehicle blocks
+
+        The blocks are placed at the pointers found in files written by MoTeC,
+         the first channel meta data follows at META_PTR.
+        """
+        vehicle = ldVehicle(vehicleid, vehicle_weight, vehicle_type, vehicle_comment)
+        venue_ = ldVenue(venue, VEHICLE_PTR, vehicle)
+        event_ = ldEvent(event, session, long_comment, VENUE_PTR, venue_)
+        return cls(META_PTR, META_PTR, EVENT_PTR, event_, driver, vehicleid, venue,
+                   date_time or datetime.datetime.now(), short_comment, event, session)
+
     @classmethod
     def fromfile(cls, f):
         # type: (file) -> ldHead
@@ -327,8 +542,11 @@ class ldChan(object):
                  name, short_name, unit):
 
         self._f = _f
+        self._buf = None
         self.meta_ptr = meta_ptr
         self._data = None
+        # where the data is in the file read from, data_ptr moves when the channel is laid out anew
+        self._src_ptr = data_ptr
 
         (self.prev_meta_ptr, self.next_meta_ptr, self.data_ptr, self.data_len,
         self.dtype, self.freq,
@@ -338,6 +556,36 @@ class ldChan(object):
                                                  shift, mul, scale, dec,\
                                                  name, short_name, unit
 
+    @classmethod
+    def from_array(cls, col, data, spec=None, freq=10):
+        # type: (str, np.array, dict, int) -> ldChan
+        """Create a channel referencing an array, see ldData.from_frame for spec
+
+        Returns None if the array isn't a one dimensional numeric array.
+        """
+        if not np.issubdtype(data.dtype, np.number) or data.ndim != 1:
+            return None
+
+        s_ = spec or {}
+        dec = s_.get('decimals', 0)
+        dtype = s_.get('dtype')
+        if dtype is None and 'decimals' in s_ and len(data):
+            lo, hi = np.min(data), np.max(data)
+            dtype = quantised_dtype(lo, hi, dec) if np.isfinite(lo) and np.isfinite(hi) else None
+            if dtype is None:
+                dec = 0
+        if dtype is None:
+            dtype = data.dtype if data.dtype in DTYPES else np.float32
+        if np.dtype(dtype).kind == 'f':
+            dec = 0
+
+        name = str(s_.get('name', col))
+        chan = cls(None, 0, 0, 0, 0, len(data),
+                   np.dtype(dtype).type, int(s_.get('freq', freq)), 0, 1, 1, dec,
+                   name, s_.get('short_name', ''), s_.get('units', ''))
+        chan._data = data
+        return chan
+
     @classmethod
     def fromfile(cls, _f, meta_ptr):
         # type: (str, int) -> ldChan
@@ -345,10 +593,20 @@ class ldChan(object):
         """
         with open(_f, 'rb') as f:
             f.seek(meta_ptr)
+            return cls.frombuffer(f.read(struct.calcsize(ldChan.fmt)), meta_ptr, _f, offset=0)
+
+    @classmethod
+    def frombuffer(cls, buf, meta_ptr, _f=None, offset=None):
+        # type: (bytes, int, str, int) -> ldChan
+        """Parses the header information of an ld channel from a buffer
 
-            (prev_meta_ptr, next_meta_ptr, data_ptr, data_len, _,
-             dtype_a, dtype, freq, shift, mul, scale, dec,
-             name, short_name, unit) = struct.unpack(ldChan.fmt, f.read(struct.calcsize(ldChan.fmt)))
+        The buffer holds the ld file (e.g. a memory map of it), unless offset
+         gives the position of the channel header in buf. When buf holds the
+         whole file the channel data is later read from it as well.
+        """
+        (prev_meta_ptr, next_meta_ptr, data_ptr, data_len, _,
+         dtype_a, dtype, freq, shift, mul, scale, dec,
+         name, short_name, unit) = struct.unpack_from(ldChan.fmt, buf, meta_ptr if offset is None else offset)
 
         name, short_name, unit = map(decode_string, [name, short_name, unit])
 
@@ -358,47 +616,201 @@ class ldChan(object):
             dtype = [None, np.int16, None, np.int32][dtype-1]
         else: raise Exception('Datatype %i not recognized'%dtype_a)
 
-        return cls(_f, meta_ptr, prev_meta_ptr, next_meta_ptr, data_ptr, data_len,
+        chan = cls(_f, meta_ptr, prev_meta_ptr, next_meta_ptr, data_ptr, data_len,
                    dtype, freq, shift, mul, scale, dec,name, short_name, unit)
+        if offset is None:
+            chan._buf = buf
+        return chan
 
     def write(self, f, n):
-        if self.dtype == np.float16 or self.dtype == np.float32:
-            dtype_a = 0x07
-            dtype = {np.float16: 2, np.float32: 4}[self.dtype]
-        else:
-            dtype_a = 0x03
-            dtype = {np.int16: 2, np.int32: 4}[self.dtype]
+        dtype = np.dtype(self.dtype)
+        dtype_a = 0x07 if dtype.kind == 'f' else 0x03
 
         f.write(struct.pack(ldChan.fmt,
                             self.prev_meta_ptr, self.next_meta_ptr, self.data_ptr, self.data_len,
-                            0x2ee1+n, dtype_a, dtype, self.freq, self.shift, self.mul, self.scale, self.dec,
+                            0x2ee1+n, dtype_a, dtype.itemsize, self.freq, self.shift, self.mul, self.scale, self.dec,
                             self.name.encode(), self.short_name.encode(), self.unit.encode()))
 
+    @property
+    def is_identity(self):
+        # type: () -> bool
+        """ True if the stored data words are the channel values, without any scaling
+        """
+        return self.shift == 0 and self.mul == 1 and self.scale == 1 and self.dec == 0
+
+    def encode(self, data):
+        # type: (np.array) -> np.array
+        """ Convert channel values into the data words stored in the file
+
+        Inverse of the scaling applied by 'data'. Nothing is computed if the
+         scaling is the identity and the values already have the channel's dtype,
+         otherwise the conversion is done in the channel's precision.
+        """
+        dtype = np.dtype(self.dtype)
+        if self.is_identity and data.dtype == dtype:
+            return data
+
+        if dtype.kind == 'f':
+            work = dtype
+        else:
+            # int32 words don't fit the mantissa of a float32
+            work = np.dtype(np.float32 if dtype.itemsize <= 2 else np.float64)
+
+        words = data.astype(work, copy=not self.is_identity)
+        if not self.is_identity:
+            if self.mul != 1:
+                words /= work.type(self.mul)
+            if self.shift != 0:
+                words -= work.type(self.shift)
+            if self.scale != 1 or self.dec != 0:
+                words *= work.type(self.scale * pow(10., self.dec))
+
+        if dtype.kind != 'f':
+            words = np.rint(words, out=words)
+        return words.astype(dtype, copy=False)
+
+    def fill(self, buf, chunk_size=CHUNK_SIZE):
+        # type: (np.array, int) -> ()
+        """ Write the data words of the channel into the byte buffer of a whole ld file
+
+        Same as write_data, but copies into the channel's region of buf,
+         typically a memory map of a file created with ldData.allocate.
+        """
+        nbytes = self.data_len * np.dtype(self.dtype).itemsize
+        region = buf[self.data_ptr:self.data_ptr + nbytes].view(self.dtype)
+
+        written = 0
+        for chunk in self._chunks(chunk_size):
+            words = self.encode(np.asarray(chunk))
+            region[written:written + len(words)] = words
+            written += len(words)
+
+        if written != self.data_len:
+            raise ValueError("Channel %s: wrote %i of %i samples" % (self.name, written, self.data_len))
+
+    def _chunks(self, chunk_size):
+        source = self._data if self._data is not None else self.data
+        if isinstance(source, np.ndarray):
+            source = iter_chunks(source, chunk_size)
+        return source
+
+    def write_data(self, f, chunk_size=CHUNK_SIZE):
+        # type: (file, int) -> ()
+        """ Write the data words of the channel at its data pointer
+
+        The data is taken from the channel's source: an array, an iterable of
+         array chunks, or the channel data of the file it was read from.
+         Arrays are converted and written chunk_size samples at a time.
+        """
+        f.seek(self.data_ptr)
+        written = 0
+        for chunk in self._chunks(chunk_size):
+            words = np.ascontiguousarray(self.encode(np.asarray(chunk)))
+            f.write(words.data)
+            written += len(words)
+
+        if written != self.data_len:
+            raise ValueError("Channel %s: wrote %i of %i samples" % (self.name, written, self.data_len))
+
     @property
     def data(self):
         # type: () -> np.array
         """ Read the data words of the channel
+
+        Channels parsed from a buffer of the whole file return a zero-copy view
+         of it. The words are only scaled if the scaling isn't the identity,
+         otherwise they keep their native dtype.
         """
-        if self._data is None:
+        if self._data is None and self._buf is not None:
+            count = min(self.data_len, max(0, len(self._buf) - self._src_ptr) // np.dtype(self.dtype).itemsize)
+            self._data = self.decode(np.frombuffer(self._buf, dtype=self.dtype, count=count,
+                                                   offset=self._src_ptr if count else 0))
+            if count != self.data_len:
+                print("Not all data read!", self.name, self.freq,
+                      hex(self._src_ptr), hex(self.data_len), hex(count))
+
+        elif self._data is None:
             # jump to data and read
             with open(self._f, 'rb') as f:
-                f.seek(self.data_ptr)
+                f.seek(self._src_ptr)
                 try:
                     self._data = np.fromfile(f,
                                             count=self.data_len, dtype=self.dtype)
 
-                    self._data = (self._data/self.scale * pow(10., -self.dec) + self.shift) * self.mul
+                    self._data = self.decode(self._data)
 
                     if len(self._data) != self.data_len:
                         raise ValueError("Not all data read!")
 
                 except ValueError as v:
                     print(v, self.name, self.freq,
-                          hex(self.data_ptr), hex(self.data_len),
+                          hex(self._src_ptr), hex(self.data_len),
                           hex(len(self._data)),hex(f.tell()))
                     # raise v
         return self._data
 
+    def read(self, start=None, stop=None):
+        # type: (int, int) -> np.array
+        """ Read a range of samples [start, stop) of the channel
+
+        Only the requested data words are read (or viewed, for channels parsed
+         from a buffer of the whole file), at the byte offset computed from
+         the data pointer in the file it was read from and the dtype.
+        """
+        start, stop, _ = slice(start, stop).indices(self.data_len)
+        count = max(0, stop - start)
+        if self._data is not None:
+            return self._data[start:start + count]
+
+        itemsize = np.dtype(self.dtype).itemsize
+        if self._buf is not None:
+            words = np.frombuffer(self._buf, dtype=self.dtype, count=count,
+                                  offset=self._src_ptr + start * itemsize if count else 0)
+        else:
+            with open(self._f, 'rb') as f:
+                f.seek(self._src_ptr + start * itemsize)
+                words = np.fromfile(f, count=count, dtype=self.dtype)
+        return self.decode(words)
+
+    def read_time(self, t0=None, t1=None):
+        # type: (float, float) -> np.array
+        """ Read the samples of the channel between the times [t0, t1) in seconds
+
+        Sample n is taken at time n / freq.
+        """
+        return self.read(*self.sample_range(t0, t1))
+
+    def sample_range(self, t0=None, t1=None):
+        # type: (float, float) -> (int, int)
+        """ Range of samples [start, stop) taken between the times [t0, t1) in seconds
+        """
+        to_sample = lambda t, default: default if t is None else \
+            min(self.data_len, max(0, int(np.ceil(t * self.freq - 1e-9))))
+        return to_sample(t0, 0), to_sample(t1, self.data_len)
+
+    def decode(self, words):
+        # type: (np.array) -> np.array
+        """ Convert data words stored in the file into channel values
+
+        Returns the words unchanged if the scaling is the identity, otherwise
+         scales them in float32, or float64 for int32 words.
+        """
+        if self.is_identity:
+            return words
+
+        dtype = np.dtype(self.dtype)
+        work = np.float64 if dtype.kind != 'f' and dtype.itemsize > 2 else np.float32
+        values = words.astype(work)
+        if self.scale != 1:
+            values /= work(self.scale)
+        if self.dec != 0:
+            values *= work(pow(10., -self.dec))
+        if self.shift != 0:
+            values += work(self.shift)
+        if self.mul != 1:
+            values *= work(self.mul)
+        return values
+
     def __str__(self):
         return 'chan %s (%s) [%s], %i Hz'%(
             self.name,
@@ -417,28 +829,148 @@ def decode_string(bytes):
         return ""
         # raise e
 
-def read_channels(f_, meta_ptr):
-    # type: (str, int) -> list
+def quantised_dtype(lo, hi, dec):
+    # type: (float, float, int) -> type
+    """ Smallest integer data type holding all values in [lo, hi] at dec decimal places
+
+    Returns None if the scaled values don't fit an int32.
+    """
+    lo, hi = round(lo * pow(10., dec)), round(hi * pow(10., dec))
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return None
+
+
+def iter_columns(source):
+    # type: (object) -> iter
+    """ Iterate over (name, array) of the columns of a table
+
+    Supports pandas DataFrames, pyarrow Tables and dicts of arrays. Columns
+     are returned without copying whenever the source allows it.
+    """
+    if hasattr(source, 'column_names') and hasattr(source, 'column'):
+        # pyarrow Table
+        for name in source.column_names:
+            column = source.column(name)
+            if column.num_chunks == 1 and column.null_count == 0:
+                yield name, column.chunk(0).to_numpy(zero_copy_only=False)
+            else:
+                yield name, column.to_numpy()
+    elif hasattr(source, 'columns') and hasattr(source, 'iloc'):
+        # pandas DataFrame
+        for name in source.columns:
+            yield name, source[name].to_numpy(copy=False)
+    else:
+        for name, data in source.items():
+            yield name, np.asarray(data)
+
+
+def index_channels(channs):
+    # type: (list) -> dict
+    """ Map the channel names to the positions of the channels with that name
+    """
+    index = {}
+    for n, chan in enumerate(channs):
+        index.setdefault(chan.name, []).append(n)
+    return index
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    # type: (np.array, int) -> iter
+    """ Iterate over views of consecutive chunks of an array
+    """
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i + chunk_size]
+
+
+def layout_channels(channs, meta_ptr):
+    # type: (list, int) -> (int, int)
+    """ Assign the file pointers of a list of channels in a single pass
+
+    The channel meta data blocks are placed back to back starting at meta_ptr
+     and linked through their prev/next pointers, followed by the data blocks
+     of all channels in the same order.
+     Returns the pointer to the first data block and the end of the last one.
+    """
+    data_ptr = start = link_channels(channs, meta_ptr)
+
+    for chan in channs:
+        chan.data_ptr = data_ptr
+        data_ptr += chan.data_len * np.dtype(chan.dtype).itemsize
+
+    return start, data_ptr
+
+
+def link_channels(channs, meta_ptr):
+    # type: (list, int) -> int
+    """ Place the channel meta data blocks back to back from meta_ptr
+
+    Sets the meta pointers and links the blocks through their prev/next
+     pointers, returns the end of the last block.
+    """
+    chanheadsize = struct.calcsize(ldChan.fmt)
+    for n, chan in enumerate(channs):
+        chan.meta_ptr = meta_ptr + n * chanheadsize
+        chan.prev_meta_ptr = chan.meta_ptr - chanheadsize if n > 0 else 0
+        chan.next_meta_ptr = chan.meta_ptr + chanheadsize if n < len(channs) - 1 else 0
+    return meta_ptr + len(channs) * chanheadsize
+
+
+def read_channels(f_, meta_ptr, buf=None):
+    # type: (str, int, bytes) -> list
     """ Read channel data inside ld file
 
     Cycles through the channels inside an ld file,
      starting with the one where meta_ptr points to.
      Returns a list of ldchan objects.
+     The channel headers are parsed from buf, a buffer of the whole file,
+     which is memory mapped from f_ if not given.
     """
+    if buf is None:
+        buf = map_file(f_)
+
     chans = []
     while meta_ptr:
-        chan_ = ldChan.fromfile(f_, meta_ptr)
+        chan_ = ldChan.frombuffer(buf, meta_ptr, f_)
         chans.append(chan_)
         meta_ptr = chan_.next_meta_ptr
     return chans
 
 
+def map_file(f_):
+    # type: (str) -> mmap.mmap
+    """ Memory map a whole file read-only
+
+    The file itself is closed right away, the map stays valid for as long as
+     it (or any array viewing it) is referenced.
+    """
+    with open(f_, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def close_map(buf):
+    # type: (mmap.mmap) -> None
+    """ Close a memory map unless arrays still view it (it is freed with them)
+    """
+    if isinstance(buf, mmap.mmap):
+        try:
+            buf.close()
+        except BufferError:
+            pass
+
+
 def read_ldfile(f_):
     # type: (str) -> (ldHead, list)
     """ Read an ld file, return header and list of channels
+
+    The file is opened and memory mapped once, headers are parsed from the
+     map and the channels read their data as views of it.
     """
-    head_ = ldHead.fromfile(open(f_,'rb'))
-    chans = read_channels(f_, head_.meta_ptr)
+    buf = map_file(f_)
+    head_ = ldHead.fromfile(buf)
+    chans = read_channels(f_, head_.meta_ptr, buf)
     return head_, chans
 
 
@@ -0,0 +1,198 @@
+""" Merge and split MoTec ld files without decoding the channel data
+
+The header and the channel meta data linked list are rewritten, while the
+data blocks are copied raw between the files, using os.copy_file_range where
+the platform supports it.
+
+Usage:
+    python -m ldparser.ldsplice merge out.ld stint1.ld stint2.ld ...
+    python -m ldparser.ldsplice split in.ld out_dir --laps 1-10,11-20
+    python -m ldparser.ldsplice split in.ld out_dir --times 0-3600,3600-7200
+"""
+
+import contextlib
+import copy
+import os
+
+import numpy as np
+
+from ldparser.ldparser import index_channels, ldData
+
+# size of the blocks copied when copy_file_range is not available
+COPY_BLOCK_SIZE = 8 << 20
+
+
+def copy_range(src, dst, src_offset, dst_offset, count):
+    # type: (file, file, int, int, int) -> ()
+    """ Copy count bytes between two open (binary) files at the given offsets
+
+    Uses os.copy_file_range, so the kernel copies the bytes without passing
+     them through user space, and falls back to block-wise reads and writes.
+    """
+    if count <= 0:
+        return
+
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while count > 0:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), count, src_offset, dst_offset)
+                if n == 0:
+                    break
+                src_offset, dst_offset, count = src_offset + n, dst_offset + n, count - n
+        except OSError:
+            pass
+        if count == 0:
+            return
+
+    src.seek(src_offset)
+    dst.seek(dst_offset)
+    while count > 0:
+        block = src.read(min(count, COPY_BLOCK_SIZE))
+        if not block:
+            raise ValueError("Unexpected end of file")
+        dst.write(block)
+        count -= len(block)
+
+
+def _chan_bytes(chan, start, stop):
+    """ Byte offset and length of the samples [start, stop) of a channel
+    """
+    itemsize = np.dtype(chan.dtype).itemsize
+    return chan._src_ptr + start * itemsize, (stop - start) * itemsize
+
+
+def _new_chan(chan, data_len):
+    """ Copy of a channel's meta data, with a new length and without data
+    """
+    new = copy.copy(chan)
+    new.data_len, new._data, new._buf = data_len, None, None
+    return new
+
+
+def _compatible(a, b):
+    return (np.dtype(a.dtype) == np.dtype(b.dtype) and
+            (a.freq, a.shift, a.mul, a.scale, a.dec) == (b.freq, b.shift, b.mul, b.scale, b.dec))
+
+
+def _write(head, pieces, f):
+    """ Write a new ld file from a header and a list of (channel, parts), where
+     parts lists the (source file, source channel, sample start, sample stop)
+     pieces the data of the channel is made of
+
+    The channels of the returned ldData read their data from f.
+    """
+    for src_name in {src_name for _, parts in pieces for src_name, _, _, _ in parts}:
+        if os.path.exists(f) and os.path.samefile(src_name, f):
+            raise ValueError("Output file %s is also an input" % f)
+
+    channs = [_new_chan(chan, sum(stop - start for _, _, start, stop in parts))
+              for chan, parts in pieces]
+    out = ldData(copy.copy(head), channs)
+    out.allocate(f)
+    for new in channs:
+        new._f, new._src_ptr = f, new.data_ptr
+
+    sources = {}
+    try:
+        with open(f, 'r+b') as dst:
+            for new, (_, parts) in zip(channs, pieces):
+                offset = new.data_ptr
+                for src_name, src_chan, start, stop in parts:
+                    if src_name not in sources:
+                        sources[src_name] = open(src_name, 'rb')
+                    src_offset, count = _chan_bytes(src_chan, start, stop)
+                    copy_range(sources[src_name], dst, src_offset, offset, count)
+                    offset += count
+    finally:
+        for src in sources.values():
+            src.close()
+    return out
+
+
+def merge(files, f):
+    # type: (list, str) -> ldData
+    """ Concatenate ld files, e.g. the stints of an endurance race, into f
+
+    The header is taken from the first file. Channels present in all files
+     with the same data type, rate and scaling are merged, their data blocks
+     copied one after the other. Other channels are dropped with a warning.
+    """
+    with contextlib.ExitStack() as stack:
+        lds = [stack.enter_context(ldData.fromfile(name)) for name in files]
+        indexes = [index_channels(ld.channs) for ld in lds]
+
+        pieces = []
+        for chan in lds[0].channs:
+            parts = []
+            for name, ld, index in zip(files, lds, indexes):
+                other = ld.channs[index[chan.name][0]] if chan.name in index else None
+                if other is None or not _compatible(chan, other):
+                    print("Dropping channel %s, missing or different in %s" % (chan.name, name))
+                    break
+                parts.append((name, other, 0, other.data_len))
+            else:
+                pieces.append((chan, parts))
+
+        return _write(lds[0].head, pieces, f)
+
+
+def split(file, windows, pattern):
+    # type: (str, list, str) -> list
+    """ Cut an ld file into one file per time window
+
+    windows is a list of (t0, t1) in seconds, pattern the output file name
+     with a '%d' for the (1 based) window number. The samples of each channel
+     within a window are copied as a single byte range.
+    """
+    outs = []
+    with ldData.fromfile(file) as ld:
+        for n, (t0, t1) in enumerate(windows, 1):
+            pieces = [(chan, [(file, chan) + chan.sample_range(t0, t1)]) for chan in ld.channs]
+            outs.append(_write(ld.head, pieces, pattern % n))
+    return outs
+
+
+def lap_windows(ld, laps):
+    # type: (ldData, list) -> list
+    """ Time windows covering groups of laps, given as (first, last) lap numbers
+    """
+    return [(ld.lap_window(first)[0], ld.lap_window(last)[1]) for first, last in laps]
+
+
+def _parse_ranges(text, type_):
+    ranges = []
+    for part in text.split(','):
+        a, _, b = part.partition('-')
+        ranges.append((type_(a), type_(b or a)))
+    return ranges
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Merge or split MoTeC ld files without decoding them")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge_ = commands.add_parser("merge", help="Concatenate files, e.g. stints")
+    merge_.add_argument("output", help="File to write")
+    merge_.add_argument("files", nargs="+", help="Files to concatenate, in order")
+
+    split_ = commands.add_parser("split", help="Cut a file by laps or by time")
+    split_.add_argument("file", help="File to split")
+    split_.add_argument("output_dir", help="Directory to write the parts to")
+    group = split_.add_mutually_exclusive_group(required=True)
+    group.add_argument("--laps", help="Lap ranges, e.g. 1-10,11-20")
+    group.add_argument("--times", help="Time ranges [s], e.g. 0-3600,3600-7200")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        merge(args.files, args.output)
+    else:
+        if args.laps:
+            with ldData.fromfile(args.file) as ld:
+                windows = lap_windows(ld, _parse_ranges(args.laps, int))
+        else:
+            windows = _parse_ranges(args.times, float)
+        os.makedirs(args.output_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(args.file))[0].replace('%', '%%')
+        split(args.file, windows, os.path.join(args.output_dir, stem + '_part%d.ld'))
@@ -0,0 +1,160 @@
+""" Multi-resolution min/max/mean summaries of the channels of an ld file
+
+The pyramid is stored in a sidecar file next to the ld file ('.pyr'), made of
+ a small JSON header and, for every channel and level, the min, max and mean
+ of each block of `factor` samples as float32 rows. The file is memory mapped
+ when read, so a viewer zoomed out over a whole session only touches the few
+ kilobytes of the level it draws.
+
+Layout:
+    8 bytes  magic
+    8 bytes  header length (little endian uint64)
+    header   JSON: {"channels": {name: {"freq", "n", "levels": [{"factor", "offset", "length"}]}}}
+    data     per level: float32[3, length] (min, max, mean), at 64 byte aligned offsets
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from ldparser.ldparser import close_map, map_file
+
+MAGIC = b"LDPYR1\0\0"
+ALIGN = 64
+
+# Block sizes of the levels, in samples of the channel
+DEFAULT_FACTORS = (10, 100, 1000)
+
+
+def sidecar_path(ld_filename):
+    # type: (str) -> str
+    return os.path.splitext(ld_filename)[0] + ".pyr"
+
+
+def build(values, factors=DEFAULT_FACTORS):
+    # type: (np.array, tuple) -> list
+    """ Min, max and mean of each block of `factor` samples, for each factor
+
+    The first level is reduced from the samples, every next one from the
+     level before it (factors must be multiples of each other), so the samples
+     are only read once. The last block of a level may be shorter.
+    Returns a list of float32 arrays of shape (3, blocks).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    levels = []
+    lo, hi, total, count = values, values, values, np.ones(len(values))
+    previous = 1
+    for factor in factors:
+        if factor % previous:
+            raise ValueError("Pyramid factors must be multiples of each other: %s" % (factors,))
+        starts = np.arange(0, len(lo), factor // previous)
+        if len(starts):
+            lo = np.minimum.reduceat(lo, starts)
+            hi = np.maximum.reduceat(hi, starts)
+            total = np.add.reduceat(total, starts)
+            count = np.add.reduceat(count, starts)
+        else:
+            lo = hi = total = count = np.zeros(0)
+        levels.append(np.vstack([lo, hi, total / np.maximum(count, 1)]).astype(np.float32))
+        previous = factor
+    return levels
+
+
+def write(filename, channels, factors=DEFAULT_FACTORS):
+    # type: (str, iter, tuple) -> ()
+    """ Write the pyramid of channels, an iterable of (name, freq, values)
+    """
+    entries, blocks = {}, []
+    offset = 0
+    for name, freq, values in channels:
+        levels = []
+        for factor, block in zip(factors, build(values, factors)):
+            levels.append({"factor": factor, "offset": offset, "length": block.shape[1]})
+            blocks.append((offset, block))
+            offset += -(-block.nbytes // ALIGN) * ALIGN
+        entries[name] = {"freq": freq, "n": len(values), "levels": levels}
+
+    header = json.dumps({"channels": entries}).encode()
+    # data offsets are relative to the first aligned byte after the header
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for block_offset, block in blocks:
+            f.seek(data_start + block_offset)
+            f.write(block.tobytes())
+        f.truncate(data_start + offset)
+
+
+class Pyramid(object):
+    """ Memory mapped pyramid sidecar of an ld file
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a pyramid file" % filename)
+            size, = struct.unpack("<Q", f.read(8))
+            self.channels = json.loads(f.read(size).decode())["channels"]
+        self.data_start = -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+        self.buf = map_file(filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """ Release the memory map of the sidecar (see ldData.close)
+        """
+        close_map(self.buf)
+
+    @classmethod
+    def for_ld(cls, ld_filename):
+        # type: (str) -> Pyramid
+        """ The pyramid next to an ld file, or None if there is none
+        """
+        path = sidecar_path(ld_filename)
+        return cls(path) if os.path.isfile(path) else None
+
+    def level(self, name, factor):
+        # type: (str, int) -> np.array
+        """ float32 view of shape (3, blocks): min, max and mean of each block
+        """
+        for level in self.channels[name]["levels"]:
+            if level["factor"] == factor:
+                start = self.data_start + level["offset"]
+                return np.frombuffer(self.buf, dtype=np.float32, count=3 * level["length"],
+                                     offset=start).reshape(3, -1)
+        raise KeyError("%s has no level %d" % (name, factor))
+
+    def window(self, name, n_buckets, t0=None, t1=None):
+        # type: (str, int, float, float) -> (np.array, np.array)
+        """ Min/max envelope of a channel between the times [t0, t1)
+
+        Uses the coarsest level still giving n_buckets blocks in the window,
+         and returns (times, values) with the min and max of each block, or
+         None if even the finest level is too coarse (read the samples then).
+        """
+        entry = self.channels[name]
+        freq = float(entry["freq"]) or 1.0
+        t0 = 0.0 if t0 is None else max(0.0, t0)
+        t1 = entry["n"] / freq if t1 is None else t1
+        samples = (t1 - t0) * freq
+
+        for level in sorted(entry["levels"], key=lambda l: -l["factor"]):
+            factor = level["factor"]
+            if samples / factor >= n_buckets:
+                start = int(t0 * freq // factor)
+                stop = min(level["length"], int(-(-t1 * freq // factor)))
+                block = self.level(name, factor)[:, start:stop]
+                times = np.repeat((start + np.arange(block.shape[1])) * factor / freq, 2)
+                values = np.empty(2 * block.shape[1], dtype=np.float32)
+                values[0::2], values[1::2] = block[0], block[1]
+                return times, values
+        return None
@@ -0,0 +1,226 @@
+import ast
+import re
+from collections import Counter
+from graphlib import CycleError, TopologicalSorter
+
+import numpy as np
+
+# Placeholders expanded into one channel per corner / tyre layer, matching the
+# suffixes motec_standard_name gives (e.g. "Tyres Temp I FL")
+TEMPLATES = {"{W}": ("FL", "FR", "RL", "RR"), "{L}": ("I", "M", "O")}
+
+DEFAULT_DECIMALS = 2
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "atan2": np.arctan2,
+    "hypot": np.hypot,
+    "sign": np.sign,
+    "min": np.minimum,
+    "max": np.maximum,
+    "clip": np.clip,
+    "where": np.where,
+}
+
+OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+    ast.Mod: np.mod,
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+# Name [unit] = expression, or Name [unit, decimals] = expression
+LINE = re.compile(r"^(?P<name>[^=\[]+?)\s*(?:\[(?P<unit>[^\],]*)(?:,\s*(?P<decimals>\d+))?\])?\s*=\s*(?P<expr>.+)$")
+
+# channels are referenced in single quotes, as in MoTeC math: 'Wheel Speed FL'
+REFERENCE = re.compile(r"'([^']+)'")
+
+# names the quoted channels are replaced with while parsing
+SLOT = re.compile(r"_c(\d+)")
+
+
+class MathChannel(object):
+    """A derived channel: name, unit, decimals, parsed expression and the channels it reads."""
+    def __init__(self, name, unit, decimals, expression, inputs):
+        self.name = name
+        self.unit = unit
+        self.decimals = decimals
+        self.expression = expression
+        self.inputs = inputs
+
+
+def expand(line):
+    """Copies of a line with every placeholder replaced, one per corner/layer."""
+    lines = [line]
+    for placeholder, values in TEMPLATES.items():
+        if placeholder in line:
+            lines = [l.replace(placeholder, v) for l in lines for v in values]
+    return lines
+
+
+def parse(text):
+    """Parses an expression file into MathChannel objects, in file order.
+
+    One channel per line, '#' starts a comment, '^' is a power. Raises
+    ValueError with the line number on a syntax error or unknown function.
+    """
+    channels = []
+    for number, raw in enumerate(text.splitlines(), start=1):
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        match = LINE.match(line)
+        if not match:
+            raise ValueError("Line %d: expected 'Name [unit] = expression': %s" % (number, raw))
+        for expanded in expand(line):
+            m = LINE.match(expanded)
+            inputs = []
+
+            def variable(ref):
+                if ref.group(1) not in inputs:
+                    inputs.append(ref.group(1))
+                return "_c%d" % inputs.index(ref.group(1))
+
+            unquoted = REFERENCE.sub("''", m.group("expr"))
+            typed = re.search(r"\b%s\b" % SLOT.pattern, unquoted)
+            if typed:
+                raise ValueError("Line %d: unknown name %s (quote channel names)" % (number, typed.group()))
+            source = REFERENCE.sub(variable, m.group("expr")).replace("^", "**")
+            try:
+                tree = ast.parse(source, mode="eval").body
+            except SyntaxError as e:
+                raise ValueError("Line %d: %s: %s" % (number, e.msg, raw)) from None
+            # channel slots become the channel names, so equal sub-expressions of
+            # different channels look the same to the evaluator
+            tree = _resolve(tree, inputs, number)
+            decimals = m.group("decimals")
+            channels.append(MathChannel(m.group("name").strip(), (m.group("unit") or "").strip(),
+                                        int(decimals) if decimals else DEFAULT_DECIMALS, tree, inputs))
+    return channels
+
+
+def _resolve(tree, inputs, number):
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ValueError("Line %d: unknown function %s" % (number, ast.unparse(node.func)))
+            node.func.id = "fn:" + node.func.id
+        elif isinstance(node, ast.Name):
+            if node.id.startswith("fn:"):
+                continue
+            slot = SLOT.fullmatch(node.id)
+            if not slot or int(slot.group(1)) >= len(inputs):
+                raise ValueError("Line %d: unknown name %s (quote channel names)" % (number, node.id))
+            node.id = inputs[int(slot.group(1))]
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError("Line %d: unsupported constant %r" % (number, node.value))
+        elif isinstance(node, (ast.operator, ast.unaryop, ast.cmpop)):
+            if type(node) not in OPERATORS:
+                raise ValueError("Line %d: unsupported operator %s" % (number, type(node).__name__))
+        elif not isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Compare, ast.Constant, ast.Load)):
+            raise ValueError("Line %d: unsupported syntax %s" % (number, type(node).__name__))
+    return tree
+
+
+class MathProgram(object):
+    """A compiled expression file: channels sorted by their dependencies.
+
+    Built once, then evaluated on the channels of a session: each channel is
+    a few numpy calls over whole arrays, and sub-expressions used more than
+    once (e.g. the average front wheel speed of four slip channels) are
+    computed only once per evaluation.
+    """
+    def __init__(self, channels):
+        self.channels = {c.name: c for c in channels}
+        # a channel reading a channel of its own name (Speed = 'Speed' * 3.6) replaces a
+        # channel of the session, it doesn't depend on itself
+        graph = {c.name: [i for i in c.inputs if i in self.channels and i != c.name] for c in channels}
+        try:
+            self.order = list(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            raise ValueError("Math channels depend on each other in a loop: %s" % " -> ".join(e.args[1]))
+
+        counts = Counter()
+        for c in channels:
+            for node in ast.walk(c.expression):
+                if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call, ast.Compare)):
+                    counts[ast.dump(node)] += 1
+        self.shared = {key for key, n in counts.items() if n > 1}
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, encoding="utf-8") as f:
+            return cls(parse(f.read()))
+
+    def evaluate(self, columns):
+        """Computes the math channels from columns (name -> array, or a DataFrame).
+
+        Returns (values, skipped): a dict of name -> float64 array in dependency
+        order, and the names skipped because a channel they read is missing.
+        """
+        available = {name: np.asarray(columns[name], dtype=np.float64) for name in columns.keys()}
+        values, skipped, cache = {}, {}, {}
+        for name in self.order:
+            channel = self.channels[name]
+            missing = [i for i in channel.inputs if i not in available]
+            if missing:
+                skipped[name] = missing
+                continue
+            with np.errstate(all="ignore"):
+                result = self._eval(channel.expression, available, cache)
+            result = np.asarray(result, dtype=np.float64)
+            if result.ndim == 0:
+                # constant expression
+                result = np.full(len(next(iter(available.values()))) if available else 0, result)
+            if name in available:
+                # cached sub-expressions may have read the replaced channel
+                cache.clear()
+            values[name] = available[name] = result
+        return values, skipped
+
+    def _eval(self, node, columns, cache):
+        key = None
+        if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Call, ast.Compare)):
+            key = ast.dump(node)
+            if key in cache:
+                return cache[key]
+
+        if isinstance(node, ast.Constant):
+            result = float(node.value)
+        elif isinstance(node, ast.Name):
+            result = columns[node.id]
+        elif isinstance(node, ast.BinOp):
+            result = OPERATORS[type(node.op)](self._eval(node.left, columns, cache),
+                                              self._eval(node.right, columns, cache))
+        elif isinstance(node, ast.UnaryOp):
+            result = OPERATORS[type(node.op)](self._eval(node.operand, columns, cache))
+        elif isinstance(node, ast.Compare):
+            left = self._eval(node.left, columns, cache)
+            result = True
+            for op, right in zip(node.ops, node.comparators):
+                right = self._eval(right, columns, cache)
+                result = np.logical_and(result, OPERATORS[type(op)](left, right))
+                left = right
+            result = np.asarray(result, dtype=np.float64)
+        else:
+            result = FUNCTIONS[node.func.id[3:]](*(self._eval(a, columns, cache) for a in node.args))
+
+        if key in self.shared:
+            cache[key] = result
+        return result
@@ -1,32 +1,13 @@
 import datetime
 import struct
-from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
 from data_log import Channel, DataLog, Message
-from ldparser.ldparser import ldChan, ldData, ldEvent, ldHead, ldVehicle, ldVenue
+from ldparser.ldparser import EVENT_PTR, META_PTR, VEHICLE_PTR, VENUE_PTR, ldChan, ldData, ldHead, \
+    quantised_dtype
 
 
-def _prepare_channel_data(log_channel):
-    """Convert a DataLog channel into a numpy array for ldparser.
-
-    This helper is defined at module scope so it can be executed in a
-    ``ProcessPoolExecutor`` to spread the conversion work across CPUs.
-    """
-
-    data_type = np.float32 if log_channel.data_type is float else np.int32
-    data_array = np.fromiter(
-        (msg.value for msg in log_channel.messages), dtype=data_type, count=len(log_channel.messages)
-    )
-
-    return {
-        "data_array": data_array,
-        "data_len": len(log_channel.messages),
-        "data_type": data_type,
-        "freq": int(log_channel.avg_frequency()),
-    }
-
 class MotecLog(object):
     """ Handles generating a MoTeC .ld file from log data.
 
@@ -38,13 +19,16 @@ class MotecLog(object):
     """
     # Pointers to locations in the file where data sections should be written. These have been
     # determined from inspecting some MoTeC .ld files, and were consistent across all files.
-    VEHICLE_PTR = 1762
-    VENUE_PTR = 5078
-    EVENT_PTR = 8180
-    HEADER_PTR = 11336
+    VEHICLE_PTR = VEHICLE_PTR
+    VENUE_PTR = VENUE_PTR
+    EVENT_PTR = EVENT_PTR
+    HEADER_PTR = META_PTR
 
     CHANNEL_HEADER_SIZE = struct.calcsize(ldChan.fmt)
 
+    # Channels with more decimal places than this are always stored as floating point
+    MAX_DECIMALS = 6
+
     def __init__(self):
         self.driver = ""
         self.vehicle_id = ""
@@ -58,83 +42,110 @@ class MotecLog(object):
         self.short_comment = ""
         self.datetime = datetime.datetime.now()
 
+        # Store channels as scaled int16/int32 words when their range and decimals allow it
+        self.quantise = True
+
         # File components from ldparser
         self.ld_header = None
         self.ld_channels = []
 
+        # Threads encoding the channels into the memory mapped file on write
+        self.max_workers = None
+
     def initialize(self):
         """ Initializes all the meta data for the motec log.
 
         This must be called before adding any channel data.
         """
-        ld_vehicle = ldVehicle(self.vehicle_id, self.vehicle_weight, self.vehicle_type, \
-            self.vehicle_comment)
-        ld_venue = ldVenue(self.venue_name, self.VEHICLE_PTR, ld_vehicle)
-        ld_event = ldEvent(self.event_name, self.event_session, self.long_comment, \
-            self.VENUE_PTR, ld_venue)
-
-        self.ld_header = ldHead(self.HEADER_PTR, self.HEADER_PTR, self.EVENT_PTR, ld_event, \
-            self.driver, self.vehicle_id, self.venue_name, self.datetime, self.short_comment, \
-            self.event_name, self.event_session)
+        self.ld_header = ldHead.create(self.driver, self.vehicle_id, self.venue_name, self.datetime, \
+            self.short_comment, self.event_name, self.event_session, self.long_comment, \
+            self.vehicle_weight, self.vehicle_type, self.vehicle_comment)
 
-    def add_channel(self, log_channel, prepared_data=None):
+    def add_channel(self, log_channel):
         """Adds a single channel of data to the motec log.
 
         Parameters
         ----------
         log_channel : data_log.Channel
             Channel to convert into ldparser structures.
-        prepared_data : dict | None
-            Optional pre-computed data produced by ``_prepare_channel_data``.
         """
-        # Advance the header data pointer
-        self.ld_header.data_ptr += self.CHANNEL_HEADER_SIZE
-
-        # Advance the data pointers of all previous channels
-        for ld_channel in self.ld_channels:
-            ld_channel.data_ptr += self.CHANNEL_HEADER_SIZE
-
-        # Determine our file pointers
-        if self.ld_channels:
-            meta_ptr = self.ld_channels[-1].next_meta_ptr
-            prev_meta_ptr = self.ld_channels[-1].meta_ptr
-            data_ptr = self.ld_channels[-1].data_ptr + self.ld_channels[-1]._data.nbytes
-        else:
-            # First channel needs the previous pointer zero'd out
-            meta_ptr = self.HEADER_PTR
-            prev_meta_ptr = 0
-            data_ptr = self.ld_header.data_ptr
-        next_meta_ptr = meta_ptr + self.CHANNEL_HEADER_SIZE
-
-        # Channel specs
-        data_len = prepared_data["data_len"] if prepared_data else len(log_channel.messages)
-        data_type = prepared_data["data_type"] if prepared_data else (
-            np.float32 if log_channel.data_type is float else np.int32
+        values = np.fromiter(
+            (msg.value for msg in log_channel.messages), dtype=np.float64,
+            count=len(log_channel.messages)
         )
-        freq = prepared_data["freq"] if prepared_data else int(log_channel.avg_frequency())
+        if len(values):
+            data_type, decimals = self.channel_encoding(log_channel, values.min(), values.max(), \
+                np.isfinite(values).all())
+        else:
+            data_type, decimals = self.channel_encoding(log_channel, 0.0, 0.0, False)
+
+        self.add_channel_descriptor(log_channel.name, log_channel.units, data_type, len(values), \
+            int(log_channel.avg_frequency()), decimals, values)
+
+    def channel_encoding(self, log_channel, lo, hi, finite):
+        """Chooses the data type and decimal places a channel is stored with.
+
+        With ``quantise`` enabled, the values are stored as int16 or int32 words
+        at the channel's decimal places, whichever is the smallest to hold the
+        whole range [lo, hi]. Channels whose decimals are unknown (None), which
+        don't fit, or which contain non finite values, are stored as float32
+        (int32 for integer channels).
+
+        Returns
+        -------
+        tuple
+            The numpy data type and the number of decimal places.
+        """
+        default = np.float32 if log_channel.data_type is float else np.int32
+        decimals = log_channel.decimals
+        if not self.quantise or not finite or decimals is None or not 0 <= decimals <= self.MAX_DECIMALS:
+            return default, 0
+
+        data_type = quantised_dtype(lo, hi, log_channel.decimals)
+        if data_type is None:
+            return default, 0
+        return data_type, log_channel.decimals
+
+    def add_channel_descriptor(self, name, units, data_type, data_len, freq, decimals=0, data=None):
+        """Adds the description of a single channel to the motec log.
+
+        Only the channel specs are collected here, the file pointers of all channels are assigned
+        in one pass by ``plan`` when the log is written.
+
+        Parameters
+        ----------
+        name : str
+            Channel name.
+        units : str
+            Channel units.
+        data_type : numpy dtype
+            One of ``np.float32``, ``np.float16``, ``np.int32`` or ``np.int16``.
+        data_len : int
+            Number of samples in the channel.
+        freq : int
+            Sample rate of the channel [Hz].
+        decimals : int
+            Decimal places of the stored words, integer data types hold the
+            values multiplied by ``10 ** decimals``.
+        data : numpy.ndarray | iterable | None
+            Optional channel samples, either an array or an iterable of array chunks which are
+            streamed to disc on write. May also be attached later through ``_data``.
+
+        Returns
+        -------
+        ldparser.ldChan
+            The channel header, with its pointers still unassigned.
+        """
         shift = 0
         multiplier = 1
         scale = 1
 
-        # Decimal places must be hard coded to zero, the ldparser library doesn't properly
-        # handle non zero values, consequently all channels will have zero decimal places
-        # decimals = log_channel.decimals
-        decimals = 0
-
-        ld_channel = ldChan(None, meta_ptr, prev_meta_ptr, next_meta_ptr, data_ptr, data_len, \
-            data_type, freq, shift, multiplier, scale, decimals, log_channel.name, "", \
-            log_channel.units)
-
-        # Add in the channel data
-        if prepared_data and "data_array" in prepared_data:
-            ld_channel._data = prepared_data["data_array"]
-        else:
-            ld_channel._data = np.fromiter(
-                (msg.value for msg in log_channel.messages), dtype=data_type, count=data_len
-            )
+        ld_channel = ldChan(None, 0, 0, 0, 0, data_len, data_type, freq, shift, multiplier, \
+            scale, decimals, name, "", units)
+        ld_channel._data = data
 
-        # Add the ld channel and advance the file pointers
         self.ld_channels.append(ld_channel)
+        return ld_channel
 
     def add_all_channels(self, data_log, max_workers=None):
         """Adds all channels from a DataLog to the motec log.
@@ -144,40 +155,36 @@ class MotecLog(object):
         data_log : data_log.DataLog
             Log container holding the channel data to convert.
         max_workers : int | None
-            Optional override for the number of worker processes used when
-            converting channel payloads to numpy arrays. ``None`` lets
-            ``ProcessPoolExecutor`` decide based on CPU count. Use ``1`` to
-            force sequential execution.
-        """
-
-        channel_items = list(data_log.channels.items())
-        prepared_channels = {}
-        use_parallel = max_workers != 1 and len(channel_items) > 1
+            Optional override for the number of threads encoding the channels on ``write``.
+            ``None`` lets ``ThreadPoolExecutor`` decide based on CPU count. Use ``1`` to force
+            sequential execution.
 
-        if use_parallel:
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                future_to_name = {
-                    executor.submit(_prepare_channel_data, channel): name for name, channel in channel_items
-                }
+        The values of every channel are read once into a float64 array here, in this process;
+        with more than one worker ``write`` then encodes the arrays in parallel threads straight
+        into a memory map of the preallocated file, so no channel is sent to another process.
+        """
+        self.max_workers = max_workers
+        for channel in data_log.channels.values():
+            self.add_channel(channel)
 
-                for future in future_to_name:
-                    name = future_to_name[future]
-                    prepared_channels[name] = future.result()
+    def plan(self):
+        """ Computes the file layout of all channels added so far in a single pass.
 
-        for channel_name, channel in channel_items:
-            self.add_channel(channel, prepared_channels.get(channel_name))
+        Assigns the meta data pointers, the prev/next links and the data offsets of every channel,
+        and returns the total size of the file in bytes.
+        """
+        ld_data = ldData(self.ld_header, self.ld_channels)
+        return ld_data.layout()
 
     def write(self, filename):
         """ Writes the motec log data to disc. """
         # Check for the presence of any channels, since the ldData write() method doesn't
         # gracefully handle zero channels
-        if self.ld_channels:
-            ld_data = ldData(self.ld_header, self.ld_channels)
-
-            # Need to zero out the final channel pointer
-            ld_data.channs[-1].next_meta_ptr = 0
-
-            ld_data.write(filename)
-        else:
+        if not self.ld_channels:
             with open(filename, "wb") as f:
                 self.ld_header.write(f, 0)
+        elif self.max_workers == 1 or len(self.ld_channels) < 2:
+            ldData(self.ld_header, self.ld_channels).write(filename)
+        else:
+            # Preallocate the file, then let threads fill the channel data regions in place
+            ldData(self.ld_header, self.ld_channels).write_mapped(filename, self.max_workers)
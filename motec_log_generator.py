@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
-import cantools
+import csv
 import os
 
 from data_log import DataLog
+from decimate import MODES
 from motec_log import MotecLog
+from progress import Progress, json_lines
 
 DESCRIPTION = """Generates MoTeC .ld files from external log files generated by: CAN bus dumps, CSV
  files, or COBB Accessport CSV files"""
@@ -16,7 +18,16 @@ DBC file that has messages in the CAN log. The signal name and units will be dir
 the DBC file.
 
 CSV files must have time as their first column. A MoTeC channel will be generated for all remaining
-columns. All channels will not have any units assigned.
+columns. Channels will not have any units assigned, unless a '<log>.meta.csv' file with channel,
+units and decimals columns is found next to the log.
+
+Channels are stored as int16/int32 words scaled to their decimal places whenever their range allows
+it, use '--no_quantise' to store them all as floating point. Only channels with known decimals are
+quantised: CSV columns take them from the .meta.csv, or else from the digits written in the log,
+while CAN signals and columns with blank decimals in the .meta.csv stay floating point.
+
+'--progress' prints progress events as JSON lines prefixed with '@progress ', with the current
+stage, the work done out of total, rows and bytes processed and an ETA.
 
 COBB Accessport CSV logs are simply generated by starting a logging session on the accessport. A
 MoTeC channel will be created for every channel logged, the name and units will be directly copied
@@ -33,6 +44,10 @@ if __name__ == '__main__':
         help="Name of output file, defaults to the same filename as 'log'")
     parser.add_argument("--frequency", type=float, default=20.0, \
         help="Fixed frequency to resample all channels at")
+    parser.add_argument("--resample_mode", type=str, default="latest", \
+        choices=("latest",) + MODES, \
+        help="How channels logged faster than --frequency are reduced: latest message, mean, " \
+        "min/max or FIR low-pass of each interval")
     parser.add_argument("--dbc", type=str, help="Path to DBC file, required if log type CAN")
 
     parser.add_argument("--driver", type=str, default="", help="Motec log metadata field")
@@ -45,12 +60,16 @@ if __name__ == '__main__':
     parser.add_argument("--event_session", type=str, default="", help="Motec log metadata field")
     parser.add_argument("--long_comment", type=str, default="", help="Motec log metadata field")
     parser.add_argument("--short_comment", type=str, default="", help="Motec log metadata field")
+    parser.add_argument("--no_quantise", action="store_true", \
+        help="Store all channels as floating point instead of scaled integers")
     parser.add_argument(
         "--workers",
         type=int,
         default=None,
-        help="Number of worker processes for channel conversion (defaults to CPU count)",
+        help="Number of worker processes for CAN parsing and threads for channel conversion (defaults to CPU count)",
     )
+    parser.add_argument("--progress", action="store_true", \
+        help="Print progress events as JSON lines")
     args = parser.parse_args()
 
     if args.log:
@@ -69,30 +88,42 @@ if __name__ == '__main__':
         print("ERROR: DBC file %s does not exist" % args.dbc)
         exit(1)
 
-    print("Loading log...")
-    with open(args.log, "r") as file:
-        lines = file.readlines()
+    steps = Progress([("extract", 60), ("resample", 20), ("convert", 5), ("write", 15)],
+                     json_lines() if args.progress else None)
+    log_size = os.path.getsize(args.log)
 
     # Create our data log from the input data
     data_log = DataLog()
 
     if args.log_type == "CAN":
-        if not os.path.isfile(args.dbc):
-            print("ERROR: DBC file %s does not exist" % args.dbc)
-            exit(1)
-
-        # Load the databse and log file
-        print("Loading DBC...")
-        can_db = cantools.database.load_file(args.dbc)
-
+        # CAN logs are read in shards by a pool of workers, each loading the DBC itself
         print("Extracting data...")
-        data_log.from_can_log(lines, can_db)
-    elif args.log_type == "CSV":
-        print("Extracting data...")
-        data_log.from_csv_log(lines)
-    elif args.log_type == "ACCESSPORT":
+        steps.stage("extract", log_size)
+        data_log.from_can_file(args.log, args.dbc, max_workers=args.workers,
+                               progress=lambda nbytes: steps.advance(nbytes, nbytes=nbytes))
+    else:
+        print("Loading log...")
+        steps.stage("extract", log_size)
+        with open(args.log, "r") as file:
+            lines = file.readlines()
+        steps.advance(log_size, rows=len(lines), nbytes=log_size)
+
         print("Extracting data...")
-        data_log.from_accessport_log(lines)
+        if args.log_type == "CSV":
+            data_log.from_csv_log(lines)
+
+            # Units and decimals written next to the CSV by duckdb_to_motec_unified.py
+            meta_filename = os.path.splitext(args.log)[0] + ".meta.csv"
+            if os.path.isfile(meta_filename):
+                with open(meta_filename, "r", newline="") as file:
+                    for row in csv.DictReader(file):
+                        channel = data_log.channels.get(row["channel"])
+                        if channel:
+                            channel.units = row["units"]
+                            # blank decimals are unknown, the channel is kept floating point
+                            channel.decimals = int(row["decimals"]) if row["decimals"] else None
+        elif args.log_type == "ACCESSPORT":
+            data_log.from_accessport_log(lines)
 
     if not data_log.channels:
         print("ERROR: Failed to find any channels in log data")
@@ -105,9 +136,11 @@ if __name__ == '__main__':
     # Resample all the channels to occur at a fixed frequency. We must do this because the data in
     # motec log expects a constant sample rate, it does not associate a timestamp to each individual
     # message in a channel.
-    data_log.resample(args.frequency)
+    steps.stage("resample", len(data_log.channels))
+    data_log.resample(args.frequency, progress=steps.advance, mode=args.resample_mode)
 
     print("Converting to MoTeC log...")
+    steps.stage("convert")
 
     motec_log = MotecLog()
     motec_log.driver = args.driver
@@ -120,6 +153,7 @@ if __name__ == '__main__':
     motec_log.event_session = args.event_session
     motec_log.long_comment = args.long_comment
     motec_log.short_comment = args.short_comment
+    motec_log.quantise = not args.no_quantise
 
     motec_log.initialize()
     motec_log.add_all_channels(data_log, max_workers=args.workers)
@@ -138,5 +172,7 @@ if __name__ == '__main__':
         print("Directory '%s' does not exist, will create it" % output_dir)
         os.makedirs(output_dir)
 
+    steps.stage("write")
     motec_log.write(ld_filename)
+    steps.finish()
     print("Done!")
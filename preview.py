@@ -0,0 +1,124 @@
+import tkinter as tk
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.figure import Figure
+
+from decimate import channel_window
+from ldparser.ldparser import ldData
+from ldparser.pyramid import Pyramid
+
+# Channels plotted when a file is loaded, if present
+DEFAULT_CHANNELS = ("Speed", "Throttle Position", "Brake Position")
+
+
+class PreviewPane(tk.Frame):
+    """Plots channels of a converted .ld file, to check a conversion without MoTeC.
+
+    Every line holds at most two points per pixel: the visible window of each
+    channel is reduced with decimate.minmax, and read again whenever the view
+    is zoomed or panned, so long sessions stay interactive. When the file has
+    a pyramid sidecar (.pyr) zoomed out views are read from it instead. Both
+    files stay memory mapped until release() or the next load().
+    """
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.ld = None
+        self.pyramid = None
+        self.filename = None
+        self.lines = {}
+        self.redraw_pending = False
+
+        left = tk.Frame(self)
+        left.pack(fill=tk.Y, side=tk.LEFT)
+        self.file_label = tk.Label(left, text="No file", anchor="w", width=30)
+        self.file_label.pack(fill=tk.X)
+        self.channel_list = tk.Listbox(left, selectmode=tk.EXTENDED, exportselection=False, width=30)
+        self.channel_list.pack(fill=tk.BOTH, expand=True)
+        self.channel_list.bind("<<ListboxSelect>>", lambda _e: self.plot_selected())
+
+        right = tk.Frame(self)
+        right.pack(fill=tk.BOTH, expand=True, side=tk.RIGHT)
+        self.figure = Figure(figsize=(6, 2.5), dpi=100)
+        self.axes = self.figure.add_subplot(111)
+        self.axes.set_xlabel("Time [s]")
+        self.canvas = FigureCanvasTkAgg(self.figure, master=right)
+        NavigationToolbar2Tk(self.canvas, right).update()
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.axes.callbacks.connect("xlim_changed", lambda _ax: self.schedule_redraw())
+
+    def load(self, filename):
+        """Shows the channels of an .ld file, plotting the default ones."""
+        self.release()
+        self.ld = ldData.fromfile(filename)
+        self.pyramid = Pyramid.for_ld(filename)
+        self.filename = filename
+        self.file_label.config(text=filename.replace("\\", "/").split("/")[-1])
+
+        names = sorted(c.name for c in self.ld.channs)
+        self.channel_list.delete(0, tk.END)
+        for name in names:
+            self.channel_list.insert(tk.END, name)
+        for i, name in enumerate(names):
+            if name in DEFAULT_CHANNELS:
+                self.channel_list.selection_set(i)
+        self.plot_selected(reset_view=True)
+
+    def release(self):
+        """Closes the .ld and .pyr maps, e.g. before a conversion rewrites them (Windows refuses to
+        truncate a mapped file). The lines stay plotted but are no longer redrawn on zoom."""
+        if self.ld is not None:
+            self.ld.close()
+        if self.pyramid is not None:
+            self.pyramid.close()
+        self.ld, self.pyramid, self.filename = None, None, None
+
+    def plot_selected(self, reset_view=False):
+        if self.ld is None:
+            return
+        names = [self.channel_list.get(i) for i in self.channel_list.curselection()]
+        for line in self.lines.values():
+            line.remove()
+        self.lines = {}
+
+        for name in names:
+            times, values = self.window(name)
+            self.lines[name], = self.axes.plot(times, values, linewidth=0.8, label=name)
+
+        if self.lines:
+            self.axes.legend(loc="upper right", fontsize=8)
+        elif self.axes.get_legend():
+            self.axes.get_legend().remove()
+        if reset_view or not self.lines:
+            self.axes.relim()
+            self.axes.autoscale()
+        self.canvas.draw_idle()
+
+    def buckets(self):
+        # one min/max pair per horizontal pixel of the plot
+        return max(100, self.canvas.get_tk_widget().winfo_width())
+
+    def window(self, name, t0=None, t1=None):
+        if self.pyramid is not None and name in self.pyramid.channels:
+            envelope = self.pyramid.window(name, self.buckets(), t0, t1)
+            if envelope is not None:
+                return envelope
+        times, values = channel_window(self.ld[name], self.buckets(), t0, t1)
+        # short windows are views of the map: the lines get a copy, so release() can close it
+        return times, np.array(values)
+
+    def schedule_redraw(self):
+        # xlim_changed fires several times per zoom: decimate once when idle
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw_window)
+
+    def redraw_window(self):
+        self.redraw_pending = False
+        if self.ld is None or not self.lines:
+            return
+        t0, t1 = self.axes.get_xlim()
+        for name, line in self.lines.items():
+            times, values = self.window(name, max(t0, 0.0), t1)
+            line.set_data(times, values)
+        self.canvas.draw_idle()
@@ -0,0 +1,118 @@
+import json
+import sys
+import time
+
+# Prefix of the progress lines written on stdout, so readers can tell them from the log output
+JSON_PREFIX = "@progress "
+
+
+class Progress(object):
+    """ Tracks the progress of a conversion made of weighted stages and reports it as events.
+
+    Every event is a dict with the current stage, the units of work done and total in that stage,
+    the rows and bytes processed so far, the overall percentage (stages weighted by their expected
+    share of the run time), the elapsed time and an ETA in seconds. Events are passed to callback,
+    at most every `interval` seconds except when a stage starts or the run finishes.
+    """
+    def __init__(self, stages, callback=None, interval=0.2):
+        """ stages: List of (name, weight) in the order they run, weights are relative """
+        total_weight = float(sum(weight for _, weight in stages)) or 1.0
+        self.weights = {name: weight / total_weight for name, weight in stages}
+        self.order = [name for name, _ in stages]
+        self.callback = callback
+        self.interval = interval
+
+        self.start_time = time.time()
+        self.last_emit = 0.0
+        self.stage_name = None
+        self.done = 0
+        self.total = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def stage(self, name, total=1):
+        """ Starts a stage of `total` units of work (e.g. tables, channels or shards). """
+        self.stage_name = name
+        self.done = 0
+        self.total = total
+        self.emit(force=True)
+
+    def advance(self, n=1, rows=0, nbytes=0):
+        """ Records n units of work done in the current stage, and the rows and bytes they held. """
+        self.done = min(self.total, self.done + n)
+        self.rows += rows
+        self.bytes += nbytes
+        self.emit()
+
+    def finish(self):
+        self.stage_name = "done"
+        self.done = self.total
+        self.emit(force=True)
+
+    def fraction(self):
+        """ Overall fraction of the work done, from the weights of the stages. """
+        if self.stage_name == "done":
+            return 1.0
+        if self.stage_name not in self.weights:
+            return 0.0
+
+        index = self.order.index(self.stage_name)
+        fraction = sum(self.weights[name] for name in self.order[:index])
+        if self.total:
+            fraction += self.weights[self.stage_name] * self.done / self.total
+        return fraction
+
+    def event(self):
+        elapsed = time.time() - self.start_time
+        fraction = self.fraction()
+        eta = elapsed * (1.0 - fraction) / fraction if fraction > 0 else None
+        return {
+            "stage": self.stage_name,
+            "done": self.done,
+            "total": self.total,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "percent": round(100.0 * fraction, 1),
+            "elapsed": round(elapsed, 3),
+            "eta": None if eta is None else round(eta, 3),
+        }
+
+    def emit(self, force=False):
+        if self.callback is None:
+            return
+        now = time.time()
+        if not force and now - self.last_emit < self.interval:
+            return
+        self.last_emit = now
+        self.callback(self.event())
+
+
+def json_lines(stream=None):
+    """ Returns a callback writing progress events to stream (stdout by default) as JSON lines. """
+    def write(event):
+        out = stream or sys.stdout
+        out.write(JSON_PREFIX + json.dumps(event) + "\n")
+        out.flush()
+    return write
+
+
+def parse_json_line(line):
+    """ Returns the progress event of a line written by json_lines, or None for other lines. """
+    if not line.startswith(JSON_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(JSON_PREFIX):])
+    except ValueError:
+        return None
+
+
+def format_event(event):
+    """ Human readable summary of a progress event, e.g. for a status bar. """
+    text = "%s %d/%d  %.0f%%" % (event["stage"], event["done"], event["total"], event["percent"])
+    if event["rows"]:
+        text += "  %d rows" % event["rows"]
+    if event["bytes"] and event["elapsed"] > 0:
+        text += "  %.1f MB/s" % (event["bytes"] / event["elapsed"] / 1e6)
+    if event["eta"] is not None and event["stage"] != "done":
+        text += "  ETA %.0fs" % event["eta"]
+    return text
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Below this speed (km/h) the car counts as stationary
+STATIONARY_SPEED = 5.0
+
+# Stopped for longer than this (s) ends a stint even without a pit signal (red flag, garage)
+STATIONARY_TIME = 60.0
+
+# Channel name parts of the 0/1 state channels that mean the car is in the pits
+PIT_KEYS = ("pits", "limiter")
+
+# Channel name parts of channels identifying the driver (a change is a driver swap)
+DRIVER_KEYS = ("driver id", "driver index", "driver number")
+
+
+def runs(mask):
+    """(starts, stops) of the runs of True in a boolean array."""
+    edges = np.diff(np.concatenate([[0], np.asarray(mask, dtype=np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def stationary(time, speed, min_duration=STATIONARY_TIME, threshold=STATIONARY_SPEED):
+    """True on the samples of the stops longer than min_duration seconds."""
+    time = np.asarray(time, dtype=np.float64)
+    slow = np.asarray(speed, dtype=np.float64) < threshold
+    starts, stops = runs(slow)
+    long_stops = time[stops - 1] - time[starts] >= min_duration
+    # +1 at the start and -1 after the end of every long stop, summed into a mask
+    marks = np.zeros(len(time) + 1, dtype=np.int64)
+    np.add.at(marks, starts[long_stops], 1)
+    np.add.at(marks, stops[long_stops], -1)
+    return np.cumsum(marks[:-1]) > 0
+
+
+def stint_bounds(time, columns, speed=None):
+    """Sample ranges [(start, stop), ...] of the stints of a session.
+
+    columns: dict or DataFrame of the session channels. The car is off track
+    while a pit or limiter state channel is set, or when stopped for longer
+    than STATIONARY_TIME; a stint ends when the car leaves such a period, so
+    it holds its out lap, its laps and its in lap and stop. A change of a
+    driver channel also starts a new stint. Ranges with no time on track
+    (e.g. in the garage before the first run) are dropped.
+    """
+    n = len(time)
+    if not n:
+        return []
+    off = np.zeros(n, dtype=bool)
+    cuts = []
+    for name in columns.keys():
+        lower = name.lower()
+        if any(k in lower for k in PIT_KEYS):
+            off |= np.asarray(columns[name], dtype=np.float64) > 0.5
+        elif any(k in lower for k in DRIVER_KEYS):
+            values = np.asarray(columns[name])
+            cuts.append(np.flatnonzero(values[1:] != values[:-1]) + 1)
+    if speed is not None:
+        off |= stationary(time, speed)
+
+    # pit exits: off track on one sample, on track on the next
+    cuts.append(np.flatnonzero(off[:-1] & ~off[1:]) + 1)
+    starts = np.unique(np.concatenate([[0]] + cuts)).astype(np.int64)
+    stops = np.append(starts[1:], n)
+    on_track = np.logical_or.reduceat(~off, starts)
+    return [(int(a), int(b)) for a, b in zip(starts[on_track], stops[on_track])]
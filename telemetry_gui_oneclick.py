@@ -1,4 +1,5 @@
 import os
+import queue
 import sys
 import threading
 import time
@@ -6,6 +7,11 @@ import subprocess
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
+import job_queue
+from conversion_service import ConversionPool
+from preview import PreviewPane
+from progress import parse_json_line
+
 APP_TITLE = "DuckDB → MoTeC (CUSTOM – logical groups)"
 
 
@@ -67,107 +73,132 @@ GROUP_DESCRIPTIONS = {
     "States": "Session/vehicle state flags"
 }
 
-def run_chain(cmds, log_widget, cwd=None, progress_cb=None):
-    def notify(event):
-        if progress_cb:
-            log_widget.after(0, progress_cb, event)
+class LogPump:
+    """Hands log lines and progress events from worker threads to the Tk main loop.
+
+    Workers only put items on a bounded queue (blocking when it is full, which
+    throttles the producer); the main loop drains it every POLL_MS, inserts all
+    the pending text at once and trims the widget to MAX_LINES. Events notified
+    with a key are kept out of the queue: only the latest one per key is
+    delivered per drain, e.g. one status update per job.
+    """
+    POLL_MS = 100
+    QUEUE_SIZE = 10000
+    MAX_DRAIN = 5000
+    MAX_LINES = 5000
+
+    def __init__(self, widget, progress_cb=None):
+        self.widget = widget
+        self.progress_cb = progress_cb
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.widget.after(self.POLL_MS, self.drain)
+
+    def write(self, text):
+        self.queue.put(("text", text))
+
+    def notify(self, event, key=None):
+        if key is not None:
+            with self.lock:
+                self.pending[key] = event
+            return
+        self.queue.put(("event", event))
 
-    def worker():
-        total = len(cmds)
-        stopped = False
-        for idx, cmd in enumerate(cmds, 1):
-            log_widget.insert(tk.END, "\n$ " + " ".join(cmd) + "\n")
-            log_widget.see(tk.END)
-            start_time = time.time()
-            notify({
-                "type": "start",
-                "index": idx,
-                "total": total,
-                "cmd": cmd,
-                "start": start_time,
-            })
+    def drain(self):
+        text = []
+        for _ in range(self.MAX_DRAIN):
             try:
-                p = subprocess.Popen(
-                    cmd,
-                    cwd=cwd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1
-                )
-                for line in p.stdout:
-                    log_widget.insert(tk.END, line)
-                    log_widget.see(tk.END)
-                    notify({
-                        "type": "tick",
-                        "index": idx,
-                        "total": total,
-                        "elapsed": time.time() - start_time,
-                    })
-                code = p.wait()
-                notify({
-                    "type": "end",
-                    "index": idx,
-                    "total": total,
-                    "elapsed": time.time() - start_time,
-                    "returncode": code,
-                })
-                log_widget.insert(tk.END, f"\n[exit code: {code}]\n")
-                log_widget.see(tk.END)
-                if code != 0:
-                    log_widget.insert(tk.END, "\nSTOP: command failed.\n")
-                    log_widget.see(tk.END)
-                    notify({
-                        "type": "stop",
-                        "index": idx,
-                        "total": total,
-                        "elapsed": time.time() - start_time,
-                        "returncode": code,
-                    })
-                    stopped = True
-                    break
-                if idx < total:
-                    pause_msg = "Please wait: preparing the next step..."
-                    log_widget.insert(tk.END, f"\n{pause_msg}\n")
-                    log_widget.see(tk.END)
-                    notify({
-                        "type": "between",
-                        "index": idx,
-                        "total": total,
-                        "message": pause_msg,
-                    })
-            except Exception as e:
-                log_widget.insert(tk.END, f"\n[ERROR] {e}\n")
-                log_widget.see(tk.END)
-                notify({
-                    "type": "error",
-                    "index": idx,
-                    "total": total,
-                    "elapsed": time.time() - start_time,
-                    "error": str(e),
-                })
-                stopped = True
+                kind, item = self.queue.get_nowait()
+            except queue.Empty:
                 break
-        notify({"type": "done", "stopped": stopped})
+            if kind == "text":
+                text.append(item)
+                continue
+            # Flush the text so far, so events keep their place in the log
+            self.flush(text)
+            text = []
+            if self.progress_cb:
+                self.progress_cb(item)
+        self.flush(text)
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if self.progress_cb:
+            for event in pending.values():
+                self.progress_cb(event)
+        self.widget.after(self.POLL_MS, self.drain)
+
+    def flush(self, text):
+        if not text:
+            return
+        self.widget.insert(tk.END, "".join(text))
+        lines = int(self.widget.index("end-1c").split(".")[0])
+        if lines > self.MAX_LINES:
+            self.widget.delete("1.0", f"{lines - self.MAX_LINES + 1}.0")
+        self.widget.see(tk.END)
+
+def run_subprocess(cmd, pump, callback, cwd=None, prefix=""):
+    """Runs a converter command in a subprocess, fallback of the warm
+    ConversionPool. Forwards its progress lines and exit status to callback
+    as 'progress', 'end' and 'error' events; returns a function killing it."""
+    p = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
+    )
+
+    def worker():
+        for line in p.stdout:
+            progress = parse_json_line(line)
+            if progress is not None:
+                callback({"type": "progress", "progress": progress})
+            else:
+                pump.write(prefix + line)
+        code = p.wait()
+        if code == 0:
+            callback({"type": "end", "returncode": code})
+        else:
+            callback({"type": "error", "error": f"exit code {code}"})
     threading.Thread(target=worker, daemon=True).start()
+    return p.kill
 
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title(APP_TITLE)
-        self.geometry("900x620")
+        self.geometry("900x800")
 
         self.project_dir = os.path.dirname(os.path.abspath(__file__))
+        self.out_dir = os.path.join(self.project_dir, "Telemetry")
         self.db_path = tk.StringVar(value="")
 
         self.group_vars = {}
         self.hz_vars = {}
         self.status_var = tk.StringVar(value="Ready")
-        self.step_var = tk.StringVar(value="Step 0/0")
+        self.step_var = tk.StringVar(value="Jobs 0/0")
         self.percent_var = tk.StringVar(value="0%")
         self.elapsed_var = tk.StringVar(value="0.0s")
         self.cores_var = tk.IntVar(value=max(1, (os.cpu_count() or 4) // 2))
         self.ram_var = tk.IntVar(value=4)
+        self.pyramid_var = tk.BooleanVar(value=False)
+        self.lap_stats_var = tk.BooleanVar(value=True)
+        self.align_var = tk.BooleanVar(value=False)
+        self.math_path = tk.StringVar(value="")
+        self.stints_var = tk.BooleanVar(value=False)
+        self.pipeline_var = tk.BooleanVar(value=True)
+        self.decimation_var = tk.StringVar(value="mean")
+        self.start_time = None
+        self.previewed = set()
+
+        # Conversions run in worker processes which keep their imports warm,
+        # subprocesses are only used if they can't be started
+        self.pool = ConversionPool()
+        self.jobs = job_queue.JobQueue(self.run_job, on_change=self.job_changed)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         top = tk.Frame(self)
         top.pack(fill=tk.X, padx=10, pady=8)
@@ -201,15 +232,66 @@ class App(tk.Tk):
 
         cpu_tab = ttk.Frame(resources)
         mem_tab = ttk.Frame(resources)
+        out_tab = ttk.Frame(resources)
         resources.add(cpu_tab, text="CPU")
         resources.add(mem_tab, text="Memory")
+        resources.add(out_tab, text="Output")
 
         tk.Label(cpu_tab, text="Cores to dedicate:").grid(row=0, column=0, padx=8, pady=8, sticky="w")
         tk.Spinbox(cpu_tab, from_=1, to=max(1, os.cpu_count() or 8), textvariable=self.cores_var, width=6).grid(row=0, column=1, padx=4, pady=8, sticky="w")
+        pipe = tk.Checkbutton(cpu_tab, text="Pipelined conversion", variable=self.pipeline_var)
+        pipe.grid(row=0, column=2, padx=8, pady=8, sticky="w")
+        ToolTip(pipe, "Read, resample and write at the same time: each channel goes into the .ld as soon as it is ready and the CSV is written alongside the other outputs")
 
         tk.Label(mem_tab, text="RAM to reserve (GB):").grid(row=0, column=0, padx=8, pady=8, sticky="w")
         tk.Spinbox(mem_tab, from_=1, to=128, textvariable=self.ram_var, width=6).grid(row=0, column=1, padx=4, pady=8, sticky="w")
 
+        pyr = tk.Checkbutton(out_tab, text="Zoom pyramid (.pyr)", variable=self.pyramid_var)
+        pyr.grid(row=0, column=0, padx=8, pady=8, sticky="w")
+        ToolTip(pyr, "Also write min/max/mean summaries at 1/10, 1/100 and 1/1000 of the rate next to the .ld, for fast zoomed out views")
+        stats = tk.Checkbutton(out_tab, text="Per-lap stats (_laps.csv)", variable=self.lap_stats_var)
+        stats.grid(row=0, column=1, padx=8, pady=8, sticky="w")
+        ToolTip(stats, "Min/max/mean/first/last/integral of every channel for every lap, e.g. fuel used or time at full throttle")
+        align = tk.Checkbutton(out_tab, text="Distance + delta time", variable=self.align_var)
+        align.grid(row=0, column=2, padx=8, pady=8, sticky="w")
+        ToolTip(align, "Add Lap Distance and Delta Time (to the fastest lap) channels, and write every lap resampled on distance to _aligned.npz")
+        split = tk.Checkbutton(out_tab, text="One .ld per stint", variable=self.stints_var)
+        split.grid(row=0, column=3, padx=8, pady=8, sticky="w")
+        ToolTip(split, "Also write _stint1.ld, _stint2.ld, ... split at pit exits, driver changes and long stops")
+        tk.Label(out_tab, text="Math channels:").grid(row=1, column=0, padx=8, pady=4, sticky="w")
+        tk.Entry(out_tab, textvariable=self.math_path, width=50).grid(row=1, column=1, columnspan=2, padx=4, pady=4, sticky="we")
+        math_btn = tk.Button(out_tab, text="Browse...", command=self.pick_math)
+        math_btn.grid(row=1, column=3, padx=4, pady=4)
+        ToolTip(math_btn, "Expression file of derived channels (e.g. math_channels.example.txt), computed once during conversion and written as real channels")
+        tk.Label(out_tab, text="Decimation:").grid(row=2, column=0, padx=8, pady=4, sticky="w")
+        dec = ttk.Combobox(out_tab, textvariable=self.decimation_var, values=("mean", "minmax", "fir", "none"),
+                           state="readonly", width=10)
+        dec.grid(row=2, column=1, padx=4, pady=4, sticky="w")
+        ToolTip(dec, "Filter for groups set below the rate their channels are logged at: block mean, min/max (keeps peaks) or FIR low-pass, so fast content does not alias; none interpolates unfiltered")
+
+        jobsf = tk.LabelFrame(self, text="Jobs")
+        jobsf.pack(fill=tk.X, padx=10, pady=8)
+
+        columns = ("session", "groups", "status", "progress")
+        self.job_tree = ttk.Treeview(jobsf, columns=columns, show="headings", height=6)
+        for col, width in zip(columns, (260, 330, 110, 90)):
+            self.job_tree.heading(col, text=col.capitalize())
+            self.job_tree.column(col, width=width, anchor="w")
+        self.job_tree.pack(fill=tk.X, side=tk.LEFT, expand=True)
+        self.job_tree.bind("<Double-1>", lambda _e: self.preview_job())
+
+        buttons = tk.Frame(jobsf)
+        buttons.pack(fill=tk.Y, side=tk.RIGHT, padx=(6, 0))
+        for text, command in (
+            ("Add sessions...", self.add_sessions),
+            ("Move up", lambda: self.move_job(-1)),
+            ("Move down", lambda: self.move_job(1)),
+            ("Cancel", self.cancel_job),
+            ("Retry", self.retry_job),
+            ("Remove", self.remove_job),
+        ):
+            tk.Button(buttons, text=text, command=command, width=14).pack(pady=1)
+
         tk.Button(
             self,
             text="RUN → CUSTOM MoTeC",
@@ -223,13 +305,13 @@ class App(tk.Tk):
         tk.Label(status, text="Status:").grid(row=0, column=0, sticky="w")
         tk.Label(status, textvariable=self.status_var, font=("TkDefaultFont", 10, "bold")).grid(row=0, column=1, sticky="w", padx=(4, 20))
 
-        tk.Label(status, text="Step:").grid(row=0, column=2, sticky="w")
+        tk.Label(status, text="Done:").grid(row=0, column=2, sticky="w")
         tk.Label(status, textvariable=self.step_var).grid(row=0, column=3, sticky="w", padx=(4, 20))
 
         tk.Label(status, text="Overall completion:").grid(row=0, column=4, sticky="w")
         tk.Label(status, textvariable=self.percent_var, font=("TkDefaultFont", 11, "bold")).grid(row=0, column=5, sticky="w", padx=(4, 20))
 
-        tk.Label(status, text="Step time:").grid(row=1, column=0, sticky="w", pady=(6, 0))
+        tk.Label(status, text="Elapsed:").grid(row=1, column=0, sticky="w", pady=(6, 0))
         tk.Label(status, textvariable=self.elapsed_var).grid(row=1, column=1, sticky="w", pady=(6, 0))
 
         self.progress = ttk.Progressbar(status, orient="horizontal", mode="determinate", length=250)
@@ -237,8 +319,11 @@ class App(tk.Tk):
 
         status.grid_columnconfigure(5, weight=1)
 
-        logf = tk.LabelFrame(self, text="Logs")
-        logf.pack(fill=tk.BOTH, expand=True, padx=10, pady=8)
+        output = ttk.Notebook(self)
+        output.pack(fill=tk.BOTH, expand=True, padx=10, pady=8)
+
+        logf = ttk.Frame(output)
+        output.add(logf, text="Logs")
 
         self.log = tk.Text(logf, wrap="word", height=10, font=("Consolas", 9))
         self.log.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
@@ -247,6 +332,18 @@ class App(tk.Tk):
         sb.pack(fill=tk.Y, side=tk.RIGHT)
         self.log.config(yscrollcommand=sb.set)
 
+        self.pump = LogPump(self.log, self.handle_event)
+
+        # Channels of the last converted session (or of the one double-clicked)
+        self.preview = PreviewPane(output)
+        output.add(self.preview, text="Preview")
+        self.output = output
+
+    def on_close(self):
+        self.jobs.pause()
+        self.pool.stop()
+        self.destroy()
+
     def pick_db(self):
         path = filedialog.askopenfilename(
             title="Select DuckDB",
@@ -255,12 +352,16 @@ class App(tk.Tk):
         if path:
             self.db_path.set(path)
 
-    def run_all(self):
-        db = self.db_path.get().strip()
-        if not db or not os.path.exists(db):
-            messagebox.showerror("Error", "Select a valid .duckdb file.")
-            return
+    def pick_math(self):
+        path = filedialog.askopenfilename(
+            title="Select math channels file",
+            filetypes=[("Text", "*.txt"), ("All files", "*.*")]
+        )
+        if path:
+            self.math_path.set(path)
 
+    def selected_groups(self):
+        """Group/Hz profile currently set in the form, or None after an error."""
         selected = {}
         for g, v in self.group_vars.items():
             if v.get():
@@ -271,74 +372,230 @@ class App(tk.Tk):
                     selected[g] = hz
                 except Exception:
                     messagebox.showerror("Error", f"Invalid Hz for group {g}")
-                    return
+                    return None
 
         if not selected:
             messagebox.showerror("Error", "Select at least one group.")
+            return None
+        return selected
+
+    def job_options(self):
+        """Output options of the form, stored with each queued job."""
+        return {"pyramid": self.pyramid_var.get(),
+                "lap_stats": "csv" if self.lap_stats_var.get() else None,
+                "align": self.align_var.get(),
+                "math_file": self.math_path.get().strip() or None,
+                "stints": self.stints_var.get(),
+                "pipeline": self.pipeline_var.get(),
+                "decimation": None if self.decimation_var.get() == "none" else self.decimation_var.get()}
+
+    def add_sessions(self):
+        """Queues sessions with the group/Hz profile and options currently set in the form."""
+        paths = filedialog.askopenfilenames(
+            title="Select DuckDB sessions",
+            filetypes=[("DuckDB", "*.duckdb"), ("All files", "*.*")]
+        )
+        if not paths:
             return
+        selected = self.selected_groups()
+        if selected is None:
+            return
+        for path in paths:
+            self.jobs.add(path, selected, self.output_base(path), **self.job_options())
+
+    def selected_job(self):
+        selection = self.job_tree.selection()
+        return int(selection[0]) if selection else None
+
+    def move_job(self, offset):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.jobs.move(job_id, offset)
+
+    def cancel_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.jobs.cancel(job_id)
+
+    def retry_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.jobs.retry(job_id)
+
+    def remove_job(self):
+        job_id = self.selected_job()
+        if job_id is not None:
+            self.jobs.remove(job_id)
+
+    def preview_job(self, job=None):
+        if job is None:
+            job_id = self.selected_job()
+            if job_id is None:
+                return
+            job = self.jobs.get(job_id)
+        if job.status != job_queue.DONE:
+            return
+        try:
+            self.preview.load(self.outputs(job)[1])
+            self.output.select(self.preview)
+        except Exception as e:
+            self.pump.write(f"[{job.id}] preview failed: {e}\n")
 
-        master_hz = max(selected.values())
-
-        out_dir = os.path.join(self.project_dir, "Telemetry")
-        os.makedirs(out_dir, exist_ok=True)
+    def run_all(self):
+        queued = [j for j in self.jobs.jobs if j.status == job_queue.QUEUED]
+        if not queued:
+            # Nothing queued: convert the session in the form, as a single job
+            db = self.db_path.get().strip()
+            if not db or not os.path.exists(db):
+                messagebox.showerror("Error", "Select a valid .duckdb file or add sessions to the queue.")
+                return
+            selected = self.selected_groups()
+            if selected is None:
+                return
+            self.jobs.add(db, selected, self.output_base(db), **self.job_options())
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.pump.write(f"\nOutput in: {self.out_dir}\n")
+        self.pump.write(f"Cores dedicated: {self.cores_var.get()} | RAM reserved: {self.ram_var.get()} GB\n")
 
-        base = os.path.splitext(os.path.basename(db))[0]
-        csv_out = os.path.join(out_dir, f"{base}_CUSTOM.csv")
-        ld_out = os.path.join(out_dir, f"{base}_CUSTOM")
+        self.status_var.set("Running...")
+        self.start_time = time.time()
+        self.jobs.start(cores=self.cores_var.get())
+
+    def output_base(self, db):
+        """Output path (without extension) for a new job of db: <session>_CUSTOM, numbered _2, _3...
+        when a job in the list already writes it (the same session queued twice, or sessions with
+        the same name in different folders), so concurrent jobs never write the same files."""
+        stem = os.path.join(self.out_dir, os.path.splitext(os.path.basename(db))[0] + "_CUSTOM")
+        with self.jobs.lock:
+            taken = {os.path.normcase(j.output) for j in self.jobs.jobs if j.output}
+        base, n = stem, 1
+        while os.path.normcase(base) in taken:
+            n += 1
+            base = f"{stem}_{n}"
+        return base
+
+    def outputs(self, job):
+        """CSV and .ld files written by a job."""
+        return job.output + ".csv", job.output + ".ld"
+
+    def release_preview(self, ld_out):
+        """Closes the preview if it shows ld_out, which a job is about to rewrite. Jobs are also
+        started from worker threads: the preview is then released by the main loop, waited for."""
+        shown = self.preview.filename
+        if shown is None or os.path.normcase(os.path.abspath(shown)) != os.path.normcase(os.path.abspath(ld_out)):
+            return
+        if threading.current_thread() is threading.main_thread():
+            self.preview.release()
+            return
+        released = threading.Event()
+        self.pump.notify({"type": "release", "done": released})
+        released.wait(5)
+
+    def run_job(self, job, threads, callback):
+        """Starts a job of the queue with its share of cores, see JobQueue."""
+        csv_out, ld_out = self.outputs(job)
+        prefix = f"[{job.id}] "
+        self.release_preview(ld_out)
+
+        def on_event(event):
+            if event["type"] == "line":
+                self.pump.write(prefix + event["line"])
+                return
+            if event["type"] == "end":
+                self.pump.write(f"{prefix}done\n")
+            elif event["type"] == "error":
+                self.pump.write(f"{prefix}[ERROR] {event['error']}\n")
+                self.pump.write(event.get("traceback", ""))
+            callback(event)
+
+        self.pump.write(f"\n{prefix}{job.db} ({threads} cores)\n")
+        if self.pool is not None:
+            try:
+                return self.pool.run(on_event, db=job.db, out_csv=csv_out, group_hz=job.group_hz,
+                                     out_ld=ld_out, threads=threads, **job.options)
+            except Exception as e:
+                self.pump.write(f"Conversion service unavailable, using subprocesses: {e}\n")
+                self.pool = None
 
+        # The converter writes the .ld directly from its resampled data
         unified = os.path.join(self.project_dir, "duckdb_to_motec_unified.py")
-        generator = os.path.join(self.project_dir, "motec_log_generator.py")
-
-        args = [f"{g}={hz}" for g, hz in selected.items()]
-
-        cmds = [
-            [sys.executable, unified, db, csv_out, *args],
-            [sys.executable, generator, csv_out, "CSV", "--frequency", str(master_hz), "--output", ld_out]
-        ]
-
-        self.log.insert(tk.END, f"\nOutput in: {out_dir}\n")
-        self.log.insert(tk.END, f"Cores dedicated: {self.cores_var.get()} | RAM reserved: {self.ram_var.get()} GB\n")
-        self.log.see(tk.END)
+        args = [f"{g}={hz}" for g, hz in job.group_hz.items()]
+        cmd = [sys.executable, unified, job.db, csv_out, *args, "--ld", ld_out,
+               "--progress", "--threads", str(threads)]
+        if job.options.get("pyramid"):
+            cmd.append("--pyramid")
+        if job.options.get("lap_stats"):
+            cmd += ["--lap-stats", job.options["lap_stats"]]
+        if job.options.get("align"):
+            cmd.append("--align")
+        if job.options.get("math_file"):
+            cmd += ["--math", job.options["math_file"]]
+        if job.options.get("stints"):
+            cmd.append("--stints")
+        if job.options.get("pipeline"):
+            cmd.append("--pipeline")
+        cmd += ["--decimate", job.options.get("decimation") or "none"]
+        try:
+            return run_subprocess(cmd, self.pump, on_event, cwd=self.project_dir, prefix=prefix)
+        except Exception as e:
+            on_event({"type": "error", "error": str(e)})
+            return None
+
+    def job_changed(self, job):
+        # Called from worker threads: only the latest state of each job is shown
+        self.pump.notify({"type": "job", "job": job}, key=("job", job.id))
+
+    def handle_event(self, event):
+        if event.get("type") == "release":
+            self.preview.release()
+            event["done"].set()
+            return
+        if event.get("type") != "job":
+            return
 
-        self.status_var.set("Running...")
-        self.step_var.set("Step 0/0")
-        self.percent_var.set("0%")
-        self.elapsed_var.set("0.0s")
-        self.progress.config(value=0, maximum=100)
-
-        def handle_progress(event):
-            etype = event.get("type")
-            total = event.get("total", 1)
-            index = event.get("index", 0)
-
-            if etype in {"start", "tick", "end", "stop", "error"}:
-                elapsed = event.get("elapsed", 0.0)
-                self.elapsed_var.set(f"{elapsed:.1f}s")
-
-                completed = index - 1 if etype == "start" else index
-                percent = int((completed / total) * 100)
-                self.percent_var.set(f"{percent}%")
-                self.step_var.set(f"Step {index}/{total}")
-                self.status_var.set("Processing")
-                self.progress.config(value=percent)
-
-            if etype == "between":
-                msg = event.get("message", "")
-                self.status_var.set(msg or "Waiting for the next step…")
-
-            if etype == "done":
-                if event.get("stopped"):
-                    self.status_var.set("Stopped")
-                else:
-                    self.status_var.set("Completed")
-                    self.percent_var.set("100%")
-                    self.progress.config(value=100)
-                self.elapsed_var.set("-")
-
-            if etype in {"stop", "error"}:
-                self.status_var.set("Stopped")
-
-        run_chain(cmds, self.log, cwd=self.project_dir, progress_cb=handle_progress)
+        job = event["job"]
+        iid = str(job.id)
+        if job not in self.jobs.jobs:
+            if self.job_tree.exists(iid):
+                self.job_tree.delete(iid)
+        else:
+            groups = ", ".join(f"{g}={hz}" for g, hz in job.group_hz.items())
+            status = job.status if not job.message else f"{job.status}: {job.message}"
+            values = (os.path.basename(job.db), groups, status, f"{job.percent:.0f}%")
+            if self.job_tree.exists(iid):
+                self.job_tree.item(iid, values=values)
+            else:
+                self.job_tree.insert("", tk.END, iid=iid, values=values)
+            self.job_tree.move(iid, "", self.jobs.jobs.index(job))
+            if job.status == job_queue.DONE and (job.id, job.runs) not in self.previewed:
+                self.previewed.add((job.id, job.runs))
+                self.preview_job(job)
+        self.update_status()
+
+    def update_status(self):
+        jobs = list(self.jobs.jobs)
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+
+        finished = sum(counts.get(s, 0) for s in job_queue.FINISHED)
+        self.step_var.set(f"Jobs {finished}/{len(jobs)}")
+        percent = int(self.jobs.percent())
+        self.percent_var.set(f"{percent}%")
+        self.progress.config(value=percent, maximum=100)
+        if self.start_time is not None:
+            self.elapsed_var.set(f"{time.time() - self.start_time:.1f}s")
+
+        if counts.get(job_queue.RUNNING) or (self.jobs.running and counts.get(job_queue.QUEUED)):
+            self.status_var.set(f"Running {counts.get(job_queue.RUNNING, 0)}, "
+                                f"queued {counts.get(job_queue.QUEUED, 0)}")
+        elif counts.get(job_queue.FAILED):
+            self.status_var.set(f"Completed, {counts[job_queue.FAILED]} failed")
+        elif jobs:
+            self.status_var.set("Completed" if finished == len(jobs) else "Ready")
+        else:
+            self.status_var.set("Ready")
 
 if __name__ == "__main__":
     App().mainloop()
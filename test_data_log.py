@@ -1,6 +1,60 @@
+import os
+import random
+import struct
+import tempfile
 import unittest
+from unittest import mock
 
-from data_log import DataLog, Message
+import cantools
+
+from data_log import DataLog, Message, bin_can_frames, can_log_shards, decode_can_frames
+
+
+DBC = """VERSION ""
+
+BS_:
+
+BU_: ECU
+
+BO_ 256 Engine: 8 ECU
+ SG_ EngineSpeed : 0|16@1+ (0.25,0) [0|16383.75] "rpm" ECU
+ SG_ CoolantTemp : 16|8@1- (1,-40) [-40|215] "degC" ECU
+ SG_ ThrottlePos : 31|12@0+ (0.1,0) [0|409.5] "%" ECU
+ SG_ OilPressure : 47|10@0- (0.01,1) [-4|6] "bar" ECU
+
+BO_ 512 Chassis: 8 ECU
+ SG_ Mux M : 0|8@1+ (1,0) [0|255] "" ECU
+ SG_ WheelSpeedFL m0 : 8|16@1+ (0.01,0) [0|655.35] "km/h" ECU
+ SG_ WheelSpeedFR m1 : 8|16@1+ (0.01,0) [0|655.35] "km/h" ECU
+"""
+
+FLOAT_DBC = """VERSION ""
+
+BS_:
+
+BU_: ECU
+
+BO_ 768 Imu: 8 ECU
+ SG_ YawRate : 0|32@1- (1,0) [-10|10] "rad/s" ECU
+ SG_ LatAccel : 32|32@1- (1,0) [-50|50] "m/s2" ECU
+
+SIG_VALTYPE_ 768 YawRate : 1;
+SIG_VALTYPE_ 768 LatAccel : 1;
+"""
+
+
+
+def candump_lines(can_db, count=200, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        msg = can_db.messages[i % len(can_db.messages)]
+        data = bytes(rng.getrandbits(8) for _ in range(msg.length))
+        if msg.is_multiplexed():
+            data = bytes([(i // 2) % 2]) + data[1:]
+        lines.append("(%.6f) can0 %03X#%s\n" % (i * 0.001, msg.frame_id, data.hex().upper()))
+    lines.append("(1.000000) can0 7FF#0102\n")
+    return lines
 
 
 class DataLogResampleTests(unittest.TestCase):
@@ -17,6 +71,98 @@ class DataLogResampleTests(unittest.TestCase):
         self.assertEqual([m.value for m in log.channels["Beacon"].messages], [1, 0, 1])
         self.assertEqual(len(log.channels["Speed"].messages), 2)  # resampled to duration=2s -> 2 samples
 
+    def test_filtered_modes(self):
+        log = DataLog()
+        log.add_channel("Speed", "km/h", float, 2)
+        log.channels["Speed"].messages.extend(Message(i * 0.1, float(i % 2)) for i in range(40))
+        log.add_channel("Gear", "", int, 0)
+        log.channels["Gear"].messages.extend(Message(i * 0.1, i // 10) for i in range(40))
+
+        log.resample(1.0, mode="mean")
+
+        # the first interval holds the messages before 0.5 s, the others a whole second
+        self.assertListEqual([m.value for m in log.channels["Speed"].messages], [0.4, 0.5, 0.5])
+        self.assertListEqual([m.value for m in log.channels["Gear"].messages], [0, 1, 2])
+
+        with self.assertRaises(ValueError):
+            log.channels["Speed"].resample(0.0, 3.0, 1.0, mode="median")
+
+
+class CanDecodeTests(unittest.TestCase):
+    def setUp(self):
+        self.can_db = cantools.database.load_string(DBC, "dbc")
+        self.lines = candump_lines(self.can_db)
+
+    def test_vectorised_decode_matches_cantools(self):
+        signals = decode_can_frames(bin_can_frames(self.lines), self.can_db)
+
+        expected = {}
+        for line in self.lines:
+            stamp, _, msg = line.split()
+            id, data = msg.split("#")
+            try:
+                decoded = self.can_db.decode_message(int(id, 16), bytes.fromhex(data),
+                                                     decode_choices=False)
+            except KeyError:
+                continue
+            for name, value in decoded.items():
+                expected.setdefault(name, []).append((float(stamp[1:-1]), float(value)))
+
+        self.assertEqual(set(signals), set(expected))
+        for name, samples in expected.items():
+            units, stamps, values = signals[name]
+            self.assertEqual(stamps.tolist(), [s[0] for s in samples], name)
+            for value, (_, reference) in zip(values.tolist(), samples):
+                self.assertAlmostEqual(value, reference, places=9, msg=name)
+
+    def test_float_signals_decode_each_frame_once(self):
+        can_db = cantools.database.load_string(FLOAT_DBC, "dbc")
+        imu = can_db.get_message_by_name("Imu")
+        samples = [(0.001 * i, 0.25 * i) for i in range(50)]
+        lines = ["(%.6f) can0 300#%s\n" % (i * 0.01, struct.pack("<ff", yaw, lat).hex().upper())
+                 for i, (yaw, lat) in enumerate(samples)]
+
+        with mock.patch.object(imu, "decode", wraps=imu.decode) as decode:
+            signals = decode_can_frames(bin_can_frames(lines), can_db)
+
+        self.assertEqual(decode.call_count, len(samples))
+        for n, name in enumerate(("YawRate", "LatAccel")):
+            expected = [struct.unpack("<f", struct.pack("<f", s[n]))[0] for s in samples]
+            self.assertEqual(signals[name][2].tolist(), expected)
+
+    def test_from_can_log_creates_channels(self):
+        log = DataLog()
+        log.from_can_log(self.lines, self.can_db)
+
+        self.assertIn("EngineSpeed", log.channels)
+        self.assertEqual(log.channels["CoolantTemp"].units, "degC")
+        self.assertEqual(len(log.channels["EngineSpeed"].messages), 100)
+        self.assertEqual(len(log.channels["WheelSpeedFL"].messages), 50)
+
+    def test_sharded_file_matches_single_pass(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, "dump.log")
+            dbc_path = os.path.join(tmp, "test.dbc")
+            with open(log_path, "w") as f:
+                f.writelines(self.lines)
+            with open(dbc_path, "w") as f:
+                f.write(DBC)
+
+            shards = can_log_shards(log_path, 1000)
+            self.assertGreater(len(shards), 1)
+            self.assertEqual(shards[0][0], 0)
+            self.assertEqual(shards[-1][1], os.path.getsize(log_path))
+
+            reference = DataLog()
+            reference.from_can_log(self.lines, self.can_db)
+            sharded = DataLog()
+            sharded.from_can_file(log_path, dbc_path, max_workers=2, shard_size=1000)
+
+        self.assertEqual(set(sharded.channels), set(reference.channels))
+        for name, channel in reference.channels.items():
+            self.assertEqual([(m.timestamp, m.value) for m in sharded.channels[name].messages],
+                             [(m.timestamp, m.value) for m in channel.messages], name)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from decimate import channel_window, decimate, minmax, window_mean, window_minmax
+from fixtures import make_ld_data
+from ldparser.ldparser import ldData
+
+
+class MinMaxTests(unittest.TestCase):
+    def test_keeps_extremes_of_each_bucket_in_order(self):
+        values = np.array([0, 5, -3, 1, 2, 9, 8, -7, 4, 4], dtype=np.float32)
+
+        indices, kept = minmax(values, 2)
+
+        self.assertListEqual(indices.tolist(), [1, 2, 5, 7])
+        self.assertListEqual(kept.tolist(), [5, -3, 9, -7])
+
+    def test_remainder_bucket(self):
+        values = np.arange(11, dtype=np.float64)[::-1]
+
+        indices, kept = minmax(values, 2)
+
+        # buckets of 6, the last one shorter
+        self.assertListEqual(indices.tolist(), [0, 5, 6, 10])
+        self.assertEqual(kept.max(), 10)
+        self.assertEqual(kept.min(), 0)
+
+    def test_at_most_two_points_per_bucket(self):
+        for n in (2001, 2999, 3001, 10 ** 5 + 7):
+            indices, kept = minmax(np.random.default_rng(n).random(n), 1000)
+            self.assertLessEqual(len(kept), 2000, msg=n)
+
+    def test_short_series_unchanged(self):
+        values = np.arange(5)
+        indices, kept = minmax(values, 10)
+        self.assertListEqual(kept.tolist(), values.tolist())
+
+    def test_large_series_reduced_to_buckets(self):
+        values = np.sin(np.arange(2000003) / 1000.0)
+        indices, kept = minmax(values, 1000)
+
+        self.assertLessEqual(len(kept), 2000)
+        self.assertTrue(np.all(np.diff(indices) >= 0))
+        self.assertAlmostEqual(kept.max(), values.max())
+        self.assertAlmostEqual(kept.min(), values.min())
+
+
+class ChannelWindowTests(unittest.TestCase):
+    def test_window_of_ld_channel(self):
+        fd, filename = tempfile.mkstemp(suffix=".ld")
+        os.close(fd)
+        self.addCleanup(os.remove, filename)
+        data = np.cos(np.arange(5000) / 50.0).astype(np.float32)
+        make_ld_data([("Speed", np.float32, 100, 0, data)]).write(filename)
+
+        with ldData.fromfile(filename) as ld_data:
+            chan = ld_data.channs[0]
+            times, values = channel_window(chan, 1000, 5.0, 10.0)
+            self.assertListEqual(values.tolist(), data[500:1000].tolist())
+            self.assertAlmostEqual(times[0], 5.0)
+
+            times, values = channel_window(chan, 10)
+            self.assertEqual(len(values), 20)
+            self.assertAlmostEqual(values.max(), data.max())
+
+
+class DecimateTests(unittest.TestCase):
+    def test_block_mean_with_tail(self):
+        values = np.arange(10, dtype=np.float64)
+        values[1] = np.nan
+
+        positions, means = decimate(values, 4)
+
+        self.assertListEqual(positions.tolist(), [1.5, 5.5, 8.5])
+        np.testing.assert_allclose(means, [5 / 3.0, 5.5, 8.5])
+
+    def test_minmax_reshape_matches_windows(self):
+        values = np.random.default_rng(3).normal(size=1003)
+
+        positions, kept = decimate(values, 5, "minmax")
+        expected = window_minmax(values, np.minimum(np.arange(5, 1008, 5), 1003))
+
+        np.testing.assert_array_equal(positions, expected[0])
+        np.testing.assert_array_equal(kept, expected[1])
+        self.assertEqual(kept.max(), values.max())
+        self.assertEqual(kept.min(), values.min())
+
+    def test_window_mean_of_irregular_windows(self):
+        means = window_mean([1.0, 3.0, 5.0, 7.0], [2, 2, 4])
+
+        np.testing.assert_array_equal(np.isnan(means), [False, True, False])
+        self.assertListEqual(means[[0, 2]].tolist(), [2.0, 6.0])
+
+    def test_filters_suppress_aliasing(self):
+        # 47 Hz logged at 100 Hz would alias to 3 Hz at 10 Hz
+        time = np.arange(0, 20, 0.01)
+        values = np.sin(2 * np.pi * 47 * time)
+
+        self.assertGreater(np.abs(values[::10]).max(), 0.5)
+        self.assertLess(np.abs(decimate(values, 10, "mean")[1]).max(), 0.1)
+        self.assertLess(np.abs(decimate(values, 10, "fir")[1]).max(), 0.01)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            decimate(np.zeros(10), 2, "median")
+
+
+if __name__ == "__main__":
+    unittest.main()
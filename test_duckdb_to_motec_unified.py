@@ -1,7 +1,11 @@
+import os
+import tempfile
 import unittest
+import numpy as np
 import pandas as pd
 
-from duckdb_to_motec_unified import compute_lap_channels
+from duckdb_to_motec_unified import compute_lap_channels, resample_table, write_ld
+from ldparser.ldparser import ldData
 
 
 class LapDetectionTests(unittest.TestCase):
@@ -51,5 +55,63 @@ class LapDetectionTests(unittest.TestCase):
         self.assertListEqual(lap_time.tolist(), [0.0, 1.0, 2.0, 0.0, 1.0])
 
 
+class ResampleTableTests(unittest.TestCase):
+    def test_table_logged_faster_than_group_is_decimated(self):
+        # 100 Hz table, 10 Hz group: 47 Hz content must not alias into the 10 Hz channel
+        time = np.arange(0, 20, 0.01)
+        df = pd.DataFrame({"value": np.sin(2 * np.pi * 47 * time) + 5.0})
+        master_time = np.arange(0, 20, 0.1)
+
+        data = {}
+        resample_table(df, "Throttle Pos", 10, master_time, data, set(), "fir")
+        filtered = data["Throttle Pos"][5:-5]
+        plain = {}
+        resample_table(df, "Throttle Pos", 10, master_time, plain, set())
+
+        np.testing.assert_allclose(filtered, 5.0, atol=0.01)
+        # without a filter the samples at the master times are taken as they are
+        np.testing.assert_allclose(plain["Throttle Pos"], df["value"].to_numpy()[::10])
+
+    def test_table_keeps_its_own_rate(self):
+        # 20 Hz table in a 15 Hz group, 100 Hz table in a 5 Hz group without a filter
+        master_time = np.arange(0, 20, 1 / 15.0)
+        data = {}
+        resample_table(pd.DataFrame({"value": np.arange(0, 20, 0.05)}), "Brake Pos", 15,
+                       master_time, data, set(), "mean")
+        resample_table(pd.DataFrame({"value": np.arange(0, 20, 0.01)}), "Throttle Pos", 5,
+                       master_time, data, set())
+
+        self.assertAlmostEqual(data["Brake Pos"][150], 10.0)
+        self.assertAlmostEqual(data["Throttle Pos"][150], 10.0)
+
+
+
+class WriteLdTests(unittest.TestCase):
+    def test_unknown_channels_keep_their_precision(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "session.ld")
+        n = 500
+        out = pd.DataFrame({
+            "Time": np.arange(n) / 10.0,
+            "Beacon": np.zeros(n, dtype=np.int16),
+            "LapTime": np.arange(n) / 10.0,
+            "Lap": np.ones(n),
+            "Tyre Temp FL": np.linspace(60.0, 95.0, n),
+            "GPS Latitude": 45.9 + np.linspace(0, 0.01, n),
+            "Yaw Rate": 0.004 * np.sin(np.arange(n) / 7.0),
+        })
+
+        write_ld(out, path, 10)
+
+        with ldData.fromfile(path) as ld:
+            # decimals known from the name: quantised
+            self.assertEqual(ld["Tyre Temp FL"].dtype, np.int16)
+            # unknown: float32, not 0.01 steps
+            for name in ("GPS Latitude", "Yaw Rate"):
+                self.assertEqual(ld[name].dtype, np.float32)
+                np.testing.assert_allclose(ld[name].data, out[name], rtol=1e-6, atol=1e-9)
+
+
 if __name__ == "__main__":
     unittest.main()
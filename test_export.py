@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import duckdb_to_motec_unified as unified
+from fixtures import make_session
+from ldparser.ldparser import ldData
+
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "session.duckdb")
+        make_session(self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_profile_validation(self):
+        for profile in ({}, {"targets": [{"name": "a"}]},
+                        {"targets": [{"name": "a", "groups": {"Driver": 10}, "format": "xls"}]},
+                        {"targets": [{"name": "a", "groups": {"Driver": 10}, "decimation": "median"}]},
+                        {"targets": [{"name": "a", "groups": {"Driver": 10}}] * 2}):
+            with self.assertRaises(ValueError, msg=profile):
+                unified.load_profile(profile)
+
+    def test_targets_from_one_read(self):
+        profile = {"targets": [
+            {"name": "full", "groups": {"Driver": 100, "Dynamics": 100}, "format": "ld+csv"},
+            {"name": "strategy", "groups": {"Environment": 1, "Dynamics": 1}},
+            {"name": "slice", "groups": {"Driver": 50}, "format": "csv", "start": 10, "end": 20},
+        ]}
+        out_dir = os.path.join(self.tmp.name, "out")
+
+        written = unified.export(self.db, profile, out_dir)
+
+        self.assertListEqual(sorted(written), ["full", "slice", "strategy"])
+        self.assertListEqual([os.path.basename(p) for p in written["full"]],
+                             ["session_full.csv", "session_full.ld"])
+
+        with ldData.fromfile(written["strategy"][0]) as strategy:
+            self.assertEqual(strategy["Ground Speed"].freq, 1)
+            self.assertIn("Track Temp", [c.name for c in strategy.channs])
+            self.assertNotIn("Throttle Pos", [c.name for c in strategy.channs])
+
+        sliced = pd.read_csv(written["slice"][0])
+        self.assertEqual(len(sliced), 500)
+        self.assertAlmostEqual(sliced["Time"].iloc[0], 10.0)
+        # 100 Hz throttle ramp over 60 s in a 50 Hz group
+        self.assertAlmostEqual(sliced["Throttle Pos"].iloc[0], 100 * 1000 / 5999.0, places=1)
+
+    def test_full_target_matches_convert(self):
+        out_dir = os.path.join(self.tmp.name, "out")
+        written = unified.export(self.db, {"targets": [
+            {"name": "full", "groups": {"Driver": 100, "Dynamics": 100}, "format": "csv"}]}, out_dir)
+        single = os.path.join(self.tmp.name, "single.csv")
+        unified.convert(self.db, single, {"Driver": 100, "Dynamics": 100})
+
+        with open(written["full"][0]) as a, open(single) as b:
+            self.assertEqual(a.read(), b.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+import job_queue
+
+
+class FakeRunner(object):
+    """ Records the started jobs, which are finished by hand with end()/fail(). """
+    def __init__(self):
+        self.started = {}
+        self.cancelled = []
+
+    def __call__(self, job, threads, callback):
+        self.started[job.id] = (threads, callback)
+        return lambda: self.cancelled.append(job.id)
+
+    def end(self, job):
+        self.started[job.id][1]({"type": "end"})
+
+    def fail(self, job):
+        self.started[job.id][1]({"type": "error", "error": "boom"})
+
+
+class JobQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.runner = FakeRunner()
+        self.queue = job_queue.JobQueue(self.runner, cores=4)
+
+    def add(self, n):
+        return [self.queue.add("s%d.duckdb" % i, {"Driver": 100}) for i in range(n)]
+
+    def test_cores_are_shared_between_jobs(self):
+        jobs = self.add(3)
+        self.queue.start()
+
+        threads = [self.runner.started[job.id][0] for job in jobs]
+        self.assertEqual(threads, [1, 1, 2])
+        self.assertEqual(self.queue.busy_cores(), 4)
+
+    def test_finished_job_frees_its_cores(self):
+        jobs = self.add(6)
+        self.queue.start()
+        self.assertEqual(sum(job.status == job_queue.RUNNING for job in jobs), 4)
+
+        self.runner.end(jobs[0])
+        self.runner.fail(jobs[1])
+        self.assertEqual(jobs[0].status, job_queue.DONE)
+        self.assertEqual(jobs[1].status, job_queue.FAILED)
+        self.assertEqual(jobs[4].status, job_queue.RUNNING)
+        self.assertEqual(jobs[5].status, job_queue.RUNNING)
+        self.assertEqual(self.queue.busy_cores(), 4)
+
+    def test_reorder_changes_start_order(self):
+        self.queue = job_queue.JobQueue(self.runner, cores=1)
+        jobs = self.add(3)
+        self.queue.move(jobs[2].id, -2)
+        self.queue.start()
+
+        self.assertEqual(list(self.runner.started), [jobs[2].id])
+
+    def test_cancel_and_retry(self):
+        self.queue = job_queue.JobQueue(self.runner, cores=1)
+        jobs = self.add(2)
+        self.queue.start()
+
+        self.queue.cancel(jobs[0].id)
+        self.assertEqual(self.runner.cancelled, [jobs[0].id])
+        self.assertEqual(jobs[0].status, job_queue.CANCELLED)
+        self.assertEqual(jobs[1].status, job_queue.RUNNING)
+
+        # Events of the cancelled run are ignored after the retry
+        stale = self.runner.started[jobs[0].id][1]
+        self.queue.retry(jobs[0].id)
+        self.runner.end(jobs[1])
+        self.assertEqual(jobs[0].status, job_queue.RUNNING)
+        stale({"type": "error", "error": "killed"})
+        self.assertEqual(jobs[0].status, job_queue.RUNNING)
+
+        self.runner.end(jobs[0])
+        self.assertEqual(self.queue.percent(), 100.0)
+
+    def test_output_is_not_a_convert_option(self):
+        job = self.queue.add("s.duckdb", {"Driver": 100}, "out/s_CUSTOM_2", pipeline=True)
+        self.assertEqual(job.output, "out/s_CUSTOM_2")
+        self.assertEqual(job.options, {"pipeline": True})
+
+if __name__ == "__main__":
+    unittest.main()
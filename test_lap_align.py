@@ -0,0 +1,78 @@
+import unittest
+
+import numpy as np
+
+import lap_align
+
+
+def session(lap_times=(30.0, 28.0, 29.0), hz=100, lap_length=1000.0):
+    """Laps of a fixed length at constant speed, one per lap time."""
+    time, lap, speed, lap_time = [], [], [], []
+    t0 = 0.0
+    for number, duration in enumerate(lap_times, start=1):
+        t = np.arange(0, duration, 1 / hz)
+        time.append(t0 + t)
+        lap_time.append(t)
+        lap.append(np.full(len(t), number))
+        speed.append(np.full(len(t), lap_length / duration * 3.6))
+        t0 += duration
+    return tuple(np.concatenate(a) for a in (time, lap, speed, lap_time))
+
+
+class LapAlignTests(unittest.TestCase):
+    def test_distance_from_speed_restarts_every_lap(self):
+        time, lap, speed, _ = session()
+
+        distance = lap_align.lap_distance(time, lap, speed=speed)
+
+        starts = np.flatnonzero(np.diff(lap)) + 1
+        np.testing.assert_allclose(distance[starts], 0.0)
+        self.assertAlmostEqual(distance[starts[0] - 1], 1000.0, delta=1.0)
+        self.assertTrue((np.diff(distance)[lap[1:] == lap[:-1]] >= 0).all())
+
+    def test_distance_channel_made_monotonic(self):
+        time, lap, _, _ = session(lap_times=(10.0, 10.0))
+        sim = (time % 10.0) * 100.0 + 50.0
+        sim[200] -= 30.0  # glitch going backwards
+
+        distance = lap_align.lap_distance(time, lap, distance=sim)
+
+        self.assertEqual(distance[0], 0.0)
+        self.assertEqual(distance[200], distance[199])
+        self.assertTrue((np.diff(distance[:1000]) >= 0).all())
+
+    def test_align_puts_laps_on_one_grid(self):
+        time, lap, speed, lap_time = session()
+        distance = lap_align.lap_distance(time, lap, speed=speed)
+
+        grid, laps, matrices = lap_align.align(distance, lap, {"LapTime": lap_time}, step=10.0)
+
+        np.testing.assert_array_equal(laps, [1, 2, 3])
+        self.assertEqual(matrices["LapTime"].shape, (3, len(grid)))
+        # halfway round each lap took half its lap time
+        half = np.searchsorted(grid, 500.0)
+        np.testing.assert_allclose(matrices["LapTime"][:, half], [15.0, 14.0, 14.5], atol=0.02)
+        # past the end of a lap is NaN
+        self.assertTrue(np.isnan(matrices["LapTime"][:, -1]).any())
+
+    def test_delta_time_to_fastest_lap(self):
+        time, lap, speed, lap_time = session()
+        distance = lap_align.lap_distance(time, lap, speed=speed)
+
+        self.assertEqual(lap_align.reference_lap(distance, lap, lap_time), 1)
+        delta = lap_align.delta_time(distance, lap, lap_time)
+
+        middle = np.flatnonzero((lap == 1) & (np.abs(distance - 500.0) < 1.0))[0]
+        self.assertAlmostEqual(delta[middle], 1.0, delta=0.05)
+        np.testing.assert_allclose(delta[(lap == 2) & (distance < 900.0)], 0.0, atol=0.02)
+
+    def test_partial_lap_is_not_reference(self):
+        time, lap, speed, lap_time = session(lap_times=(30.0, 29.0, 5.0))
+        speed[lap == 3] = 0.1  # crawling out lap, barely covers any distance
+        distance = lap_align.lap_distance(time, lap, speed=speed)
+
+        self.assertEqual(lap_align.reference_lap(distance, lap, lap_time), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from lap_stats import derived_channels, lap_channel_stats, lap_starts
+
+
+class LapStatsTests(unittest.TestCase):
+    def test_lap_starts(self):
+        self.assertListEqual(lap_starts([1, 1, 2, 2, 2, 3]).tolist(), [0, 2, 5])
+
+    def test_per_lap_per_channel_aggregates(self):
+        time = np.arange(6) * 0.5
+        lap = [1, 1, 1, 2, 2, 2]
+        speed = [10.0, 20.0, 30.0, 40.0, np.nan, 60.0]
+        fuel = [50.0, 49.5, 49.0, 48.5, 48.0, 47.5]
+
+        stats = lap_channel_stats(time, lap, {"Speed": speed, "Fuel": fuel})
+        speed_stats = stats[stats.channel == "Speed"].set_index("lap")
+        fuel_stats = stats[stats.channel == "Fuel"].set_index("lap")
+
+        self.assertEqual(len(stats), 4)
+        self.assertListEqual(speed_stats["min"].tolist(), [10.0, 40.0])
+        self.assertListEqual(speed_stats["max"].tolist(), [30.0, 60.0])
+        self.assertListEqual(speed_stats["mean"].tolist(), [20.0, 50.0])
+        self.assertListEqual(speed_stats["integral"].tolist(), [30.0, 50.0])
+        self.assertListEqual(speed_stats["duration"].tolist(), [1.5, 1.5])
+        self.assertListEqual(speed_stats["start"].tolist(), [0.0, 1.5])
+        # fuel used in the lap
+        self.assertListEqual((fuel_stats["first"] - fuel_stats["last"]).round(6).tolist(), [1.0, 1.0])
+
+    def test_time_at_full_throttle(self):
+        out = pd.DataFrame({"Time": np.arange(4) * 0.1, "Throttle Pos": [0.0, 99.0, 100.0, 50.0]})
+        extra = derived_channels(out)
+
+        stats = lap_channel_stats(out["Time"], [1, 1, 1, 1], extra)
+        self.assertAlmostEqual(stats["integral"].iloc[0], 0.2)
+
+    def test_no_channels(self):
+        stats = lap_channel_stats([0.0, 1.0], [1, 1], {})
+        self.assertEqual(len(stats), 0)
+        self.assertIn("integral", stats.columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
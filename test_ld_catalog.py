@@ -0,0 +1,68 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from ld_catalog import LdCatalog
+from ldparser.ldparser import ldData
+
+
+class LdCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmp.name, "sessions")
+        os.makedirs(os.path.join(self.data_dir, "2024"))
+        self.catalog = LdCatalog(os.path.join(self.tmp.name, "catalog.sqlite"))
+
+        sessions = [
+            ("a.ld", "Alice", "Le Mans", "Race", datetime.datetime(2024, 6, 15, 16), ["Speed", "Fuel"]),
+            ("2024/b.ld", "Bob", "Le Mans", "Qualifying", datetime.datetime(2024, 6, 13, 20), ["Speed"]),
+            ("2024/c.ld", "Alice", "Spa", "Race", datetime.datetime(2024, 5, 4, 13), ["Speed"]),
+        ]
+        for name, driver, venue, session, when, channels in sessions:
+            self.write(name, driver, venue, session, when, channels)
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp.cleanup()
+
+    def write(self, name, driver, venue, session, when, channels):
+        ldData.from_frame({c: np.zeros(100, np.float32) for c in channels}, freq=10,
+                          driver=driver, venue=venue, event="WEC", session=session,
+                          date_time=when).write(os.path.join(self.data_dir, name))
+
+    def paths(self, **filters):
+        return [os.path.relpath(row[0], self.data_dir) for row in self.catalog.query(**filters)]
+
+    def test_queries(self):
+        self.assertEqual(self.catalog.update(self.data_dir, max_workers=2), (3, 0))
+
+        self.assertEqual(self.paths(driver="alice"), [os.path.join("2024", "c.ld"), "a.ld"])
+        self.assertEqual(self.paths(venue="le mans", session="race"), ["a.ld"])
+        self.assertEqual(self.paths(channels=["fuel"]), ["a.ld"])
+        self.assertEqual(self.paths(since="2024-06-01", until="2024-06-13"),
+                         [os.path.join("2024", "b.ld")])
+
+        row = self.catalog.query(channels=["Fuel"])[0]
+        self.assertEqual(row[4:7], ("Le Mans", "WEC", "Race"))
+        self.assertAlmostEqual(row[8], 10.0)
+
+    def test_incremental_update(self):
+        self.catalog.update(self.data_dir, max_workers=1)
+        self.assertEqual(self.catalog.update(self.data_dir, max_workers=1), (0, 0))
+
+        os.remove(os.path.join(self.data_dir, "2024", "b.ld"))
+        time.sleep(0.01)
+        self.write("a.ld", "Carol", "Le Mans", "Race", datetime.datetime(2024, 6, 15, 16), ["Speed"])
+
+        self.assertEqual(self.catalog.update(self.data_dir, max_workers=1), (1, 1))
+        self.assertEqual(self.paths(driver="carol"), ["a.ld"])
+        self.assertEqual(self.paths(channels=["Fuel"]), [])
+        self.assertEqual(len(self.catalog.query()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
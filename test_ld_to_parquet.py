@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from ld_to_parquet import convert_directory
+from ldparser.ldparser import ldData
+
+
+class LdToParquetTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmp.name, "ld")
+        self.output_dir = os.path.join(self.tmp.name, "parquet")
+        os.makedirs(self.input_dir)
+
+        for n, driver in enumerate(["Alice", "Bob"]):
+            channels = {"Speed": np.arange(100, dtype=np.float32) + n,
+                        "Tyre Temp": np.linspace(80, 90, 10)}
+            spec = {"Speed": {"freq": 100}, "Tyre Temp": {"freq": 10, "decimals": 1}}
+            ldData.from_frame(channels, spec, driver=driver, venue="Spa").write(
+                os.path.join(self.input_dir, "session%d.ld" % n))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_wide_layout_per_frequency(self):
+        results = convert_directory(self.input_dir, self.output_dir, max_workers=2)
+        self.assertEqual(sorted(results.values()), [2, 2])
+
+        table = pq.read_table(os.path.join(self.output_dir, "freq_hz=100", "session1.parquet"),
+                              columns=["time", "Speed", "driver"])
+        self.assertEqual(table.num_rows, 100)
+        np.testing.assert_array_equal(table["Speed"].to_numpy(), np.arange(100) + 1)
+        self.assertAlmostEqual(table["time"][10].as_py(), 0.1)
+        self.assertEqual(table["driver"][0].as_py(), "Bob")
+
+        temps = pq.read_table(os.path.join(self.output_dir, "freq_hz=10", "session0.parquet"))
+        np.testing.assert_allclose(temps["Tyre Temp"].to_numpy(), np.linspace(80, 90, 10), atol=0.051)
+        self.assertEqual(temps["venue"][0].as_py(), "Spa")
+
+        # Unchanged files are skipped on the next run
+        self.assertEqual(convert_directory(self.input_dir, self.output_dir), {})
+
+    def test_long_layout(self):
+        convert_directory(self.input_dir, self.output_dir, layout="long", max_workers=1)
+
+        table = pq.read_table(os.path.join(self.output_dir, "long", "session0.parquet"))
+        self.assertEqual(table.num_rows, 110)
+        self.assertEqual(set(table["channel"].to_pylist()), {"Speed", "Tyre Temp"})
+
+
+if __name__ == "__main__":
+    unittest.main()
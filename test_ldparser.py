@@ -0,0 +1,261 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from fixtures import make_ld_data
+from ldparser.ldparser import ldChan, ldData, ldHead, ldStream
+
+
+class LdWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "test.ld")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_identity_encoding_is_zero_copy(self):
+        data = np.arange(10, dtype=np.float32)
+        chan = make_ld_data([("Speed", np.float32, 10, 0, data)]).channs[0]
+        self.assertIs(chan.encode(data), data)
+
+    def test_streams_chunks_and_scaled_channels(self):
+        speed = np.linspace(0, 300, 1000, dtype=np.float32)
+        temps = np.round(np.linspace(20, 110, 500), 1)
+        gear = np.arange(1000) % 7
+
+        ld_data = make_ld_data([
+            ("Speed", np.float32, 100, 0, speed),
+            ("Tyre Temp", np.int16, 50, 1, temps),
+            ("Gear", np.int32, 100, 0, None),
+        ])
+        ld_data.channs[2].data_len = len(gear)
+        ld_data.channs[2]._data = (gear[i:i + 64] for i in range(0, len(gear), 64))
+
+        ld_data.write(self.filename)
+        self.assertEqual(os.path.getsize(self.filename), ld_data.channs[-1].data_ptr + 4 * len(gear))
+
+        with ldData.fromfile(self.filename) as read:
+            np.testing.assert_array_equal(read["Speed"].data, speed)
+            np.testing.assert_allclose(read["Tyre Temp"].data, temps, atol=1e-6)
+            np.testing.assert_array_equal(read["Gear"].data, gear)
+
+    def test_mapped_write_matches_streamed_write(self):
+        channels = [("Speed", np.float32, 100, 0, np.linspace(0, 300, 1000, dtype=np.float32)),
+                    ("Tyre Temp", np.int16, 50, 1, np.round(np.linspace(20, 110, 500), 1)),
+                    ("Empty", np.float32, 10, 0, np.zeros(0, np.float32))]
+
+        make_ld_data(channels).write(self.filename)
+        mapped = os.path.join(self.tmp.name, "mapped.ld")
+        make_ld_data(channels).write_mapped(mapped, max_workers=2)
+
+        with open(self.filename, "rb") as a, open(mapped, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_rewrite_of_read_file(self):
+        speed = np.linspace(0, 300, 1000, dtype=np.float32)
+        temps = np.round(np.linspace(20, 110, 500), 1)
+        gear = (np.arange(1000) % 7).astype(np.int16)
+        make_ld_data([("Speed", np.float32, 100, 0, speed),
+                      ("Tyre Temp", np.int16, 50, 1, temps),
+                      ("Gear", np.int16, 100, 0, gear)]).write(self.filename)
+
+        copy = os.path.join(self.tmp.name, "copy.ld")
+        reordered = os.path.join(self.tmp.name, "reordered.ld")
+        with ldData.fromfile(self.filename) as read:
+            read.write(copy)
+        with ldData.fromfile(self.filename) as read:
+            # the channels are laid out anew before their data is read from the file
+            read.channs = [read["Gear"], read["Speed"]]
+            read.write(reordered)
+            np.testing.assert_array_equal(read["Gear"].data, gear)
+
+        with open(self.filename, "rb") as a, open(copy, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+        with ldData.fromfile(reordered) as read:
+            self.assertEqual(list(read), ["Gear", "Speed"])
+            np.testing.assert_array_equal(read["Gear"].data, gear)
+            np.testing.assert_array_equal(read["Speed"].data, speed)
+
+    def test_short_chunk_source_raises(self):
+        ld_data = make_ld_data([("Speed", np.float32, 10, 0, iter([np.zeros(5, np.float32)]))])
+        ld_data.channs[0].data_len = 10
+        with self.assertRaises(ValueError):
+            ld_data.write(self.filename)
+
+
+class LdReaderTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "test.ld")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_channels_are_views_of_one_map(self):
+        channels = [("Channel %d" % i, np.float32, 10, 0, np.full(20, i, dtype=np.float32))
+                    for i in range(1000)]
+        channels.append(("Gear", np.int16, 10, 0, np.arange(20, dtype=np.int16)))
+        make_ld_data(channels).write(self.filename)
+
+        read = ldData.fromfile(self.filename)
+        self.assertEqual(len(read.channs), 1001)
+        self.assertEqual(read.head.driver, "driver")
+        self.assertEqual(read.head.aux, None)
+
+        speed = read["Channel 500"].data
+        self.assertEqual(speed.dtype, np.float32)
+        self.assertFalse(speed.flags.writeable)
+        self.assertIs(read["Channel 500"]._buf, read["Channel 0"]._buf)
+        np.testing.assert_array_equal(speed, np.full(20, 500, dtype=np.float32))
+
+        gear = read["Gear"].data
+        self.assertEqual(gear.dtype, np.int16)
+        np.testing.assert_array_equal(gear, np.arange(20))
+
+        # closing drops the views and the map, the data is read from the file again
+        buf = read["Gear"]._buf
+        del speed, gear
+        read.close()
+        self.assertTrue(buf.closed)
+        np.testing.assert_array_equal(read["Gear"].data, np.arange(20))
+
+    def test_scaled_channels_are_decoded(self):
+        temps = np.linspace(-10, 120, 100)
+        make_ld_data([("Temp", np.int16, 10, 2, temps)]).write(self.filename)
+
+        with ldData.fromfile(self.filename) as read:
+            data = read["Temp"].data
+            self.assertEqual(data.dtype, np.float32)
+            np.testing.assert_allclose(data, temps, atol=0.0051)
+
+
+class LdWindowTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "test.ld")
+
+        beacon = np.zeros(100, dtype=np.int16)
+        beacon[[0, 30, 75]] = 1
+        self.speed = np.arange(200, dtype=np.float32)
+        self.temps = np.round(np.linspace(20, 40, 50), 1)
+        split = np.zeros(100, dtype=np.int16)
+        split[50] = 1
+        make_ld_data([("Beacon", np.int16, 10, 0, beacon),
+                      ("Split Beacon", np.int16, 10, 0, split),
+                      ("Speed", np.float32, 20, 0, self.speed),
+                      ("Temp", np.int16, 5, 1, self.temps)]).write(self.filename)
+        self.ld_data = ldData.fromfile(self.filename)
+
+    def tearDown(self):
+        self.ld_data.close()
+        self.tmp.cleanup()
+
+    def test_sample_and_time_ranges(self):
+        speed = self.ld_data["Speed"]
+        np.testing.assert_array_equal(speed.read(10, 15), self.speed[10:15])
+        np.testing.assert_array_equal(speed.read(190), self.speed[190:])
+        np.testing.assert_array_equal(speed.read_time(1.0, 1.5), self.speed[20:30])
+        np.testing.assert_array_equal(speed.read_time(9.5, 20.0), self.speed[190:])
+        np.testing.assert_allclose(self.ld_data["Temp"].read_time(2.0, 4.0), self.temps[10:20],
+                                   atol=1e-4)
+        self.assertIsNone(speed._data)
+
+    def test_laps_from_beacon(self):
+        np.testing.assert_allclose(self.ld_data.laps(), [0.0, 3.0, 7.5, 10.0])
+        self.assertEqual(self.ld_data.lap_window(2), (3.0, 7.5))
+        np.testing.assert_array_equal(self.ld_data.read_lap("Speed", 2), self.speed[60:150])
+        with self.assertRaises(IndexError):
+            self.ld_data.lap_window(4)
+
+    def test_laps_of_another_beacon(self):
+        self.ld_data.laps()
+        np.testing.assert_allclose(self.ld_data.laps("Split Beacon"), [0.0, 5.0, 10.0])
+        self.assertEqual(self.ld_data.lap_window(2, "Split Beacon"), (5.0, 10.0))
+        np.testing.assert_allclose(self.ld_data.laps(), [0.0, 3.0, 7.5, 10.0])
+
+
+class LdFromFrameTests(unittest.TestCase):
+    def test_dataframe_with_spec(self):
+        import pandas as pd
+
+        df = pd.DataFrame({"Speed": np.linspace(0, 250, 100, dtype=np.float32),
+                           "Tyre Temp": np.linspace(80, 95, 100),
+                           "Gear": np.arange(100, dtype=np.int16) % 7,
+                           "Label": ["x"] * 100})
+        spec = {"Speed": {"freq": 100, "units": "km/h"},
+                "Tyre Temp": {"freq": 100, "units": "degC", "decimals": 1, "short_name": "TT"},
+                "Gear": {"freq": 100}}
+        ld_data = ldData.from_frame(df, spec, driver="Driver", venue="Le Mans", session="Race")
+
+        self.assertEqual(list(ld_data), ["Speed", "Tyre Temp", "Gear"])
+        self.assertEqual(ld_data.head.driver, "Driver")
+        self.assertEqual(ld_data.head.aux.venue.name, "Le Mans")
+
+        speed, temp, gear = ld_data.channs
+        self.assertTrue(np.shares_memory(speed._data, df["Speed"].to_numpy()))
+        self.assertEqual((speed.dtype, speed.freq, speed.unit), (np.float32, 100, "km/h"))
+        self.assertEqual((temp.dtype, temp.dec, temp.short_name), (np.int16, 1, "TT"))
+        self.assertEqual(gear.dtype, np.int16)
+        self.assertEqual(speed.next_meta_ptr, temp.meta_ptr)
+        self.assertEqual(gear.next_meta_ptr, 0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "test.ld")
+            ld_data.write(filename)
+            with ldData.fromfile(filename) as read:
+                np.testing.assert_allclose(read["Tyre Temp"].data, df["Tyre Temp"], atol=0.051)
+                np.testing.assert_array_equal(read["Gear"].data, df["Gear"])
+
+    def test_dict_of_arrays_with_different_rates(self):
+        ld_data = ldData.from_frame({"Fast": np.zeros(100), "Slow": np.zeros(10, np.int32)},
+                                    {"Fast": {"freq": 100}}, freq=10)
+
+        fast, slow = ld_data.channs
+        self.assertEqual((fast.dtype, fast.freq, fast.data_len), (np.float32, 100, 100))
+        self.assertEqual((slow.dtype, slow.freq, slow.data_len), (np.int32, 10, 10))
+        self.assertEqual(slow.data_ptr, fast.data_ptr + 400)
+
+
+class LdStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "stream.ld")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def stream(self, reserve, channels):
+        stream = ldStream(self.filename, ldHead.create(event="stream"), reserve)
+        for name, data in channels:
+            stream.add(ldChan.from_array(name, data, {"decimals": 1}, 10))
+        return stream
+
+    def test_channels_written_as_they_come(self):
+        speed, gear = np.linspace(0, 250, 1000), np.arange(1000) % 6
+        stream = self.stream(4, [("Speed", speed), ("Gear", gear)])
+        self.assertIsNone(stream.channs[0]._data)
+        stream.close(order=["Gear", "Speed"])
+
+        with ldData.fromfile(self.filename) as read:
+            self.assertEqual(list(read), ["Gear", "Speed"])
+            self.assertEqual(read.head.aux.name, "stream")
+            # meta data in the reserved room before the data
+            self.assertLess(read["Speed"].meta_ptr, read["Speed"].data_ptr)
+            np.testing.assert_allclose(read["Speed"].data, speed, atol=0.051)
+            np.testing.assert_array_equal(read["Gear"].data, gear)
+
+    def test_more_channels_than_reserved_and_replaced(self):
+        stream = self.stream(1, [("A", np.ones(10)), ("B", np.zeros(10)), ("A", np.full(10, 2.0))])
+        stream.close()
+
+        with ldData.fromfile(self.filename) as read:
+            self.assertEqual(list(read), ["B", "A"])
+            self.assertGreater(read["B"].meta_ptr, read["A"].data_ptr)
+            np.testing.assert_array_equal(read["A"].data, np.full(10, 2.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ldparser.ldparser import ldData
+from ldparser.ldsplice import lap_windows, merge, split
+
+
+def write_stint(filename, offset, driver):
+    beacon = np.zeros(100, dtype=np.int16)
+    beacon[[0, 40]] = 1
+    ldData.from_frame({"Beacon": beacon,
+                       "Speed": np.arange(200, dtype=np.float32) + offset,
+                       "Tyre Temp": np.linspace(80, 90, 50) + offset},
+                      {"Speed": {"freq": 20}, "Tyre Temp": {"freq": 5, "decimals": 1}},
+                      freq=10, driver=driver).write(filename)
+
+
+class LdSpliceTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stints = [os.path.join(self.tmp.name, "stint%d.ld" % n) for n in range(3)]
+        for n, filename in enumerate(self.stints):
+            write_stint(filename, 1000 * n, "Driver %d" % n)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_merge_concatenates_raw_blocks(self):
+        out = os.path.join(self.tmp.name, "race.ld")
+        merge(self.stints, out)
+
+        with ldData.fromfile(out) as race:
+            self.assertEqual(race.head.driver, "Driver 0")
+            np.testing.assert_array_equal(
+                race["Speed"].data, np.concatenate([np.arange(200) + 1000 * n for n in range(3)]))
+            self.assertEqual(race["Tyre Temp"].dtype, np.int16)
+            self.assertEqual(race["Tyre Temp"].data_len, 150)
+            np.testing.assert_allclose(race.laps(), [0, 4, 10, 14, 20, 24, 30])
+
+    def test_merge_into_an_input_is_refused(self):
+        with open(self.stints[0], "rb") as f:
+            before = f.read()
+
+        with self.assertRaises(ValueError):
+            merge(self.stints, self.stints[0])
+
+        with open(self.stints[0], "rb") as f:
+            self.assertEqual(f.read(), before)
+
+    def test_merged_channels_read_the_output(self):
+        race = merge(self.stints, os.path.join(self.tmp.name, "race.ld"))
+        np.testing.assert_array_equal(race["Speed"].data[-200:], np.arange(200) + 2000)
+
+    def test_split_by_laps(self):
+        with ldData.fromfile(self.stints[1]) as ld_data:
+            windows = lap_windows(ld_data, [(1, 1), (2, 2)])
+            self.assertEqual(windows, [(0.0, 4.0), (4.0, 10.0)])
+
+            parts = split(self.stints[1], windows, os.path.join(self.tmp.name, "lap%d.ld"))
+            self.assertEqual(len(parts), 2)
+
+            with ldData.fromfile(os.path.join(self.tmp.name, "lap2.ld")) as lap2:
+                np.testing.assert_array_equal(lap2["Speed"].data, np.arange(80, 200) + 1000)
+                np.testing.assert_array_equal(lap2["Tyre Temp"].data, ld_data["Tyre Temp"].data[20:])
+                self.assertEqual(lap2["Beacon"].data[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import unittest
+
+import numpy as np
+
+import math_channels
+from math_channels import MathProgram, parse
+
+
+class MathChannelsTests(unittest.TestCase):
+    def test_parse_expands_corners_and_units(self):
+        channels = parse("Tyre Spread {W} [degC, 1] = 'Tyres Temp I {W}' - 'Tyres Temp O {W}'\n"
+                         "# comment\n"
+                         "Combined G = sqrt('G Lat'^2 + 'G Long'^2)  # trailing comment\n")
+
+        self.assertEqual([c.name for c in channels],
+                         ["Tyre Spread FL", "Tyre Spread FR", "Tyre Spread RL", "Tyre Spread RR", "Combined G"])
+        self.assertEqual(channels[2].inputs, ["Tyres Temp I RL", "Tyres Temp O RL"])
+        self.assertEqual((channels[0].unit, channels[0].decimals), ("degC", 1))
+        self.assertEqual((channels[4].unit, channels[4].decimals), ("", math_channels.DEFAULT_DECIMALS))
+
+    def test_parse_errors(self):
+        for text in ("no equals sign", "X = 'A' +", "X = open('A')", "X = Speed * 2", "X = 'A'.real",
+                     "X = ('A' > 1) & ('B' < 2)", "X = 'A' // 2", "X = ~'A'", "X = 'A' + _c3",
+                     "X = 'A' + _c0"):
+            with self.assertRaises(ValueError, msg=text):
+                parse(text)
+
+    def test_evaluate_in_dependency_order(self):
+        program = MathProgram(parse("Double Slip = 'Slip' * 2\n"
+                                    "Slip = 'Wheel Speed' - 'Speed'\n"
+                                    "Fast = 'Speed' > 100\n"
+                                    "Missing = 'Nope' + 1\n"))
+        speed = np.array([50.0, 150.0, 250.0])
+
+        values, skipped = program.evaluate({"Speed": speed, "Wheel Speed": speed + 5})
+
+        self.assertEqual(list(values), ["Slip", "Fast", "Double Slip"])
+        np.testing.assert_allclose(values["Double Slip"], [10.0, 10.0, 10.0])
+        np.testing.assert_array_equal(values["Fast"], [0.0, 1.0, 1.0])
+        self.assertEqual(skipped, {"Missing": ["Nope"]})
+
+    def test_channel_replacing_a_session_channel(self):
+        program = MathProgram(parse("Speed [km/h] = 'Speed' * 3.6\n"
+                                    "Double = 'Speed' * 2\n"))
+
+        values, _ = program.evaluate({"Speed": np.array([10.0, 20.0])})
+
+        np.testing.assert_allclose(values["Speed"], [36.0, 72.0])
+        np.testing.assert_allclose(values["Double"], [72.0, 144.0])
+
+    def test_cycle_is_an_error(self):
+        with self.assertRaises(ValueError):
+            MathProgram(parse("A = 'B' + 1\nB = 'A' + 1\n"))
+
+    def test_shared_subexpressions_computed_once(self):
+        program = MathProgram(parse("Front = ('FL' + 'FR') / 2\n"
+                                    "Balance = ('FL' + 'FR') / ('FL' + 'FR' + 'RL' + 'RR')\n"))
+        calls = []
+        add = math_channels.OPERATORS[math_channels.ast.Add]
+        math_channels.OPERATORS[math_channels.ast.Add] = lambda a, b: calls.append(1) or add(a, b)
+        try:
+            values, _ = program.evaluate({k: np.ones(4) for k in ("FL", "FR", "RL", "RR")})
+        finally:
+            math_channels.OPERATORS[math_channels.ast.Add] = add
+
+        # FL + FR once, then + RL and + RR
+        self.assertEqual(len(calls), 3)
+        np.testing.assert_allclose(values["Balance"], 0.5)
+
+    def test_example_file_parses(self):
+        path = os.path.join(os.path.dirname(__file__), "math_channels.example.txt")
+        self.assertGreater(len(MathProgram.from_file(path).order), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from data_log import DataLog, Message
+from ldparser.ldparser import ldData
+from motec_log import MotecLog
+
+
+def make_log(num_channels=5, num_samples=20):
+    log = DataLog()
+    for i in range(num_channels):
+        name = "Channel %d" % i
+        log.add_channel(name, "u%d" % i, float, 0)
+        log.channels[name].messages = [Message(t * 0.1, t * (i + 1)) for t in range(num_samples)]
+    return log
+
+
+class MotecLogLayoutTests(unittest.TestCase):
+    def test_plan_links_channels_in_one_pass(self):
+        motec_log = MotecLog()
+        motec_log.initialize()
+        motec_log.add_all_channels(make_log(), max_workers=1)
+
+        size = motec_log.plan()
+        channels = motec_log.ld_channels
+        header_size = MotecLog.CHANNEL_HEADER_SIZE
+
+        self.assertEqual(channels[0].meta_ptr, MotecLog.HEADER_PTR)
+        self.assertEqual(channels[0].prev_meta_ptr, 0)
+        self.assertEqual(channels[-1].next_meta_ptr, 0)
+        self.assertEqual(motec_log.ld_header.data_ptr, MotecLog.HEADER_PTR + 5 * header_size)
+        for prev, chan in zip(channels[:-1], channels[1:]):
+            self.assertEqual(prev.next_meta_ptr, chan.meta_ptr)
+            self.assertEqual(chan.prev_meta_ptr, prev.meta_ptr)
+            self.assertEqual(chan.data_ptr, prev.data_ptr + prev.data_len * np.dtype(prev.dtype).itemsize)
+        self.assertEqual(size, channels[-1].data_ptr + 20 * np.dtype(channels[-1].dtype).itemsize)
+
+    def test_written_file_reads_back(self):
+        motec_log = MotecLog()
+        motec_log.driver = "Driver"
+        motec_log.initialize()
+        motec_log.add_all_channels(make_log(), max_workers=1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "test.ld")
+            size = motec_log.plan()
+            motec_log.write(filename)
+            self.assertEqual(os.path.getsize(filename), size)
+
+            with ldData.fromfile(filename) as ld_data:
+                self.assertEqual(ld_data.head.driver, "Driver")
+                self.assertEqual(list(ld_data), ["Channel %d" % i for i in range(5)])
+                self.assertEqual(ld_data["Channel 2"].unit, "u2")
+                self.assertEqual(list(ld_data["Channel 2"].data), [t * 3.0 for t in range(20)])
+
+    def test_parallel_write_matches_sequential(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            contents = []
+            for max_workers in (1, 2):
+                motec_log = MotecLog()
+                motec_log.initialize()
+                motec_log.add_all_channels(make_log(num_channels=8, num_samples=300),
+                                           max_workers=max_workers)
+
+                filename = os.path.join(tmp, "test_%d.ld" % max_workers)
+                motec_log.write(filename)
+                with open(filename, "rb") as f:
+                    contents.append(f.read())
+
+        self.assertEqual(contents[0], contents[1])
+
+
+class MotecLogQuantiseTests(unittest.TestCase):
+    def make_log(self):
+        log = DataLog()
+        samples = {
+            "Tyre Temp": ("degC", 1, [20.0 + 0.1 * i for i in range(1000)]),
+            "Tyre Pressure": ("bar", 3, [1.6 + 0.001 * (i % 300) for i in range(1000)]),
+            "Engine RPM": ("rpm", 0, [800.0 + 12 * i for i in range(1000)]),
+            "Odometer": ("m", 2, [1e6 + 10.0 * i for i in range(1000)]),
+        }
+        for name, (units, decimals, values) in samples.items():
+            log.add_channel(name, units, float, decimals)
+            log.channels[name].messages = [Message(i * 0.01, v) for i, v in enumerate(values)]
+        return log, samples
+
+    def test_channels_pick_smallest_encoding(self):
+        log, _ = self.make_log()
+        motec_log = MotecLog()
+        motec_log.initialize()
+        motec_log.add_all_channels(log, max_workers=1)
+
+        encodings = {c.name: (np.dtype(c.dtype), c.dec) for c in motec_log.ld_channels}
+        self.assertEqual(encodings["Tyre Temp"], (np.dtype(np.int16), 1))
+        self.assertEqual(encodings["Tyre Pressure"], (np.dtype(np.int16), 3))
+        self.assertEqual(encodings["Engine RPM"], (np.dtype(np.int16), 0))
+        self.assertEqual(encodings["Odometer"], (np.dtype(np.int32), 2))
+
+    def test_quantised_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sizes = {}
+            for quantise in (False, True):
+                for max_workers in (1, 2):
+                    log, samples = self.make_log()
+                    motec_log = MotecLog()
+                    motec_log.quantise = quantise
+                    motec_log.initialize()
+                    motec_log.add_all_channels(log, max_workers=max_workers)
+
+                    filename = os.path.join(tmp, "test_%s_%d.ld" % (quantise, max_workers))
+                    motec_log.write(filename)
+                    sizes[quantise] = os.path.getsize(filename)
+
+                    with ldData.fromfile(filename) as ld_data:
+                        for name, (_, decimals, values) in samples.items():
+                            tolerance = 0.5 * 10 ** -decimals if quantise else 1e-7 * max(values)
+                            np.testing.assert_allclose(ld_data[name].data, values, rtol=0,
+                                                       atol=tolerance * 1.001, err_msg=name)
+
+        self.assertLess(sizes[True], sizes[False])
+
+    def test_unknown_decimals_stay_float(self):
+        log = DataLog()
+        latitude = 45.9 + np.linspace(0, 0.01, 1000)
+        log.add_channel("GPS Latitude", "deg", float, None)
+        log.channels["GPS Latitude"].messages = [Message(i * 0.01, v) for i, v in enumerate(latitude)]
+        motec_log = MotecLog()
+        motec_log.initialize()
+        motec_log.add_all_channels(log, max_workers=1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "test.ld")
+            motec_log.write(filename)
+            with ldData.fromfile(filename) as ld_data:
+                self.assertEqual(ld_data["GPS Latitude"].dtype, np.float32)
+                np.testing.assert_allclose(ld_data["GPS Latitude"].data, latitude, rtol=1e-7)
+
+
+if __name__ == "__main__":
+    unittest.main()
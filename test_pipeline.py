@@ -0,0 +1,78 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import duckdb
+import numpy as np
+
+import duckdb_to_motec_unified as unified
+from fixtures import make_session
+from ldparser.ldparser import ldData
+
+GROUPS = {"Driver": 100, "Dynamics": 100, "Environment": 10}
+
+
+class PipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "session.duckdb")
+        make_session(self.db)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def convert(self, name, **options):
+        csv = os.path.join(self.tmp.name, name + ".csv")
+        ld = os.path.join(self.tmp.name, name + ".ld")
+        with redirect_stdout(io.StringIO()):
+            unified.convert(self.db, csv, GROUPS, out_ld=ld, **options)
+        return csv, ld
+
+    def test_same_output_as_sequential(self):
+        csv_a, ld_a = self.convert("sequential", align=True)
+        csv_b, ld_b = self.convert("pipeline", align=True, pipeline=True)
+
+        with open(csv_a) as a, open(csv_b) as b:
+            self.assertEqual(a.read(), b.read())
+        with ldData.fromfile(ld_a) as a, ldData.fromfile(ld_b) as b:
+            self.assertEqual(list(a), list(b))
+            for x, y in zip(a.channs, b.channs):
+                self.assertEqual((x.dtype, x.dec, x.unit, x.freq), (y.dtype, y.dec, y.unit, y.freq))
+                np.testing.assert_array_equal(x.data, y.data)
+
+    def test_reader_error_is_raised(self):
+        connections, open_session = [], duckdb.connect
+
+        def connect(*args, **kwargs):
+            connections.append(open_session(*args, **kwargs))
+            return connections[-1]
+
+        with mock.patch.object(unified, "resample_table", side_effect=RuntimeError("boom")), \
+                mock.patch.object(unified.duckdb, "connect", connect):
+            with self.assertRaises(RuntimeError):
+                self.convert("broken", pipeline=True)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "broken.ld.part")))
+        # the session is closed
+        with self.assertRaises(duckdb.Error):
+            connections[0].execute("SELECT 1")
+
+    def test_failed_conversion_keeps_previous_ld(self):
+        _, ld = self.convert("again", pipeline=True)
+        with open(ld, "rb") as f:
+            previous = f.read()
+
+        # fails after the extracted channels were streamed
+        with mock.patch.object(unified, "compute_lap_channels", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.convert("again", pipeline=True)
+
+        with open(ld, "rb") as f:
+            self.assertEqual(f.read(), previous)
+        self.assertFalse(os.path.exists(ld + ".part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import io
+import unittest
+
+from progress import Progress, format_event, json_lines, parse_json_line
+
+
+class ProgressTests(unittest.TestCase):
+    def test_percent_weights_stages(self):
+        events = []
+        steps = Progress([("extract", 3), ("write", 1)], events.append, interval=0)
+
+        steps.stage("extract", 4)
+        steps.advance(rows=10, nbytes=100)
+        steps.advance(rows=10, nbytes=100)
+        self.assertEqual(events[-1]["percent"], 37.5)
+        self.assertEqual((events[-1]["done"], events[-1]["total"]), (2, 4))
+        self.assertEqual((events[-1]["rows"], events[-1]["bytes"]), (20, 200))
+
+        steps.stage("write")
+        self.assertEqual(events[-1]["percent"], 75.0)
+        steps.finish()
+        self.assertEqual(events[-1]["stage"], "done")
+        self.assertEqual(events[-1]["percent"], 100.0)
+        self.assertEqual(events[-1]["eta"], 0.0)
+
+    def test_advance_is_throttled(self):
+        events = []
+        steps = Progress([("extract", 1)], events.append, interval=60)
+        steps.stage("extract", 1000)
+        for _ in range(1000):
+            steps.advance()
+        steps.finish()
+
+        # Only the stage start and the end are forced through
+        self.assertEqual(len(events), 2)
+
+    def test_json_lines_round_trip(self):
+        stream = io.StringIO()
+        steps = Progress([("extract", 1)], json_lines(stream))
+        steps.stage("extract", 2)
+
+        lines = stream.getvalue().splitlines()
+        event = parse_json_line(lines[0] + "\n")
+        self.assertEqual(event["stage"], "extract")
+        self.assertEqual(event["total"], 2)
+        self.assertIsNone(parse_json_line("Extracting data...\n"))
+        self.assertIn("extract 0/2", format_event(event))
+
+
+if __name__ == "__main__":
+    unittest.main()
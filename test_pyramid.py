@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ldparser import pyramid
+
+
+class PyramidTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = pyramid.sidecar_path(os.path.join(self.tmp.name, "session.ld"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_levels_match_blockwise_reduction(self):
+        values = np.random.RandomState(0).normal(size=12345)
+
+        levels = pyramid.build(values, (10, 100, 1000))
+
+        for factor, level in zip((10, 100, 1000), levels):
+            blocks = [values[i:i + factor] for i in range(0, len(values), factor)]
+            self.assertEqual(level.shape, (3, len(blocks)))
+            np.testing.assert_allclose(level[0], [b.min() for b in blocks], rtol=1e-6)
+            np.testing.assert_allclose(level[1], [b.max() for b in blocks], rtol=1e-6)
+            np.testing.assert_allclose(level[2], [b.mean() for b in blocks], rtol=1e-5, atol=1e-6)
+
+    def test_factors_must_nest(self):
+        with self.assertRaises(ValueError):
+            pyramid.build(np.zeros(100), (10, 25))
+
+    def test_write_and_map(self):
+        speed = np.linspace(0, 300, 50000)
+        gear = np.repeat(np.arange(1, 6), 10000).astype(np.int16)
+        pyramid.write(self.filename, [("Speed", 100, speed), ("Gear", 100, gear)])
+
+        with pyramid.Pyramid.for_ld(self.filename.replace(".pyr", ".ld")) as pyr:
+            self.assertEqual(pyr.channels["Speed"]["n"], 50000)
+            np.testing.assert_allclose(pyr.level("Gear", 1000)[1], np.repeat(np.arange(1, 6), 10))
+            self.assertAlmostEqual(float(pyr.level("Speed", 100)[2][0]),
+                                   float(speed[:100].mean()), places=3)
+
+            # 500 s at 100 Hz on 100 pixels: the coarsest level has enough blocks
+            times, values = pyr.window("Speed", 40)
+            self.assertEqual(len(values), 100)
+            self.assertAlmostEqual(times[2], 10.0)
+
+            # zoomed in too far for any level
+            self.assertIsNone(pyr.window("Speed", 100, 10.0, 12.0))
+        self.assertTrue(pyr.buf.closed)
+
+    def test_missing_sidecar(self):
+        self.assertIsNone(pyramid.Pyramid.for_ld(os.path.join(self.tmp.name, "none.ld")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import stints
+from duckdb_to_motec_unified import write_stints
+from ldparser.ldparser import ldData
+
+
+def session(hz=10, duration=600.0):
+    """On track, pit stop at 200-230 s, on track, garage from 400 s to the end."""
+    time = np.arange(0, duration, 1 / hz)
+    pits = ((time >= 200) & (time < 230)) | (time >= 400)
+    speed = np.where(pits, 0.0, 150.0)
+    lap = (time // 60).astype(np.int64) + 1
+    return pd.DataFrame({"Time": time, "Beacon": np.r_[1, np.diff(lap)].astype(np.int16),
+                         "LapTime": time % 60, "Speed": speed, "In Pits": pits.astype(np.float64),
+                         "Lap": lap})
+
+
+class StintTests(unittest.TestCase):
+    def test_runs(self):
+        starts, stops = stints.runs([False, True, True, False, True])
+        self.assertListEqual(starts.tolist(), [1, 4])
+        self.assertListEqual(stops.tolist(), [3, 5])
+
+    def test_only_long_stops_are_stationary(self):
+        time = np.arange(0, 300.0)
+        speed = np.full(300, 100.0)
+        speed[10:20] = 0.0     # 10 s stop
+        speed[100:200] = 0.0   # 100 s stop
+
+        stopped = stints.stationary(time, speed)
+
+        self.assertFalse(stopped[10:20].any())
+        self.assertTrue(stopped[100:200].all())
+        self.assertEqual(stopped.sum(), 100)
+
+    def test_split_at_pit_exit(self):
+        out = session()
+
+        bounds = stints.stint_bounds(out["Time"].to_numpy(), out)
+
+        # the second stint starts leaving the pits and keeps the garage at the end
+        self.assertListEqual(bounds, [(0, 2300), (2300, 6000)])
+
+    def test_garage_before_first_run_dropped_and_driver_swap(self):
+        time = np.arange(0, 100.0)
+        columns = {"In Pits": (time < 10).astype(float), "Driver Id": np.where(time < 50, 1, 2)}
+
+        bounds = stints.stint_bounds(time, columns, speed=np.full(100, 100.0))
+
+        self.assertListEqual(bounds, [(10, 50), (50, 100)])
+
+    def test_stationary_period_splits_without_pit_signal(self):
+        time = np.arange(0, 400.0)
+        speed = np.where((time >= 100) & (time < 200), 0.0, 100.0)
+
+        self.assertListEqual(stints.stint_bounds(time, {}, speed), [(0, 200), (200, 400)])
+
+
+class WriteStintsTests(unittest.TestCase):
+    def test_one_ld_per_stint(self):
+        out = session()
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = write_stints(out, os.path.join(tmp, "session.ld"), 10, threads=2, event="test")
+
+            self.assertListEqual([os.path.basename(p) for p in paths],
+                                 ["session_stint1.ld", "session_stint2.ld"])
+            with ldData.fromfile(paths[0]) as first, ldData.fromfile(paths[1]) as second:
+                self.assertEqual(len(second["Speed"].data), 3700)
+                self.assertEqual(second.head.aux.session, "Stint 2")
+                self.assertEqual(second.head.short_comment, "Stint 2/2, laps 4-10")
+                self.assertEqual(second["Lap"].data[0], 4)
+                self.assertEqual((second.head.datetime - first.head.datetime).total_seconds(), 230)
+                np.testing.assert_array_equal(np.flatnonzero(first["Beacon"].data), [0, 600, 1200, 1800])
+
+
+if __name__ == "__main__":
+    unittest.main()